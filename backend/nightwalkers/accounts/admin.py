@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.db.models import Count
-from .models import User, Follow, ReportIssue
+from .models import User, Follow, ReportIssue, KarmaEvent
 
 
 # Inline admin for displaying follows in user detail view
@@ -79,6 +79,8 @@ class CustomUserAdmin(UserAdmin):
         "avatar_preview",
         "provider",
         "provider_id",
+        # Sum of the karma ledger, see KarmaEventAdmin
+        "karma",
     )
     list_per_page = 25
     actions = ["verify_email", "activate_users", "deactivate_users"]
@@ -258,6 +260,32 @@ class ReportIssueAdmin(admin.ModelAdmin):
     short_description.short_description = "Description"
 
 
+class KarmaEventAdmin(admin.ModelAdmin):
+    list_display = ("user_link", "amount", "reason", "created_at")
+    list_filter = ("reason", "created_at")
+    search_fields = ("user__email", "user__first_name", "user__last_name")
+    date_hierarchy = "created_at"
+    list_select_related = ("user",)
+
+    def user_link(self, obj):
+        url = reverse("admin:accounts_user_change", args=[obj.user.id])
+        return format_html('<a href="{}">{}</a>', url, obj.user.get_full_name())
+
+    user_link.short_description = "User"
+
+    # The ledger is append only, events go away with their user
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # User.karma is the sum of the events, a deleted event would desync it
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(ReportIssue, ReportIssueAdmin)
+admin.site.register(KarmaEvent, KarmaEventAdmin)
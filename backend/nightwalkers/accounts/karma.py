@@ -0,0 +1,140 @@
+"""
+Karma ledger
+
+Every karma change is an append-only KarmaEvent row and User.karma is their
+running sum. award_karma() never reads or saves the User row: the events
+are inserted in bulk and the sums applied with a single
+UPDATE ... SET karma = karma + CASE id ... END, so concurrent awards cannot
+lose updates and the rest of the row (password, fcm_token...) is never
+rewritten.
+
+Outside karma_batch() each award is flushed right away, inside it the
+awards of the block are flushed together when it exits.
+"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import KarmaEvent, User
+
+# Karma of the forum actions
+POST_CREATED = 10
+REPOST_CREATED = 5
+COMMENT_RECEIVED = 2
+LIKE_RECEIVED = 1
+FOLLOWER_GAINED = 3
+POST_REPORTED = -10
+COMMENT_REPORTED = -5
+
+_local = threading.local()
+
+
+def award_karma(user, amount, reason):
+    """
+    Add amount (possibly negative) to a user's karma
+
+    Args:
+        user (User|int): The user or their id
+        reason (str): What the event is for, kept in the ledger
+    """
+    event = (getattr(user, "id", user), amount, reason)
+    batch = getattr(_local, "batch", None)
+    if batch is None:
+        flush_karma([event])
+    else:
+        batch.append(event)
+
+
+@contextmanager
+def karma_batch():
+    """Flush the awards made in the block together, nested blocks join"""
+    if getattr(_local, "batch", None) is not None:
+        yield
+        return
+    _local.batch = []
+    try:
+        yield
+        events = _local.batch
+    finally:
+        _local.batch = None
+    flush_karma(events)
+
+
+def flush_karma(events):
+    """
+    Write (user id, amount, reason) events to the ledger and User.karma
+
+    Returns:
+        dict: Karma added by user id
+    """
+    if not events:
+        return {}
+    totals = Counter()
+    for user_id, amount, _ in events:
+        totals[user_id] += amount
+
+    with transaction.atomic():
+        KarmaEvent.objects.bulk_create(
+            [
+                KarmaEvent(user_id=user_id, amount=amount, reason=reason)
+                for user_id, amount, reason in events
+            ]
+        )
+        changed = {user_id: total for user_id, total in totals.items() if total}
+        if changed:
+            User.objects.filter(pk__in=changed).update(
+                karma=F("karma")
+                + Case(
+                    *[
+                        When(pk=user_id, then=Value(total))
+                        for user_id, total in changed.items()
+                    ],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+    return dict(totals)
+
+
+def ledger_karma():
+    """Sum of the outer user's karma events, computed in SQL"""
+    return Coalesce(
+        Subquery(
+            KarmaEvent.objects.filter(user=OuterRef("pk"))
+            .order_by()
+            .values("user")
+            .annotate(total=Sum("amount"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def recompute_karma(dry_run=False):
+    """
+    Set User.karma back to the sum of the ledger where they differ
+
+    Returns:
+        int: Number of users whose karma had drifted
+    """
+    drifted = list(
+        User.objects.annotate(ledger=ledger_karma())
+        .exclude(karma=F("ledger"))
+        .values_list("pk", flat=True)
+    )
+    if drifted and not dry_run:
+        User.objects.filter(pk__in=drifted).update(karma=ledger_karma())
+    return len(drifted)
+
+
+def top_karma(limit=10):
+    """Users with the most karma, an index scan of accounts_user_karma_idx"""
+    return (
+        User.objects.filter(is_active=True)
+        .exclude(is_banned=True)
+        .order_by("-karma", "id")[:limit]
+    )
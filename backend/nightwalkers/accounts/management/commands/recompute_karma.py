@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from accounts.karma import recompute_karma
+
+
+class Command(BaseCommand):
+    help = "Recompute User.karma from the karma ledger and fix the users that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the users whose karma drifted",
+        )
+
+    def handle(self, *args, **options):
+        drifted = recompute_karma(dry_run=options["dry_run"])
+        verb = "drifted" if options["dry_run"] else "fixed"
+        self.stdout.write(f"{drifted} user(s) {verb}")
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    """Karma earned before the ledger becomes one opening event per user"""
+    User = apps.get_model("accounts", "User")
+    KarmaEvent = apps.get_model("accounts", "KarmaEvent")
+    users = User.objects.exclude(karma=0).values_list("id", "karma")
+    KarmaEvent.objects.bulk_create(
+        [
+            KarmaEvent(user_id=user_id, amount=karma, reason="opening_balance")
+            for user_id, karma in users.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0010_user_fcm_token"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KarmaEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.IntegerField()),
+                ("reason", models.CharField(max_length=50)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["-karma", "id"], name="accounts_user_karma_idx"),
+        ),
+        migrations.AddField(
+            model_name="karmaevent",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="karma_events",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="karmaevent",
+            index=models.Index(
+                fields=["user", "created_at"], name="accounts_ka_user_id_dc553a_idx"
+            ),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
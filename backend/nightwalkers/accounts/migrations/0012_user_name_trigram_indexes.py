@@ -0,0 +1,39 @@
+from django.db import migrations
+
+TRIGRAM_COLUMNS = ("first_name", "last_name", "email")
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    GIN trigram indexes for the name searches (forum/search.py)
+
+    They serve icontains lookups, so searching works the same without them.
+    Skipped where the pg_trgm extension is not available.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS accounts_user_{column}_trgm "
+                f"ON accounts_user USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(f"DROP INDEX IF EXISTS accounts_user_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0011_karma_ledger"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+TRIGRAM_COLUMNS = ("first_name", "last_name", "email")
+
+
+def trigram_available(cursor):
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    return cursor.fetchone() is not None
+
+
+def index_upper_expressions(apps, schema_editor):
+    """
+    Index UPPER(column::text), the expression icontains compiles to on
+    PostgreSQL: the planner never used the indexes of the raw columns
+    """
+    with schema_editor.connection.cursor() as cursor:
+        if not trigram_available(cursor):
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(f"DROP INDEX IF EXISTS accounts_user_{column}_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS accounts_user_{column}_upper_trgm "
+                f"ON accounts_user USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+            )
+
+
+def index_raw_columns(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(f"DROP INDEX IF EXISTS accounts_user_{column}_upper_trgm")
+        if not trigram_available(cursor):
+            return
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS accounts_user_{column}_trgm "
+                f"ON accounts_user USING gin ({column} gin_trgm_ops)"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0012_user_name_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(index_upper_expressions, index_raw_columns),
+    ]
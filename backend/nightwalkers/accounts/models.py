@@ -46,6 +46,7 @@ class User(AbstractUser):
     provider_id = models.CharField(max_length=100, blank=True)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
     avatar_url = models.URLField(blank=True, null=True, max_length=1024)
+    # Sum of the user's karma events, only changed through accounts/karma.py
     karma = models.IntegerField(default=0)
     is_banned = models.BooleanField(
         default=False, verbose_name="Is the user banned", null=True, blank=True
@@ -67,6 +68,12 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Karma leaderboard (accounts/karma.py)
+            models.Index(fields=["-karma", "id"], name="accounts_user_karma_idx"),
+        ]
+
     def __str__(self):
         return f"{self.get_full_name()} ({self.email}) {self.get_karma()}"
 
@@ -179,3 +186,21 @@ class ReportIssue(models.Model):
             return f"{self.title} by {self.user.first_name}"
         else:
             return f"{self.title} by Unknown User"
+
+
+class KarmaEvent(models.Model):
+    """One karma change, append only, User.karma is the sum of these"""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="karma_events"
+    )
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "created_at"])]
+
+    def __str__(self):
+        return f"{self.amount:+d} karma to {self.user} ({self.reason})"
@@ -5,9 +5,13 @@ from django.contrib.auth import get_user_model
 from rest_framework import status
 from unittest.mock import patch, MagicMock
 from .serializers import UserSerializer
-from .models import ReportIssue
+from .models import ReportIssue, KarmaEvent
+from .karma import award_karma, karma_batch, recompute_karma, top_karma
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from PIL import Image
-from io import BytesIO
+from io import BytesIO, StringIO
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 User = get_user_model()
@@ -999,3 +1003,105 @@ class UploadProfilePicViewTest(APITestCase):
         self.user.refresh_from_db()
         self.assertIsNone(self.user.avatar_url)
         self.assertIsNotNone(self.user.avatar.name)
+
+
+class KarmaLedgerTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            password="testpass123",
+            first_name="Test",
+            last_name="User",
+        )
+        self.other_user = User.objects.create_user(
+            email="other@example.com",
+            password="testpass123",
+            first_name="Other",
+            last_name="User",
+        )
+
+    def test_award_karma_appends_events(self):
+        award_karma(self.user, 10, "post_created")
+        award_karma(self.user.id, -1, "like_removed")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.karma, 9)
+        self.assertEqual(
+            sorted(self.user.karma_events.values_list("amount", "reason")),
+            [(-1, "like_removed"), (10, "post_created")],
+        )
+
+    def test_award_karma_only_writes_karma(self):
+        with CaptureQueriesContext(connection) as queries:
+            award_karma(self.user, 3, "follower_gained")
+        updates = [q["sql"] for q in queries.captured_queries if "UPDATE" in q["sql"]]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("password", updates[0])
+        self.assertNotIn("fcm_token", updates[0])
+
+    def test_karma_batch_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            with karma_batch():
+                award_karma(self.user, -10, "post_reported")
+                award_karma(self.other_user, -10, "post_reported")
+                award_karma(self.user, 2, "comment_received")
+        updates = [q for q in queries.captured_queries if "UPDATE" in q["sql"]]
+        self.assertEqual(len(updates), 1)
+
+        self.user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.user.karma, -8)
+        self.assertEqual(self.other_user.karma, -10)
+        self.assertEqual(KarmaEvent.objects.count(), 3)
+
+    def test_recompute_karma(self):
+        award_karma(self.user, 10, "post_created")
+        User.objects.filter(id=self.user.id).update(karma=99)
+
+        self.assertEqual(recompute_karma(dry_run=True), 1)
+        out = StringIO()
+        call_command("recompute_karma", stdout=out)
+        self.assertIn("1 user(s) fixed", out.getvalue())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.karma, 10)
+        self.assertEqual(recompute_karma(), 0)
+
+    def test_leaderboard(self):
+        award_karma(self.user, 5, "repost_created")
+        award_karma(self.other_user, 10, "post_created")
+        banned = User.objects.create_user(
+            email="banned@example.com",
+            password="testpass123",
+            first_name="Banned",
+            last_name="User",
+            is_banned=True,
+        )
+        award_karma(banned, 50, "post_created")
+
+        self.assertEqual(list(top_karma(2)), [self.other_user, self.user])
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("karma-leaderboard"), {"limit": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["id"], self.other_user.id)
+        self.assertEqual(response.data[0]["karma"], 10)
+        for limit in ("x", 0, -1, 101):
+            response = self.client.get(reverse("karma-leaderboard"), {"limit": limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_ledger_is_append_only(self):
+        award_karma(self.user, 10, "post_created")
+        admin_user = User.objects.create_superuser(
+            email="admin@example.com",
+            password="testpass123",
+            first_name="Admin",
+            last_name="User",
+        )
+        self.client.force_login(admin_user)
+        event = KarmaEvent.objects.get()
+        response = self.client.post(
+            reverse("admin:accounts_karmaevent_delete", args=[event.id]),
+            {"post": "yes"},
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(KarmaEvent.objects.filter(id=event.id).exists())
@@ -12,6 +12,7 @@ from .views import (
     ChangeFCMTokenView,
     UploadProfilePic,
     BanUserView,
+    KarmaLeaderboardView,
 )
 from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
@@ -36,4 +37,9 @@ urlpatterns = [
         name="upload_profile_pic",
     ),  # For image uploads
     path("users/<int:user_id>/ban/", BanUserView.as_view(), name="ban-user"),
+    path(
+        "users/leaderboard/",
+        KarmaLeaderboardView.as_view(),
+        name="karma-leaderboard",
+    ),
 ]
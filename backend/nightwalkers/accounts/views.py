@@ -10,6 +10,7 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.exceptions import ValidationError
 from .models import ReportIssue
+from .karma import top_karma
 from .serializers import UserSerializer, UserReportSerializer
 from django.contrib.auth import authenticate
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -91,7 +92,17 @@ class GoogleAuthView(APIView):
                 if "picture" in idinfo:
                     user.avatar_url = idinfo["picture"]
 
-                user.save()
+                # Never write karma, it only changes through accounts/karma.py
+                user.save(
+                    update_fields=[
+                        "provider",
+                        "provider_id",
+                        "email_verified",
+                        "first_name",
+                        "last_name",
+                        "avatar_url",
+                    ]
+                )
 
             # BAN CHECK
             if user.is_banned:
@@ -304,7 +315,7 @@ class ChangePasswordView(APIView):
 
         # Set new password
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=["password"])
 
         # Use standardized response format
         return Response(
@@ -339,7 +350,7 @@ class ChangeUserNamesView(APIView):
         # Update names
         user.first_name = first_name
         user.last_name = last_name
-        user.save()
+        user.save(update_fields=["first_name", "last_name"])
 
         return Response(
             {
@@ -369,7 +380,7 @@ class ChangeFCMTokenView(APIView):
 
             # Update FCM token
             user.fcm_token = fcm_token
-            user.save()
+            user.save(update_fields=["fcm_token"])
 
             return Response(
                 {"success": "FCM token updated successfully"},
@@ -417,13 +428,13 @@ class UploadProfilePic(APIView):
 
             user.avatar = image_file  # save image to local file/image field
             user.avatar_url = None  # clear cloud URL if switching to local
-            user.save()
+            user.save(update_fields=["avatar", "avatar_url"])
 
         # Handle external URL upload (e.g. Cloudinary)
         elif avatar_url:
             user.avatar_url = avatar_url
             user.avatar = None  # clear local image if switching to cloud
-            user.save()
+            user.save(update_fields=["avatar", "avatar_url"])
 
         else:
             return Response(
@@ -464,10 +475,42 @@ class BanUserView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            user.save()
+            user.save(update_fields=["is_banned"])
             sm = f"User {'banned' if action == 'ban' else 'unbanned'} successfully"
             return Response({"success": sm}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response(
                 {"error": "User not found"}, status=status.HTTP_404_NOT_FOUND
             )
+
+
+class KarmaLeaderboardView(APIView):
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            return Response(
+                {"error": "limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= limit <= 100:
+            return Response(
+                {"error": "limit must be between 1 and 100"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        users = top_karma(limit).only(
+            "id", "first_name", "last_name", "avatar_url", "karma"
+        )
+        return Response(
+            [
+                {
+                    "id": user.id,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "avatar_url": user.get_avatar_url(),
+                    "karma": user.karma,
+                }
+                for user in users
+            ],
+            status=status.HTTP_200_OK,
+        )
@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse, path
-from django.db.models import Count, Max
+from django.db.models import Count, Exists, Max, OuterRef
 from django.template.response import TemplateResponse
 from django.http import JsonResponse
-from .models import Chat, Message
+from .models import Chat, Message, ReadWatermark
 
 
 class ChatAdmin(admin.ModelAdmin):
@@ -100,6 +100,7 @@ class ChatAdmin(admin.ModelAdmin):
             print(f"Found {messages.count()} messages")
 
             # Format messages for JSON response
+            read_up_to = ReadWatermark.objects.read_up_to(chat)
             messages_data = []
             for msg in messages:
                 messages_data.append(
@@ -109,7 +110,7 @@ class ChatAdmin(admin.ModelAdmin):
                         "sender_id": msg.sender.id,
                         "content": msg.content,
                         "timestamp": msg.timestamp.strftime("%b %d, %Y, %H:%M"),
-                        "read": msg.read,
+                        "read": msg.id <= read_up_to.get(msg.sender_id, 0),
                     }
                 )
 
@@ -241,6 +242,28 @@ class ChatAdmin(admin.ModelAdmin):
     )
 
 
+def is_read():
+    """Whether the outer message is up to the recipient's read watermark"""
+    return Exists(
+        ReadWatermark.objects.filter(
+            chat_id=OuterRef("chat_id"), last_read_id__gte=OuterRef("id")
+        ).exclude(user_id=OuterRef("sender_id"))
+    )
+
+
+class ReadFilter(admin.SimpleListFilter):
+    title = "read"
+    parameter_name = "read"
+
+    def lookups(self, request, model_admin):
+        return (("1", "Yes"), ("0", "No"))
+
+    def queryset(self, request, queryset):
+        if self.value() in ("0", "1"):
+            return queryset.filter(read=self.value() == "1")
+        return queryset
+
+
 class MessageAdmin(admin.ModelAdmin):
     list_display = (
         "id",
@@ -251,7 +274,7 @@ class MessageAdmin(admin.ModelAdmin):
         "timestamp",
         "read",
     )
-    list_filter = ("timestamp", "read", "sender")
+    list_filter = ("timestamp", ReadFilter, "sender")
     search_fields = (
         "content",
         "sender__email",
@@ -264,6 +287,7 @@ class MessageAdmin(admin.ModelAdmin):
         "chat_link",
         "user_names",
         "other_messages",
+        "read",
     )
     date_hierarchy = "timestamp"
     list_per_page = 50
@@ -274,7 +298,9 @@ class MessageAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.select_related("sender", "chat", "chat__user1", "chat__user2")
+        return queryset.select_related(
+            "sender", "chat", "chat__user1", "chat__user2"
+        ).annotate(read=is_read())
 
     def content_preview(self, obj):
         if len(obj.content) > 80:
@@ -283,6 +309,12 @@ class MessageAdmin(admin.ModelAdmin):
 
     content_preview.short_description = "Message"
 
+    def read(self, obj):
+        return obj.read
+
+    read.boolean = True
+    read.admin_order_field = "read"
+
     def sender_link(self, obj):
         url = reverse("admin:accounts_user_change", args=[obj.sender.id])
         return format_html('<a href="{}">{}</a>', url, obj.sender.get_full_name())
@@ -368,8 +400,23 @@ class MessageAdmin(admin.ModelAdmin):
     actions = ["mark_as_read"]
 
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(read=True)
-        self.message_user(request, f"{updated} messages have been marked as read.")
+        # Move each recipient's watermark up to the last selected message
+        last_selected = (
+            queryset.order_by()
+            .values("chat_id", "sender_id", "chat__user1_id", "chat__user2_id")
+            .annotate(last_id=Max("id"))
+        )
+        for row in last_selected:
+            if row["sender_id"] == row["chat__user1_id"]:
+                reader_id = row["chat__user2_id"]
+            else:
+                reader_id = row["chat__user1_id"]
+            ReadWatermark.objects.mark_read(row["chat_id"], reader_id, row["last_id"])
+        self.message_user(
+            request,
+            f"{queryset.count()} messages and the ones before them have been "
+            "marked as read.",
+        )
 
     mark_as_read.short_description = "Mark selected messages as read"
 
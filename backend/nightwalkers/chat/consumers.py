@@ -1,13 +1,23 @@
 # chat/consumers.py
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-import json
+from django.db.models import Q
+from .db import aclose_old_connections
+from .message_buffer import message_buffer
+from .models import Chat, ReadWatermark
+from .presence import HEARTBEAT_INTERVAL, presence
+from .protocol import ProtocolError, negotiate
+from .typing_state import typing_state
+import asyncio
 
 
-# Add at the top of consumers.py
-online_users = set()
-typing_users = {}
+def parse_id(value):
+    """The integer id of a frame field, None if it is not one"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -22,87 +32,135 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Convert user_id to integer and validate user exists
+        await aclose_old_connections()
         try:
-            self.user = await database_sync_to_async(User.objects.get)(id=self.user_id)
+            self.user = await User.objects.aget(id=self.user_id)
             print(f"User {self.user.email} connected.")
         except User.DoesNotExist:
             await self.close()
             return
 
-        # Group name for broadcasting to all users
-        self.global_group_name = "global_chat"
         self.user_group_name = f"user_{self.user_id}"
+        # Last chat message being written, see receive()
+        self.last_message_task = None
+        # Only mutual follows can chat, they are the ones who see the status
+        self.contact_ids = await self.get_contact_ids()
 
-        online_users.add(self.user_id)
-
-        # Add user to groups
-        await self.channel_layer.group_add(self.global_group_name, self.channel_name)
         await self.channel_layer.group_add(self.user_group_name, self.channel_name)
 
-        # Accept the WebSocket connection
-        await self.accept()
+        # Accept the WebSocket connection, in the format the client asked for
+        self.protocol = negotiate(self.scope.get("subprotocols"))
+        await self.accept(subprotocol=self.protocol.subprotocol)
 
-        # Broadcast that this user is online
-        await self.channel_layer.group_send(
-            self.global_group_name,
-            {
-                "type": "status_update",
-                "user_id": self.user_id,
-                "is_online": True,
-            },
-        )
+        became_online = await presence.connect(self.user.id, self.channel_name)
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+        online_contacts = await presence.online(self.contact_ids)
 
-        # send the current user list of all online users
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "user_list",
-                    "users": list(online_users),
-                }
-            )
+        # Broadcast that this user is online, other sockets of theirs already did
+        if became_online:
+            await self.send_status(online_contacts, True)
+
+        # send the list of the contacts that are online
+        await self.send_event(
+            {
+                "type": "user_list",
+                "users": [str(user_id) for user_id in online_contacts],
+            }
         )
 
     async def disconnect(self, close_code):
-        if hasattr(self, "user_id") and self.user_id in online_users:
+        # Let the messages already sent reach the database and the recipient
+        if getattr(self, "last_message_task", None) is not None:
+            await asyncio.wait([self.last_message_task])
+
+        if hasattr(self, "heartbeat_task"):
+            self.heartbeat_task.cancel()
             # Remove user from groups
-            await self.channel_layer.group_discard(
-                self.global_group_name, self.channel_name
-            )
             await self.channel_layer.group_discard(
                 self.user_group_name, self.channel_name
             )
 
-            # Broadcast that this user is offline
+            # Broadcast that this user is offline, unless another socket is open
+            if await presence.disconnect(self.user.id, self.channel_name):
+                await typing_state.stop(self.user.id)
+                await self.send_status(await presence.online(self.contact_ids), False)
+
+    async def heartbeat(self):
+        """Keep this socket in the presence store while it is open"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await presence.heartbeat(self.user.id, self.channel_name)
+
+    async def send_status(self, user_ids, is_online):
+        for user_id in user_ids:
             await self.channel_layer.group_send(
-                self.global_group_name,
+                f"user_{user_id}",
                 {
                     "type": "status_update",
                     "user_id": self.user_id,
-                    "is_online": False,
+                    "is_online": is_online,
                 },
             )
 
-            online_users.remove(self.user_id)
+    async def get_contact_ids(self):
+        return {
+            user_id
+            async for user_id in self.user.get_mutual_follows().values_list(
+                "id", flat=True
+            )
+        }
 
-        if hasattr(self, "user_id") and str(self.user_id) in typing_users:
-            del typing_users[str(self.user_id)]
+    async def send_event(self, event):
+        """Send event to the client in the negotiated format"""
+        await self.send(**self.protocol.encode(event))
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.protocol.decode(text_data, bytes_data)
+        except ProtocolError as e:
+            await self.send_event({"type": "error", "message": str(e)})
+            return
 
-        if data["type"] == "chat_message":
-            await self.handle_chat_message(data)
-        elif data["type"] == "mark_messages_read":
+        frame_type = data.get("type")
+        if frame_type == "chat_message":
+            # Not awaited, so a burst of messages is written in one batch
+            self.last_message_task = asyncio.ensure_future(
+                self.handle_chat_message(data, self.last_message_task)
+            )
+        elif frame_type == "mark_messages_read":
             await self.handle_mark_messages_read(data)
-        elif data["type"] == "typing_status":
+        elif frame_type == "typing_status":
             await self.handle_typing_status(data)
+        else:
+            await self.send_event(
+                {"type": "error", "message": f"Unknown frame type: {frame_type}"}
+            )
 
-    async def handle_chat_message(self, data):
-        recipient_id = data["recipient_id"]
-        content = data["content"]
-        print("data:", data)
-        # Save message to database
-        message = await self.save_message(recipient_id, content)
+    async def handle_chat_message(self, data, previous=None):
+        recipient_id = parse_id(data.get("recipient_id"))
+        content = data.get("content")
+        # Save message to database, together with the other pending messages
+        try:
+            if recipient_id is None:
+                raise ValueError("recipient_id must be a user id")
+            if not isinstance(content, str) or not content:
+                raise ValueError("content must be a non-empty string")
+            message = await message_buffer.add(self.user.id, recipient_id, content)
+        except Exception as e:
+            # The previous messages of this socket are handled first
+            if previous is not None:
+                await asyncio.wait([previous])
+            print(f"Error saving message: {str(e)}")
+            await self.send_event(
+                {
+                    "type": "error",
+                    "message": str(e),
+                    "old_message_id": data.get("message_id", None),
+                }
+            )
+            return
+        if previous is not None:
+            await asyncio.wait([previous])
         # Check if recipient is online
         is_online = await self.is_user_online(recipient_id)
         # print all above
@@ -121,73 +179,41 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
 
         # Send delivery confirmation to sender
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "message_delivery",
-                    "message_id": str(message.id),
-                    "status": "delivered" if is_online else "stored",
-                    "timestamp": str(message.timestamp),
-                    "old_message_id": data.get("message_id", None),
-                    "chat_uuid": data.get("chat_uuid", None),
-                }
-            )
+        await self.send_event(
+            {
+                "type": "message_delivery",
+                "message_id": str(message.id),
+                "status": "delivered" if is_online else "stored",
+                "timestamp": str(message.timestamp),
+                "old_message_id": data.get("message_id", None),
+                "chat_uuid": data.get("chat_uuid", None),
+            }
         )
 
-    @database_sync_to_async
-    def save_message(self, recipient_id, content):
-        User = get_user_model()
-        from .models import Chat, Message  # Move import here
-
+    async def is_user_online(self, user_id):
         try:
-            recipient = User.objects.get(id=recipient_id)
-
-            # always take the user with smalelr id as user1 and the other as user2
-            if self.user.id < recipient.id:
-                user1 = self.user
-                user2 = recipient
-            else:
-                user1 = recipient
-                user2 = self.user
-
-            # Get or create chat
-
-            chat, created = Chat.objects.get_or_create(user1=user1, user2=user2)
-
-            # Create message
-            return Message.objects.create(
-                chat=chat, sender=self.user, content=content, is_deleted="no"
-            )
-        except Exception as e:
-            print(f"Error saving message: {str(e)}")
-            raise e
-
-    @database_sync_to_async
-    def is_user_online(self, user_id):
-        return str(user_id) in online_users
+            return await presence.is_online(int(user_id))
+        except (TypeError, ValueError):
+            return False
 
     async def status_update(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "status",
-                    "user_id": event["user_id"],
-                    "is_online": event["is_online"],
-                }
-            )
+        await self.send_event(
+            {
+                "type": "status",
+                "user_id": event["user_id"],
+                "is_online": event["is_online"],
+            }
         )
 
     async def chat_message(self, event):
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "chat_message",
-                    "message": event["message"],
-                    "sender_id": event["sender_id"],
-                    "timestamp": event["timestamp"],
-                    "message_id": event["message_id"],
-                }
-            )
+        await self.send_event(
+            {
+                "type": "chat_message",
+                "message": event["message"],
+                "sender_id": event["sender_id"],
+                "timestamp": event["timestamp"],
+                "message_id": event["message_id"],
+            }
         )
 
     async def handle_mark_messages_read(self, data):
@@ -206,26 +232,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
                       is not authorized to mark \
                       messages as read in chat {chat_uuid}."
                 )
-                await self.send(
-                    text_data=json.dumps(
-                        {
-                            "type": "error",
-                            "message": "Unauthorized to mark messages as read",
-                        }
-                    )
+                await self.send_event(
+                    {
+                        "type": "error",
+                        "message": "Unauthorized to mark messages as read",
+                    }
                 )
                 return
 
-            # Mark messages as read in the database
-            from .models import Chat, Message
-
-            # Proper async ORM usage
-            chat = await Chat.objects.aget(uuid=chat_uuid)
-            await Message.objects.filter(
-                chat=chat, sender__id=sender_id, read=False
-            ).aupdate(
-                read=True
-            )  # Changed to aupdate()
+            # Move the user's read watermark to the last message of the chat
+            chat = await Chat.objects.aget(
+                Q(user1=self.user) | Q(user2=self.user), uuid=chat_uuid
+            )
+            await ReadWatermark.objects.amark_read(chat.id, self.user.id)
 
             # Notify the sender
             await self.channel_layer.group_send(
@@ -239,63 +258,62 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         except Exception as e:
             print(f"Error marking messages as read: {str(e)}")
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "type": "error",
-                        "message": str(e),
-                    }
-                )
+            await self.send_event(
+                {
+                    "type": "error",
+                    "message": str(e),
+                }
             )
 
     async def messages_read_notification(self, event):
         """
         Notifies a user that their messages were read by someone
         """
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "messages_read",
-                    "chat_uuid": event["chat_uuid"],
-                    "reader_id": event["reader_id"],
-                }
-            )
+        await self.send_event(
+            {
+                "type": "messages_read",
+                "chat_uuid": event["chat_uuid"],
+                "reader_id": event["reader_id"],
+            }
         )
 
     async def handle_typing_status(self, data):
         """
         Handles typing status updates from users
         """
-        is_typing = data["is_typing"]
+        is_typing = bool(data["is_typing"])
         chat_uuid = data.get("chat_uuid")  # Optional: if you want to track per-chat
-        recipient_id = data.get("recipient_id")  # Who should be notified
+        try:
+            recipient_id = int(data.get("recipient_id"))  # Who should be notified
+        except (TypeError, ValueError):
+            return
 
-        # Check if recipient is online
-        is_online = await self.is_user_online(recipient_id)
+        async def notify(is_typing):
+            # Notify the recipient if they are online
+            if await self.is_user_online(recipient_id):
+                await self.channel_layer.group_send(
+                    f"user_{recipient_id}",
+                    {
+                        "type": "typing_indicator",
+                        "sender_id": self.user_id,
+                        "is_typing": is_typing,
+                        "chat_uuid": chat_uuid,
+                    },
+                )
 
-        # Notify the recipient if they are online
-        if is_online:
-            await self.channel_layer.group_send(
-                f"user_{recipient_id}",
-                {
-                    "type": "typing_indicator",
-                    "sender_id": self.user_id,
-                    "is_typing": is_typing,
-                    "chat_uuid": chat_uuid,
-                },
-            )
+        # Only the changes are forwarded, at most one per second per chat,
+        # which the recipient identifies
+        typing_state.update(self.user.id, recipient_id, is_typing, notify)
 
     async def typing_indicator(self, event):
         """
         Sends typing status updates to clients
         """
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "typing",
-                    "sender_id": event["sender_id"],
-                    "is_typing": event["is_typing"],
-                    "chat_uuid": event.get("chat_uuid"),
-                }
-            )
+        await self.send_event(
+            {
+                "type": "typing",
+                "sender_id": event["sender_id"],
+                "is_typing": event["is_typing"],
+                "chat_uuid": event.get("chat_uuid"),
+            }
         )
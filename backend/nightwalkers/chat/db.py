@@ -0,0 +1,15 @@
+"""
+Database connections of the chat consumers
+
+The async ORM (aget, abulk_create...) runs its queries on the thread of
+sync_to_async(thread_sensitive=True). Websockets never send the
+request_started/request_finished signals that recycle the connections of
+HTTP requests, so the consumers call aclose_old_connections() themselves,
+before their database work, like channels' database_sync_to_async does
+around every call.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+aclose_old_connections = sync_to_async(close_old_connections, thread_sensitive=True)
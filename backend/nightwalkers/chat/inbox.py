@@ -0,0 +1,107 @@
+"""
+Chat list and message history
+
+inbox_queryset() annotates every mutual follow of a user with their chat,
+its last message and the user's unread count (the messages past their
+read watermark, a range of the (chat, id) index): correlated subqueries of a
+single query, so the list costs one query however many contacts there are,
+and no chat row is created for contacts nobody wrote to yet.
+
+Message history is paged by message id (newest first), older pages are
+loaded on demand with the id of the oldest message shown as cursor.
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Chat, Message, ReadWatermark
+
+MESSAGE_PAGE_SIZE = 30
+MAX_MESSAGE_PAGE_SIZE = 100
+
+LAST_MESSAGE_FIELDS = ("id", "sender_id", "content", "timestamp", "is_deleted")
+
+
+def unread_count(user):
+    """Messages of the outer chat (chat_id) sent to user past their watermark"""
+    last_read = ReadWatermark.objects.filter(
+        chat_id=OuterRef(OuterRef("chat_id")), user=user
+    ).values("last_read_id")[:1]
+    return Coalesce(
+        Subquery(
+            Message.objects.filter(
+                chat_id=OuterRef("chat_id"),
+                id__gt=Coalesce(Subquery(last_read), Value(0)),
+            )
+            .exclude(sender=user)
+            .order_by()
+            .values("chat_id")
+            .annotate(count=Count("id"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def inbox_queryset(user):
+    """
+    The user's mutual follows, annotated with their chat
+
+    Annotations: chat_id and chat_uuid (None without chat), last_<field> of
+    the last message for LAST_MESSAGE_FIELDS (None without messages) and
+    unread_count. Ordered by most recent message, contacts without messages
+    last.
+    """
+    chat = Chat.objects.filter(
+        Q(user1=user, user2=OuterRef("pk")) | Q(user1=OuterRef("pk"), user2=user)
+    )
+    last_message = Message.objects.filter(chat_id=OuterRef("chat_id")).order_by("-id")
+    return (
+        user.get_mutual_follows()
+        .annotate(
+            chat_id=Subquery(chat.values("id")[:1]),
+            chat_uuid=Subquery(chat.values("uuid")[:1]),
+            **{
+                f"last_{field}": Subquery(last_message.values(field)[:1])
+                for field in LAST_MESSAGE_FIELDS
+            },
+            unread_count=unread_count(user),
+        )
+        .order_by(F("last_id").desc(nulls_last=True), "id")
+    )
+
+
+def serialize_inbox_entry(contact):
+    last_message = None
+    if contact.last_id is not None:
+        last_message = {
+            field: getattr(contact, f"last_{field}") for field in LAST_MESSAGE_FIELDS
+        }
+    return {
+        "user": {
+            "id": contact.id,
+            "email": contact.email,
+            "first_name": contact.first_name,
+            "last_name": contact.last_name,
+            "avatar": contact.get_avatar,
+            "avatar_url": contact.avatar_url,
+        },
+        "chat_uuid": str(contact.chat_uuid) if contact.chat_uuid else None,
+        "last_message": last_message,
+        "unread_count": contact.unread_count,
+    }
+
+
+def message_page(chat, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Up to limit messages of chat older than the message id before
+
+    Returns:
+        tuple: (messages oldest first, whether there are older ones)
+    """
+    messages = Message.objects.filter(chat=chat)
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    # One row past the page tells whether there is an older one
+    rows = list(messages.order_by("-id")[: limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
@@ -0,0 +1,129 @@
+"""
+Chat load test
+
+Simulated clients (channels.testing.WebsocketCommunicator, in this process)
+are paired up and every client sends its partner messages_per_client chat
+messages as fast as the socket takes them. Each message carries the time
+it was sent, the partner notes when it arrives: the report gives the
+delivered messages per second and the delivery latency percentiles.
+
+The clients go through the whole consumer (presence, message buffer,
+channel layer, database), so run it against a throwaway database: see the
+chat_loadtest command, which creates and deletes its users.
+"""
+
+import asyncio
+import statistics
+import time
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from accounts.models import Follow
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+LOADTEST_EMAIL_DOMAIN = "loadtest.invalid"
+
+
+def create_load_test_users(clients):
+    """Create clients users, each pair following each other"""
+    users = User.objects.bulk_create(
+        [
+            User(
+                email=f"chat-{i}@{LOADTEST_EMAIL_DOMAIN}",
+                first_name="Load",
+                last_name=f"Test {i}",
+                password="!",  # Unusable
+            )
+            for i in range(clients - clients % 2)
+        ]
+    )
+    pairs = list(zip(users[::2], users[1::2]))
+    Follow.objects.bulk_create(
+        [Follow(main_user=a, following_user=b) for a, b in pairs]
+        + [Follow(main_user=b, following_user=a) for a, b in pairs]
+    )
+    return [(a.id, b.id) for a, b in pairs]
+
+
+def delete_load_test_users():
+    """Delete the users of create_load_test_users, their chats go with them"""
+    return User.objects.filter(email__endswith=f"@{LOADTEST_EMAIL_DOMAIN}").delete()
+
+
+async def open_client(application, user_id):
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{user_id}/")
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError(f"User {user_id} could not connect")
+    return communicator
+
+
+async def run_client(communicator, partner_id, messages, latencies, timeout):
+    """Send messages to the partner and receive theirs and the acks"""
+
+    async def send():
+        for i in range(messages):
+            await communicator.send_json_to(
+                {
+                    "type": "chat_message",
+                    "recipient_id": partner_id,
+                    "content": repr(time.perf_counter()),
+                    "message_id": f"load-{i}",
+                }
+            )
+
+    async def receive():
+        received = acked = 0
+        while received < messages or acked < messages:
+            event = await communicator.receive_json_from(timeout)
+            if event["type"] == "chat_message":
+                latencies.append(time.perf_counter() - float(event["message"]))
+                received += 1
+            elif event["type"] == "message_delivery":
+                acked += 1
+            elif event["type"] == "error":
+                raise RuntimeError(event["message"])
+
+    await asyncio.gather(send(), receive())
+
+
+async def run_load_test(pairs, messages_per_client=50, timeout=30):
+    """
+    Run the load test with the (user id, user id) pairs
+
+    Returns:
+        dict: clients, messages, seconds, messages_per_second, p50_ms, p99_ms
+    """
+    application = URLRouter(websocket_urlpatterns)
+    clients = []
+    for a, b in pairs:
+        clients.append((await open_client(application, a), b))
+        clients.append((await open_client(application, b), a))
+    latencies = []
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *[
+                run_client(
+                    communicator, partner, messages_per_client, latencies, timeout
+                )
+                for communicator, partner in clients
+            ]
+        )
+        seconds = time.perf_counter() - start
+    finally:
+        for communicator, _ in clients:
+            await communicator.disconnect()
+
+    latencies.sort()
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "clients": len(clients),
+        "messages": len(latencies),
+        "seconds": seconds,
+        "messages_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
@@ -0,0 +1,38 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from chat.loadtest import create_load_test_users, delete_load_test_users, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chat throughput and delivery latency with simulated websocket "
+        "clients. Creates and deletes its own users: use a throwaway database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients", type=int, default=100, help="Number of simulated clients"
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=50,
+            help="Messages sent by every client",
+        )
+
+    def handle(self, *args, **options):
+        if options["clients"] < 2:
+            self.stderr.write("At least 2 clients are needed")
+            return
+        delete_load_test_users()
+        pairs = create_load_test_users(options["clients"])
+        try:
+            report = async_to_sync(run_load_test)(pairs, options["messages"])
+        finally:
+            delete_load_test_users()
+
+        self.stdout.write(
+            f"{report['clients']} clients, {report['messages']} messages in "
+            f"{report['seconds']:.2f}s: {report['messages_per_second']:.0f} msg/s, "
+            f"p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms"
+        )
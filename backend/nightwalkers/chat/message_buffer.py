@@ -0,0 +1,184 @@
+"""
+Coalesced chat message writes
+
+ChatConsumer does not insert its messages one by one: add() queues the
+message and waits for the next flush, which writes everything queued by
+every socket of the process with one bulk_create, FLUSH_INTERVAL after the
+first message of the batch or as soon as MAX_BATCH messages are waiting.
+The chat of each (user1, user2) pair is looked up once and kept in
+memory, so a steady conversation costs no query but its share of the
+INSERT. Batches are written in order, one at a time, with the async ORM;
+a batch the database rejects is written again message by message, so that
+one bad message does not fail the ones of the other sockets.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+from django.contrib.auth import get_user_model
+from django.db import DataError, IntegrityError
+from django.db.models import Q
+from .db import aclose_old_connections
+from .models import Chat, Message
+
+User = get_user_model()
+
+FLUSH_INTERVAL = 0.005  # seconds
+MAX_BATCH = 200
+CHAT_CACHE_SIZE = 10000
+# Seconds between checks of the database connection, every flush would cost
+# a trip to the database thread
+CONNECTION_CHECK_INTERVAL = 10
+
+
+def chat_key(user_a, user_b):
+    """A chat's (user1, user2): the smaller user id is user1"""
+    return tuple(sorted((int(user_a), int(user_b))))
+
+
+class MessageWriteBuffer:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # (user1 id, user2 id) -> chat id, least recently used first
+        self._chat_ids = OrderedDict()
+        self._connection_checked = 0
+        self._reset(None)
+
+    def _reset(self, loop):
+        self._loop = loop
+        self._pending = []
+        self._timer = None
+        self._last_flush = None
+
+    async def add(self, sender_id, recipient_id, content):
+        """
+        Queue a message and wait until it is written
+
+        Returns:
+            Message: The saved message (id and timestamp set)
+
+        Raises:
+            User.DoesNotExist: The recipient does not exist
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+        future = loop.create_future()
+        self._pending.append((int(sender_id), int(recipient_id), content, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._start_flush)
+        return await future
+
+    async def flush(self):
+        """Write what is queued now"""
+        self._start_flush()
+        if self._last_flush is not None:
+            await asyncio.wait([self._last_flush])
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._last_flush = asyncio.ensure_future(
+                self._flush(batch, self._last_flush)
+            )
+
+    async def _flush(self, batch, previous):
+        # Keep the batches in order, a sender's messages must not swap
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            if time.monotonic() - self._connection_checked > CONNECTION_CHECK_INTERVAL:
+                await aclose_old_connections()
+                self._connection_checked = time.monotonic()
+            results = await self._write(batch)
+        except Exception as e:
+            # Check the connection before the next batch
+            self._connection_checked = 0
+            results = [e] * len(batch)
+        for (*_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _write(self, batch):
+        try:
+            return await self._insert(batch)
+        except (IntegrityError, DataError):
+            # A cached chat was deleted meanwhile, or a message is invalid
+            self._chat_ids.clear()
+        # One by one, so that a bad message only fails itself
+        results = []
+        for message in batch:
+            try:
+                results.extend(await self._insert([message]))
+            except (IntegrityError, DataError) as e:
+                results.append(e)
+        return results
+
+    async def _insert(self, batch):
+        await self._resolve_chats(
+            {chat_key(sender, recipient) for sender, recipient, _, _ in batch}
+        )
+        results = []
+        messages = []
+        for sender, recipient, content, _ in batch:
+            chat_id = self._chat_ids.get(chat_key(sender, recipient))
+            if chat_id is None:
+                results.append(User.DoesNotExist(f"User {recipient} not found"))
+                continue
+            message = Message(
+                chat_id=chat_id, sender_id=sender, content=content, is_deleted="no"
+            )
+            results.append(message)
+            messages.append(message)
+        await Message.objects.abulk_create(messages)
+        return results
+
+    async def _resolve_chats(self, keys):
+        """Put the chat ids of keys in the cache, creating the missing chats"""
+        missing = set()
+        for key in keys:
+            if key in self._chat_ids:
+                self._chat_ids.move_to_end(key)
+            else:
+                missing.add(key)
+        if not missing:
+            return
+
+        found = {}
+        async for user1_id, user2_id, chat_id in Chat.objects.filter(
+            reduce(or_, (Q(user1_id=a, user2_id=b) for a, b in missing))
+        ).values_list("user1_id", "user2_id", "id"):
+            found[(user1_id, user2_id)] = chat_id
+        new = missing - found.keys()
+        if new:
+            users = {
+                user_id
+                async for user_id in User.objects.filter(
+                    id__in={user_id for key in new for user_id in key}
+                ).values_list("id", flat=True)
+            }
+            for user1_id, user2_id in new:
+                if user1_id in users and user2_id in users:
+                    chat, _ = await Chat.objects.aget_or_create(
+                        user1_id=user1_id, user2_id=user2_id
+                    )
+                    found[(user1_id, user2_id)] = chat.id
+
+        self._chat_ids.update(found)
+        while len(self._chat_ids) > CHAT_CACHE_SIZE:
+            self._chat_ids.popitem(last=False)
+
+
+message_buffer = MessageWriteBuffer()
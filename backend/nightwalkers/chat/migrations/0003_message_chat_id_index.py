@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_message_is_deleted"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["chat", "id"], name="chat_message_chat_id_idx"),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, Max, OuterRef
+
+
+def backfill_watermarks(apps, schema_editor):
+    """A user's watermark is the last message read among the ones sent to them"""
+    Message = apps.get_model("chat", "Message")
+    ReadWatermark = apps.get_model("chat", "ReadWatermark")
+    last_read = (
+        Message.objects.filter(read=True)
+        .order_by()
+        .values("chat_id", "sender_id", "chat__user1_id", "chat__user2_id")
+        .annotate(last_read_id=Max("id"))
+    )
+    ReadWatermark.objects.bulk_create(
+        [
+            ReadWatermark(
+                chat_id=row["chat_id"],
+                user_id=(
+                    row["chat__user2_id"]
+                    if row["sender_id"] == row["chat__user1_id"]
+                    else row["chat__user1_id"]
+                ),
+                last_read_id=row["last_read_id"],
+            )
+            for row in last_read.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+def restore_read_flags(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    ReadWatermark = apps.get_model("chat", "ReadWatermark")
+    Message.objects.update(
+        read=Exists(
+            ReadWatermark.objects.filter(
+                chat_id=OuterRef("chat_id"), last_read_id__gte=OuterRef("id")
+            ).exclude(user_id=OuterRef("sender_id"))
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0003_message_chat_id_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReadWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_read_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "chat",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="read_watermarks",
+                        to="chat.chat",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("chat", "user"), name="chat_read_watermark_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_watermarks, restore_read_flags),
+        migrations.RemoveField(
+            model_name="message",
+            name="read",
+        ),
+    ]
@@ -1,5 +1,7 @@
 # chat/models.py
-from django.db import models
+from django.db import connection, models
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 import uuid
 
@@ -44,8 +46,98 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    read = models.BooleanField(default=False)
     is_deleted = models.TextField(default="no")  # no, self, everyone
 
     class Meta:
         ordering = ["timestamp"]
+        indexes = [
+            # Last message and history pages of a chat
+            models.Index(fields=["chat", "id"], name="chat_message_chat_id_idx")
+        ]
+
+
+class ReadWatermarkManager(models.Manager):
+    def mark_read(self, chat_id, user_id, up_to=None):
+        """
+        Mark the messages of a chat read by user_id, up to the message id
+        up_to or the last message of the chat: a single upsert, the
+        watermark never goes back
+
+        Returns:
+            int: The new watermark
+        """
+        table = self.model._meta.db_table
+        if up_to is None:
+            source = (
+                f"SELECT %s, %s, COALESCE(MAX(id), 0), %s "
+                f"FROM {Message._meta.db_table} WHERE chat_id = %s"
+            )
+            params = [chat_id, user_id, timezone.now(), chat_id]
+        else:
+            source = "SELECT %s, %s, %s, %s"
+            params = [chat_id, user_id, up_to, timezone.now()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (chat_id, user_id, last_read_id, updated_at) "
+                f"{source} "
+                f"ON CONFLICT (chat_id, user_id) DO UPDATE SET "
+                f"last_read_id = GREATEST({table}.last_read_id, "
+                f"EXCLUDED.last_read_id), updated_at = EXCLUDED.updated_at "
+                f"RETURNING last_read_id",
+                params,
+            )
+            return cursor.fetchone()[0]
+
+    async def amark_read(self, chat_id, user_id, up_to=None):
+        return await sync_to_async(self.mark_read)(chat_id, user_id, up_to)
+
+    def read_up_to(self, chat):
+        """
+        Sender id -> id of the last of their messages in chat that the other
+        user has read (0 if none)
+        """
+        last_read = dict(self.filter(chat=chat).values_list("user_id", "last_read_id"))
+        return {
+            chat.user1_id: last_read.get(chat.user2_id, 0),
+            chat.user2_id: last_read.get(chat.user1_id, 0),
+        }
+
+    def unread_count(self, chat, user):
+        """Messages of chat sent to user after their watermark"""
+        last_read = (
+            self.filter(chat=chat, user=user)
+            .values_list("last_read_id", flat=True)
+            .first()
+        )
+        return (
+            Message.objects.filter(chat=chat, id__gt=last_read or 0)
+            .exclude(sender=user)
+            .count()
+        )
+
+
+class ReadWatermark(models.Model):
+    """
+    The last message of a chat read by one of its users: every message up
+    to it is read, so unread messages are an id range of the chat's index
+    """
+
+    chat = models.ForeignKey(
+        Chat, related_name="read_watermarks", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # A message id, not a foreign key: only compared to ids
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ReadWatermarkManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["chat", "user"], name="chat_read_watermark_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} read chat {self.chat_id} up to {self.last_read_id}"
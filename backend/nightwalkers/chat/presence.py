@@ -0,0 +1,138 @@
+"""
+Who is connected to the chat
+
+A user is online while at least one of their sockets is, on any worker.
+Every socket is recorded with an expiry that its consumer pushes forward
+every HEARTBEAT_INTERVAL, so the sockets of a worker that died without
+disconnecting them go offline on their own after PRESENCE_TTL.
+
+The store is in process memory, or in redis when CHAT_PRESENCE_REDIS_URL is
+set, which is needed as soon as there is more than one Daphne worker.
+"""
+
+import time
+from django.conf import settings
+
+PRESENCE_TTL = 60  # seconds
+HEARTBEAT_INTERVAL = PRESENCE_TTL / 3
+
+
+class InMemoryPresenceStore:
+    """
+    Presence of this process, for tests and single worker deployments
+
+    The methods never await, each runs at once on the event loop.
+    """
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        # user id -> {connection: expiry}
+        self._connections = {}
+
+    def _alive(self, user_id, now):
+        connections = self._connections.get(user_id, {})
+        for connection, expiry in list(connections.items()):
+            if expiry <= now:
+                del connections[connection]
+        if not connections:
+            self._connections.pop(user_id, None)
+        return connections
+
+    async def clear(self):
+        self._connections = {}
+
+    async def connect(self, user_id, connection):
+        """Record a socket, True if the user was offline until now"""
+        now = time.time()
+        was_online = bool(self._alive(user_id, now))
+        self._connections.setdefault(user_id, {})[connection] = now + self.ttl
+        return not was_online
+
+    async def heartbeat(self, user_id, connection):
+        self._connections.setdefault(user_id, {})[connection] = time.time() + self.ttl
+
+    async def disconnect(self, user_id, connection):
+        """Forget a socket, True if it was the user's last one"""
+        self._connections.get(user_id, {}).pop(connection, None)
+        return not self._alive(user_id, time.time())
+
+    async def online(self, user_ids):
+        """The user ids among user_ids that are online"""
+        now = time.time()
+        return {user_id for user_id in user_ids if self._alive(user_id, now)}
+
+    async def is_online(self, user_id):
+        return bool(await self.online([user_id]))
+
+
+class RedisPresenceStore:
+    """
+    Presence shared by every worker
+
+    chat:presence:<user id> is a sorted set of the user's sockets scored by
+    expiry, the key itself expires with the last heartbeat.
+    """
+
+    def __init__(self, url, ttl=PRESENCE_TTL):
+        # Only needed when presence is shared, like the redis channel layer
+        import redis.asyncio
+
+        self.ttl = ttl
+        self.client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, user_id):
+        return f"chat:presence:{user_id}"
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter("chat:presence:*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def _record(self, user_id, connection):
+        now = time.time()
+        key = self._key(user_id)
+        async with self.client.pipeline() as pipe:
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            pipe.zadd(key, {connection: now + self.ttl})
+            pipe.expire(key, int(self.ttl) + 1)
+            _, alive, _, _ = await pipe.execute()
+        return alive
+
+    async def connect(self, user_id, connection):
+        return not await self._record(user_id, connection)
+
+    async def heartbeat(self, user_id, connection):
+        await self._record(user_id, connection)
+
+    async def disconnect(self, user_id, connection):
+        key = self._key(user_id)
+        async with self.client.pipeline() as pipe:
+            pipe.zrem(key, connection)
+            pipe.zcount(key, time.time(), "+inf")
+            _, alive = await pipe.execute()
+        return not alive
+
+    async def online(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self._key(user_id), now, "+inf")
+            counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+    async def is_online(self, user_id):
+        return bool(await self.online([user_id]))
+
+
+def get_presence_store():
+    url = getattr(settings, "CHAT_PRESENCE_REDIS_URL", None)
+    if url:
+        return RedisPresenceStore(url)
+    return InMemoryPresenceStore()
+
+
+presence = get_presence_store()
@@ -0,0 +1,137 @@
+"""
+Wire formats of the chat websocket
+
+JSON text frames are the default. A client that offers the
+MSGPACK_SUBPROTOCOL subprotocol (new WebSocket(url, ["nightwalkers.msgpack"]))
+gets binary frames instead: msgpack maps whose keys are the short codes of
+FIELD_CODES and whose "type" is an integer of TYPE_CODES, in both
+directions. Each binary frame starts with a byte telling whether the rest
+is raw msgpack or raw deflate (zlib wbits=-15) of it, which is only used
+past COMPRESS_MIN_SIZE bytes: a typing event stays a few bytes.
+"""
+
+import json
+import zlib
+import msgpack
+
+MSGPACK_SUBPROTOCOL = "nightwalkers.msgpack"
+
+# First byte of a binary frame
+RAW = 0
+DEFLATED = 1
+COMPRESS_MIN_SIZE = 256
+# Largest frame accepted once inflated
+MAX_FRAME_SIZE = 64 * 1024
+
+FIELD_CODES = {
+    "type": "t",
+    "message": "m",
+    "content": "c",
+    "sender_id": "s",
+    "recipient_id": "r",
+    "user_id": "u",
+    "reader_id": "rd",
+    "current_user_id": "cu",
+    "users": "us",
+    "timestamp": "ts",
+    "message_id": "id",
+    "old_message_id": "oid",
+    "chat_uuid": "ch",
+    "status": "st",
+    "is_online": "on",
+    "is_typing": "ty",
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+TYPE_CODES = {
+    # Client to server
+    "chat_message": 1,
+    "mark_messages_read": 2,
+    "typing_status": 3,
+    # Server to client
+    "user_list": 10,
+    "status": 11,
+    "message_delivery": 12,
+    "messages_read": 13,
+    "typing": 14,
+    "error": 15,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+class ProtocolError(ValueError):
+    """A frame that cannot be decoded"""
+
+
+class JSONProtocol:
+    subprotocol = None
+
+    def encode(self, event):
+        """Keyword arguments of AsyncWebsocketConsumer.send for event"""
+        return {"text_data": json.dumps(event)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            raise ProtocolError("Text frames expected")
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError as e:
+            raise ProtocolError(str(e))
+        if not isinstance(data, dict):
+            raise ProtocolError("A frame must be an object")
+        return data
+
+
+class MsgpackProtocol:
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def encode(self, event):
+        packed = msgpack.packb(
+            {
+                FIELD_CODES.get(key, key): (
+                    TYPE_CODES.get(value, value) if key == "type" else value
+                )
+                for key, value in event.items()
+            },
+            use_bin_type=True,
+        )
+        header = RAW
+        if len(packed) >= COMPRESS_MIN_SIZE:
+            compressor = zlib.compressobj(wbits=-15)
+            packed = compressor.compress(packed) + compressor.flush()
+            header = DEFLATED
+        return {"bytes_data": bytes([header]) + packed}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if not bytes_data:
+            raise ProtocolError("Binary frames expected")
+        header, payload = bytes_data[0], bytes_data[1:]
+        try:
+            if header == DEFLATED:
+                decompressor = zlib.decompressobj(wbits=-15)
+                payload = decompressor.decompress(payload, MAX_FRAME_SIZE)
+                if decompressor.unconsumed_tail:
+                    raise ProtocolError("Frame too large")
+            elif header != RAW:
+                raise ProtocolError(f"Unknown frame header {header}")
+            event = msgpack.unpackb(payload, raw=False)
+        except (zlib.error, ValueError, msgpack.UnpackException) as e:
+            raise ProtocolError(str(e))
+        if not isinstance(event, dict):
+            raise ProtocolError("A frame must be a map")
+        event = {FIELD_NAMES.get(key, key): value for key, value in event.items()}
+        if isinstance(event.get("type"), int):
+            event["type"] = TYPE_NAMES.get(event["type"], event["type"])
+        return event
+
+
+PROTOCOLS = {MSGPACK_SUBPROTOCOL: MsgpackProtocol()}
+DEFAULT_PROTOCOL = JSONProtocol()
+
+
+def negotiate(subprotocols):
+    """The protocol of the first supported subprotocol, JSON if none is"""
+    for subprotocol in subprotocols or ():
+        if subprotocol in PROTOCOLS:
+            return PROTOCOLS[subprotocol]
+    return DEFAULT_PROTOCOL
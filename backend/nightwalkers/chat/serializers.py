@@ -8,6 +8,9 @@ class MessageSerializer(serializers.ModelSerializer):
         serializers.StringRelatedField()
     )  # For displaying sender's string representation
     sender_id = serializers.SerializerMethodField()  # Better way to get sender ID
+    # From the read watermarks: context["read_up_to"] is
+    # ReadWatermark.objects.read_up_to(chat)
+    read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -23,3 +26,6 @@ class MessageSerializer(serializers.ModelSerializer):
 
     def get_sender_id(self, obj):
         return obj.sender.id  # Directly access the sender's ID
+
+    def get_read(self, obj):
+        return obj.id <= self.context.get("read_up_to", {}).get(obj.sender_id, 0)
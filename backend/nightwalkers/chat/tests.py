@@ -1,7 +1,37 @@
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse  # Import reverse
-from chat.models import Chat, Message
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from chat.admin import is_read
+from chat.loadtest import (
+    create_load_test_users,
+    delete_load_test_users,
+    run_load_test,
+)
+from chat.message_buffer import MessageWriteBuffer
+from chat.models import Chat, Message, ReadWatermark
+from chat.presence import InMemoryPresenceStore, presence
+from chat.protocol import (
+    COMPRESS_MIN_SIZE,
+    DEFLATED,
+    MSGPACK_SUBPROTOCOL,
+    RAW,
+    JSONProtocol,
+    MsgpackProtocol,
+    ProtocolError,
+    negotiate,
+)
+from chat.routing import websocket_urlpatterns
+from chat.typing_state import TypingStateManager, typing_state
+from unittest.mock import patch
+import asyncio
+import json
+import msgpack
+import time
 import uuid
 
 User = get_user_model()
@@ -36,9 +66,7 @@ class ChatViewsTestCase(TestCase):
 
         # Create some messages
         Message.objects.create(chat=self.chat, sender=self.user1, content="Hello")
-        Message.objects.create(
-            chat=self.chat, sender=self.user2, content="Hi there", read=False
-        )
+        Message.objects.create(chat=self.chat, sender=self.user2, content="Hi there")
 
     def test_get_mutual_follows_with_chats(self):
         url = reverse(
@@ -77,10 +105,18 @@ class ChatViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
 
         # Check if messages were marked as read
-        unread_count = Message.objects.filter(
-            chat=self.chat, sender=self.user2, read=False
-        ).count()
-        self.assertEqual(unread_count, 0)
+        self.assertEqual(ReadWatermark.objects.unread_count(self.chat, self.user1), 0)
+        self.assertEqual(
+            ReadWatermark.objects.get(chat=self.chat, user=self.user1).last_read_id,
+            Message.objects.latest("id").id,
+        )
+
+        # Only a user of the chat has messages to read
+        url = reverse(
+            "read_user_messages",
+            kwargs={"chat_uuid": self.chat.uuid, "sender_id": 9999},
+        )
+        self.assertEqual(self.client.post(url).status_code, 400)
 
     def test_read_user_messages_invalid_chat(self):
         invalid_uuid = uuid.uuid4()
@@ -151,3 +187,653 @@ class ChatViewsTestCase(TestCase):
         # Should only return mutual follows (user2), not user3
         self.assertEqual(len(data["data"]), 1)
         self.assertEqual(data["data"][0]["user"]["email"], "user2@example.com")
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="user@example.com",
+            password="testpass123",
+            first_name="User",
+            last_name="Test",
+        )
+        self.contacts = []
+        for i in range(3):
+            contact = User.objects.create_user(
+                email=f"contact{i}@example.com",
+                password="testpass123",
+                first_name=f"Contact{i}",
+                last_name="Test",
+            )
+            self.user.following.add(contact)
+            contact.following.add(self.user)
+            self.contacts.append(contact)
+        # Only followed one way, not in the inbox
+        self.stranger = User.objects.create_user(
+            email="stranger@example.com",
+            password="testpass123",
+            first_name="Stranger",
+            last_name="Test",
+        )
+        self.user.following.add(self.stranger)
+
+        self.old_chat, _ = Chat.objects.get_or_create_chat(self.user, self.contacts[0])
+        Message.objects.create(chat=self.old_chat, sender=self.user, content="Hi")
+        self.recent_chat, _ = Chat.objects.get_or_create_chat(
+            self.contacts[1], self.user
+        )
+        for content in ("One", "Two"):
+            Message.objects.create(
+                chat=self.recent_chat, sender=self.contacts[1], content=content
+            )
+
+    def get_inbox(self, **params):
+        response = self.client.get(
+            reverse("chat_inbox", kwargs={"user_id": self.user.id}), params
+        )
+        return response.status_code, response.json()
+
+    def test_inbox(self):
+        with self.assertNumQueries(2):
+            status, data = self.get_inbox()
+        self.assertEqual(status, 200)
+        entries = data["data"]
+        # Most recent chat first, the contact without a chat last
+        self.assertEqual(
+            [entry["user"]["id"] for entry in entries],
+            [self.contacts[1].id, self.contacts[0].id, self.contacts[2].id],
+        )
+        self.assertEqual(entries[0]["chat_uuid"], str(self.recent_chat.uuid))
+        self.assertEqual(entries[0]["last_message"]["content"], "Two")
+        self.assertEqual(entries[0]["unread_count"], 2)
+        # Own messages are never unread
+        self.assertEqual(entries[1]["unread_count"], 0)
+        self.assertIsNone(entries[2]["chat_uuid"])
+        self.assertIsNone(entries[2]["last_message"])
+        self.assertFalse(data["has_more"])
+        # Reading the inbox creates no chat
+        self.assertEqual(Chat.objects.count(), 2)
+
+    def test_inbox_pages(self):
+        status, data = self.get_inbox(limit=2)
+        self.assertEqual(len(data["data"]), 2)
+        self.assertTrue(data["has_more"])
+        status, data = self.get_inbox(limit=2, page=2)
+        self.assertEqual([e["user"]["id"] for e in data["data"]], [self.contacts[2].id])
+        self.assertFalse(data["has_more"])
+        self.assertEqual(self.get_inbox(limit=0)[0], 400)
+
+    def test_message_history(self):
+        for i in range(5):
+            Message.objects.create(
+                chat=self.recent_chat, sender=self.user, content=f"Reply {i}"
+            )
+        url = reverse("message_history", kwargs={"chat_uuid": self.recent_chat.uuid})
+        data = self.client.get(url, {"limit": 3}).json()
+        self.assertEqual(
+            [m["content"] for m in data["messages"]], ["Reply 2", "Reply 3", "Reply 4"]
+        )
+        self.assertTrue(data["has_more"])
+
+        data = self.client.get(url, {"limit": 3, "before": data["next_before"]}).json()
+        self.assertEqual(
+            [m["content"] for m in data["messages"]], ["Two", "Reply 0", "Reply 1"]
+        )
+        data = self.client.get(url, {"limit": 3, "before": data["next_before"]}).json()
+        self.assertEqual([m["content"] for m in data["messages"]], ["One"])
+        self.assertFalse(data["has_more"])
+        self.assertIsNone(data["next_before"])
+
+    def test_message_history_errors(self):
+        url = reverse("message_history", kwargs={"chat_uuid": uuid.uuid4()})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("message_history", kwargs={"chat_uuid": self.recent_chat.uuid})
+        self.assertEqual(self.client.get(url, {"before": "x"}).status_code, 400)
+
+
+class ChatSocketTestCase(TransactionTestCase):
+    """Alice and Bob follow each other, nobody is online"""
+
+    # The consumers reach the database from other threads
+    def setUp(self):
+        self.alice = self.create_user("Alice")
+        self.bob = self.create_user("Bob")
+        self.alice.following.add(self.bob)
+        self.bob.following.add(self.alice)
+        async_to_sync(presence.clear)()
+
+    def create_user(self, first_name):
+        return User.objects.create_user(
+            email=f"{first_name.lower()}@example.com",
+            password="testpass123",
+            first_name=first_name,
+            last_name="Test",
+        )
+
+    async def open_socket(self, user, subprotocols=None, read_user_list=True):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/chat/{user.id}/",
+            subprotocols=subprotocols,
+        )
+        self.assertEqual(
+            await communicator.connect(),
+            (True, subprotocols[0] if subprotocols else None),
+        )
+        if read_user_list:
+            await communicator.receive_from()
+        return communicator
+
+
+class PresenceTests(ChatSocketTestCase):
+    def setUp(self):
+        super().setUp()
+        # Carol only follows Alice
+        self.carol = self.create_user("Carol")
+        self.carol.following.add(self.alice)
+
+    async def open_socket(self, user):
+        return await super().open_socket(user, read_user_list=False)
+
+    async def test_status_goes_to_mutual_follows(self):
+        carol = await self.open_socket(self.carol)
+        self.assertEqual(
+            await carol.receive_json_from(), {"type": "user_list", "users": []}
+        )
+        alice = await self.open_socket(self.alice)
+        self.assertEqual(
+            await alice.receive_json_from(), {"type": "user_list", "users": []}
+        )
+
+        bob = await self.open_socket(self.bob)
+        self.assertEqual(
+            await bob.receive_json_from(),
+            {"type": "user_list", "users": [str(self.alice.id)]},
+        )
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {"type": "status", "user_id": str(self.bob.id), "is_online": True},
+        )
+        self.assertTrue(await presence.is_online(self.bob.id))
+
+        await bob.disconnect()
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {"type": "status", "user_id": str(self.bob.id), "is_online": False},
+        )
+        self.assertFalse(await presence.is_online(self.bob.id))
+        # Carol follows Alice but Alice does not follow back
+        self.assertTrue(await carol.receive_nothing())
+        await alice.disconnect()
+        await carol.disconnect()
+
+    async def test_second_socket(self):
+        alice = await self.open_socket(self.alice)
+        await alice.receive_json_from()
+        bob = await self.open_socket(self.bob)
+        await bob.receive_json_from()
+        await alice.receive_json_from()
+
+        # Bob's second tab neither announces him nor takes him offline
+        bob_tab = await self.open_socket(self.bob)
+        await bob_tab.receive_json_from()
+        await bob_tab.disconnect()
+        self.assertTrue(await alice.receive_nothing())
+        self.assertTrue(await presence.is_online(self.bob.id))
+
+        await bob.disconnect()
+        self.assertFalse((await alice.receive_json_from())["is_online"])
+        await alice.disconnect()
+
+    def test_expiry(self):
+        store = InMemoryPresenceStore(ttl=0.01)
+        self.assertTrue(async_to_sync(store.connect)(1, "socket"))
+        self.assertEqual(async_to_sync(store.online)([1, 2]), {1})
+        time.sleep(0.02)
+        # The worker died, nobody disconnected the socket
+        self.assertFalse(async_to_sync(store.is_online)(1))
+        self.assertTrue(async_to_sync(store.connect)(1, "socket"))
+
+
+class MessageBufferTests(ChatSocketTestCase):
+    # The buffer writes from the database thread
+    def test_burst_written_in_one_batch(self):
+        buffer = MessageWriteBuffer(flush_interval=0.05)
+
+        async def burst():
+            return await asyncio.gather(
+                *[
+                    buffer.add(self.alice.id, self.bob.id, f"Message {i}")
+                    for i in range(20)
+                ]
+            )
+
+        with patch.object(
+            Message.objects, "abulk_create", wraps=Message.objects.abulk_create
+        ) as abulk_create:
+            messages = async_to_sync(burst)()
+        self.assertEqual(abulk_create.call_count, 1)
+        chat = Chat.objects.get()
+        self.assertEqual((chat.user1, chat.user2), (self.alice, self.bob))
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("content", flat=True)),
+            [f"Message {i}" for i in range(20)],
+        )
+        self.assertEqual(messages[3].content, "Message 3")
+        self.assertIsNotNone(messages[3].id)
+        self.assertIsNotNone(messages[3].timestamp)
+
+    def test_max_batch(self):
+        buffer = MessageWriteBuffer(flush_interval=10, max_batch=5)
+
+        async def burst():
+            await asyncio.gather(
+                *[buffer.add(self.bob.id, self.alice.id, "Hi") for i in range(10)]
+            )
+
+        async_to_sync(burst)()
+        self.assertEqual(Message.objects.count(), 10)
+
+    def test_chat_cached(self):
+        buffer = MessageWriteBuffer(flush_interval=0)
+        async_to_sync(buffer.add)(self.alice.id, self.bob.id, "First")
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(buffer.add)(self.bob.id, self.alice.id, "Second")
+        # The insert only, no user or chat lookup
+        self.assertEqual(
+            [
+                q["sql"].split()[0]
+                for q in queries
+                if q["sql"] not in ("BEGIN", "COMMIT")
+            ],
+            ["INSERT"],
+        )
+        self.assertEqual(Chat.objects.count(), 1)
+
+    def test_deleted_chat(self):
+        buffer = MessageWriteBuffer(flush_interval=0)
+        async_to_sync(buffer.add)(self.alice.id, self.bob.id, "First")
+        Chat.objects.all().delete()
+        message = async_to_sync(buffer.add)(self.alice.id, self.bob.id, "Again")
+        self.assertEqual(message.chat, Chat.objects.get())
+
+    def test_unknown_recipient(self):
+        buffer = MessageWriteBuffer(flush_interval=0)
+
+        async def send():
+            return await asyncio.gather(
+                buffer.add(self.alice.id, 999999, "Lost"),
+                buffer.add(self.alice.id, self.bob.id, "Kept"),
+                return_exceptions=True,
+            )
+
+        lost, kept = async_to_sync(send)()
+        self.assertIsInstance(lost, User.DoesNotExist)
+        self.assertEqual(kept.content, "Kept")
+        self.assertEqual(Message.objects.get().content, "Kept")
+
+    def test_bad_message_fails_alone(self):
+        buffer = MessageWriteBuffer(flush_interval=0.05)
+
+        async def send():
+            return await asyncio.gather(
+                buffer.add(self.alice.id, self.bob.id, "Before"),
+                buffer.add(self.alice.id, self.bob.id, None),
+                buffer.add(self.bob.id, self.alice.id, "After"),
+                return_exceptions=True,
+            )
+
+        before, bad, after = async_to_sync(send)()
+        self.assertIsInstance(bad, IntegrityError)
+        self.assertEqual((before.content, after.content), ("Before", "After"))
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("content", flat=True)),
+            ["Before", "After"],
+        )
+
+    async def test_consumer_delivers_after_write(self):
+        bob = await self.open_socket(self.bob)
+        alice = await self.open_socket(self.alice)
+        await bob.receive_json_from()  # Alice is online
+
+        for i in range(3):
+            await alice.send_json_to(
+                {
+                    "type": "chat_message",
+                    "recipient_id": self.bob.id,
+                    "content": f"Hello {i}",
+                    "message_id": f"temp-{i}",
+                }
+            )
+        received = [await bob.receive_json_from() for _ in range(3)]
+        acks = [await alice.receive_json_from() for _ in range(3)]
+        self.assertEqual(
+            [event["message"] for event in received], ["Hello 0", "Hello 1", "Hello 2"]
+        )
+        self.assertEqual(
+            [ack["old_message_id"] for ack in acks], ["temp-0", "temp-1", "temp-2"]
+        )
+        self.assertEqual({ack["status"] for ack in acks}, {"delivered"})
+        saved = await Message.objects.filter(id=int(acks[2]["message_id"])).aget()
+        self.assertEqual(saved.content, "Hello 2")
+
+        await alice.send_json_to(
+            {"type": "chat_message", "recipient_id": 999999, "content": "Lost"}
+        )
+        self.assertEqual((await alice.receive_json_from())["type"], "error")
+
+        # Frames that cannot be a message are rejected before the buffer
+        for frame in [
+            {"recipient_id": self.bob.id, "content": None},
+            {"recipient_id": self.bob.id, "content": ""},
+            {"recipient_id": "1e3", "content": "Hi"},
+            {"recipient_id": True, "content": "Hi"},
+        ]:
+            await alice.send_json_to(
+                {"type": "chat_message", "message_id": "bad", **frame}
+            )
+            error = await alice.receive_json_from()
+            self.assertEqual((error["type"], error["old_message_id"]), ("error", "bad"))
+        self.assertEqual(await Message.objects.acount(), 3)
+        await alice.disconnect()
+        await bob.disconnect()
+
+
+class LoadTestHarnessTests(TransactionTestCase):
+    def test_small_run(self):
+        async_to_sync(presence.clear)()
+        pairs = create_load_test_users(4)
+        self.assertEqual(len(pairs), 2)
+        report = async_to_sync(run_load_test)(pairs, 3)
+        self.assertEqual(report["clients"], 4)
+        self.assertEqual(report["messages"], 12)
+        self.assertGreater(report["messages_per_second"], 0)
+        self.assertLessEqual(report["p50_ms"], report["p99_ms"])
+        self.assertEqual(Message.objects.count(), 12)
+        delete_load_test_users()
+        self.assertFalse(Chat.objects.exists())
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_negotiate(self):
+        self.assertIsInstance(negotiate(None), JSONProtocol)
+        self.assertIsInstance(negotiate(["graphql-ws"]), JSONProtocol)
+        protocol = negotiate(["graphql-ws", MSGPACK_SUBPROTOCOL])
+        self.assertIsInstance(protocol, MsgpackProtocol)
+        self.assertEqual(protocol.subprotocol, MSGPACK_SUBPROTOCOL)
+
+    def test_json(self):
+        protocol = JSONProtocol()
+        event = {"type": "typing", "sender_id": "1", "is_typing": True}
+        frame = protocol.encode(event)
+        self.assertEqual(json.loads(frame["text_data"]), event)
+        self.assertEqual(protocol.decode(frame["text_data"]), event)
+        for text_data in ["{", "[]", "1", '"x"']:
+            with self.assertRaises(ProtocolError):
+                protocol.decode(text_data)
+        with self.assertRaises(ProtocolError):
+            protocol.decode(bytes_data=b"{}")
+
+    def test_msgpack_short_codes(self):
+        protocol = MsgpackProtocol()
+        event = {"type": "typing", "sender_id": "1", "is_typing": True, "extra": 1}
+        frame = protocol.encode(event)["bytes_data"]
+        self.assertEqual(frame[0], RAW)
+        self.assertEqual(
+            msgpack.unpackb(frame[1:]), {"t": 14, "s": "1", "ty": True, "extra": 1}
+        )
+        self.assertLess(len(frame), len(json.dumps(event)) / 2)
+        self.assertEqual(protocol.decode(bytes_data=frame), event)
+
+    def test_msgpack_compressed(self):
+        protocol = MsgpackProtocol()
+        event = {"type": "chat_message", "message": "hello " * COMPRESS_MIN_SIZE}
+        frame = protocol.encode(event)["bytes_data"]
+        self.assertEqual(frame[0], DEFLATED)
+        self.assertLess(len(frame), COMPRESS_MIN_SIZE)
+        self.assertEqual(protocol.decode(bytes_data=frame), event)
+
+    def test_msgpack_bad_frames(self):
+        protocol = MsgpackProtocol()
+        for frame in [
+            b"",
+            b"\x07" + msgpack.packb({"t": 1}),
+            b"\x00\xc1",
+            bytes([RAW]) + msgpack.packb([1, 2]),
+            bytes([DEFLATED]) + b"not deflate",
+        ]:
+            with self.assertRaises(ProtocolError):
+                protocol.decode(bytes_data=frame)
+        with self.assertRaises(ProtocolError):
+            protocol.decode(text_data="{}")
+
+
+class MsgpackConsumerTests(ChatSocketTestCase):
+    async def test_binary_and_json_clients(self):
+        protocol = MsgpackProtocol()
+        bob = await self.open_socket(self.bob)
+        alice = await self.open_socket(
+            self.alice, subprotocols=[MSGPACK_SUBPROTOCOL], read_user_list=False
+        )
+        self.assertEqual(
+            protocol.decode(bytes_data=await alice.receive_from()),
+            {"type": "user_list", "users": [str(self.bob.id)]},
+        )
+        await bob.receive_json_from()  # Alice is online
+
+        await alice.send_to(
+            **protocol.encode(
+                {
+                    "type": "chat_message",
+                    "recipient_id": self.bob.id,
+                    "content": "Hello",
+                    "message_id": "temp-1",
+                }
+            )
+        )
+        self.assertEqual((await bob.receive_json_from())["message"], "Hello")
+        ack = protocol.decode(bytes_data=await alice.receive_from())
+        self.assertEqual(ack["type"], "message_delivery")
+        self.assertEqual(ack["old_message_id"], "temp-1")
+
+        await alice.send_to(text_data="{}")
+        self.assertEqual(
+            protocol.decode(bytes_data=await alice.receive_from())["type"], "error"
+        )
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_bad_frames_answered_with_errors(self):
+        alice = await self.open_socket(self.alice)
+        for text_data in ["[]", "1", '"x"', "{}", '{"type": "unknown"}']:
+            await alice.send_to(text_data=text_data)
+            self.assertEqual((await alice.receive_json_from())["type"], "error")
+
+        # The socket is still open
+        await alice.send_json_to(
+            {"type": "chat_message", "recipient_id": self.bob.id, "content": "Hi"}
+        )
+        self.assertEqual((await alice.receive_json_from())["type"], "message_delivery")
+        await alice.disconnect()
+
+
+class TypingStateTests(SimpleTestCase):
+    def run_typing(self, steps, min_interval=0.05, timeout=0.2):
+        """Run (delay, is_typing) steps for one chat, return what was sent"""
+        manager = TypingStateManager(min_interval=min_interval, timeout=timeout)
+        sent = []
+
+        async def notify(is_typing):
+            sent.append(is_typing)
+
+        async def run():
+            for delay, is_typing in steps:
+                await asyncio.sleep(delay)
+                manager.update(1, 2, is_typing, notify)
+            await asyncio.sleep(timeout + min_interval * 2)
+            return manager._states
+
+        states = async_to_sync(run)()
+        self.assertEqual(states, {})
+        return sent
+
+    def test_redundant_updates_dropped(self):
+        self.assertEqual(
+            self.run_typing([(0, True)] * 20 + [(0, False)]), [True, False]
+        )
+
+    def test_changes_coalesced(self):
+        # Stopped and started again within the interval: nothing to forward
+        self.assertEqual(
+            self.run_typing([(0, True), (0, False), (0, True), (0.1, False)]),
+            [True, False],
+        )
+        self.assertEqual(self.run_typing([(0, False), (0, False)]), [])
+
+    def test_timeout(self):
+        self.assertEqual(self.run_typing([(0, True), (0.1, True)]), [True, False])
+
+    def test_stop(self):
+        manager = TypingStateManager(min_interval=10, timeout=10)
+        sent = {}
+
+        def notifier(key):
+            async def notify(is_typing):
+                sent.setdefault(key, []).append(is_typing)
+
+            return notify
+
+        async def run():
+            for key in [(1, 2), (1, 3), (4, 2)]:
+                manager.update(*key, True, notifier(key))
+            await manager.stop(1)
+            await asyncio.sleep(0)
+            return set(manager._states)
+
+        self.assertEqual(async_to_sync(run)(), {(4, 2)})
+        self.assertEqual(
+            sent, {(1, 2): [True, False], (1, 3): [True, False], (4, 2): [True]}
+        )
+
+
+class TypingConsumerTests(ChatSocketTestCase):
+    async def test_keystrokes_forwarded_once(self):
+        bob = await self.open_socket(self.bob)
+        alice = await self.open_socket(self.alice)
+        await bob.receive_json_from()  # Alice is online
+
+        with patch.object(typing_state, "min_interval", 0.05):
+            for _ in range(10):
+                await alice.send_json_to(
+                    {
+                        "type": "typing_status",
+                        "is_typing": True,
+                        "recipient_id": self.bob.id,
+                        "chat_uuid": "chat",
+                    }
+                )
+            self.assertEqual(
+                await bob.receive_json_from(),
+                {
+                    "type": "typing",
+                    "sender_id": str(self.alice.id),
+                    "is_typing": True,
+                    "chat_uuid": "chat",
+                },
+            )
+            self.assertTrue(await bob.receive_nothing(0.1))
+
+            # Leaving stops the indicator at once
+            await alice.disconnect()
+            self.assertFalse((await bob.receive_json_from())["is_typing"])
+            self.assertEqual((await bob.receive_json_from())["type"], "status")
+        await bob.disconnect()
+
+
+class ReadWatermarkTests(ChatSocketTestCase):
+    # The consumer marks chats read from another thread
+    def setUp(self):
+        super().setUp()
+        self.chat, _ = Chat.objects.get_or_create_chat(self.alice, self.bob)
+        self.from_bob = [
+            Message.objects.create(chat=self.chat, sender=self.bob, content=str(i))
+            for i in range(3)
+        ]
+        self.from_alice = Message.objects.create(
+            chat=self.chat, sender=self.alice, content="Hi"
+        )
+
+    def test_mark_read(self):
+        self.assertEqual(ReadWatermark.objects.unread_count(self.chat, self.alice), 3)
+        self.assertEqual(ReadWatermark.objects.unread_count(self.chat, self.bob), 1)
+
+        with self.assertNumQueries(1):
+            last_read = ReadWatermark.objects.mark_read(
+                self.chat.id, self.alice.id, self.from_bob[1].id
+            )
+        self.assertEqual(last_read, self.from_bob[1].id)
+        self.assertEqual(ReadWatermark.objects.unread_count(self.chat, self.alice), 1)
+
+        # Up to the last message, then never back
+        with self.assertNumQueries(1):
+            last_read = ReadWatermark.objects.mark_read(self.chat.id, self.alice.id)
+        self.assertEqual(last_read, self.from_alice.id)
+        ReadWatermark.objects.mark_read(self.chat.id, self.alice.id, 1)
+        self.assertEqual(ReadWatermark.objects.count(), 1)
+        self.assertEqual(ReadWatermark.objects.unread_count(self.chat, self.alice), 0)
+
+        self.assertEqual(
+            ReadWatermark.objects.read_up_to(self.chat),
+            {self.bob.id: self.from_alice.id, self.alice.id: 0},
+        )
+        self.assertEqual(
+            dict(
+                Message.objects.annotate(read=is_read()).values_list("content", "read")
+            ),
+            {"0": True, "1": True, "2": True, "Hi": False},
+        )
+
+    def test_inbox_and_history(self):
+        ReadWatermark.objects.mark_read(self.chat.id, self.bob.id)
+        ReadWatermark.objects.mark_read(
+            self.chat.id, self.alice.id, self.from_bob[0].id
+        )
+        entry = self.client.get(
+            reverse("chat_inbox", kwargs={"user_id": self.alice.id})
+        ).json()["data"][0]
+        self.assertEqual(entry["unread_count"], 2)
+
+        data = self.client.get(
+            reverse("message_history", kwargs={"chat_uuid": self.chat.uuid})
+        ).json()
+        self.assertEqual(
+            [message["read"] for message in data["messages"]],
+            [True, False, False, True],
+        )
+
+    async def test_consumer_marks_read(self):
+        bob = await self.open_socket(self.bob)
+        alice = await self.open_socket(self.alice)
+        await bob.receive_json_from()  # Alice is online
+
+        await alice.send_json_to(
+            {
+                "type": "mark_messages_read",
+                "chat_uuid": str(self.chat.uuid),
+                "sender_id": self.bob.id,
+                "current_user_id": self.alice.id,
+            }
+        )
+        self.assertEqual(
+            await bob.receive_json_from(),
+            {
+                "type": "messages_read",
+                "chat_uuid": str(self.chat.uuid),
+                "reader_id": self.alice.id,
+            },
+        )
+        self.assertEqual(
+            await ReadWatermark.objects.filter(user=self.alice).acount(), 1
+        )
+        await alice.disconnect()
+        await bob.disconnect()
@@ -0,0 +1,104 @@
+"""
+Typing indicators
+
+Clients send a typing_status frame every few keystrokes. TypingStateManager
+keeps, per chat and sender, whether the sender is typing and forwards only
+the changes, at most one every MIN_INTERVAL seconds: a change that comes
+sooner waits for the end of the interval and is dropped if it was undone
+meanwhile. A sender who sends no typing frame for TYPING_TIMEOUT seconds is
+announced as stopped, so a closed tab or a lost "is_typing": False does not
+leave the indicator on.
+"""
+
+import asyncio
+
+MIN_INTERVAL = 1.0  # seconds
+TYPING_TIMEOUT = 5.0
+
+
+class TypingStateManager:
+    def __init__(self, min_interval=MIN_INTERVAL, timeout=TYPING_TIMEOUT):
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._reset(None)
+
+    def _reset(self, loop):
+        self._loop = loop
+        # (sender id, chat id) -> state dict
+        self._states = {}
+
+    def update(self, sender_id, chat_id, is_typing, notify):
+        """
+        Record whether sender_id is typing in chat_id
+
+        notify(is_typing) is awaited for each change that is forwarded, the
+        last one given for the chat is used.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+        key = (sender_id, chat_id)
+        state = self._states.get(key)
+        if state is None:
+            if not is_typing:
+                return
+            state = self._states[key] = {
+                "typing": False,
+                "sent": False,
+                "timer": None,
+                "expiry": None,
+                "task": None,
+            }
+        state["notify"] = notify
+        if state["expiry"] is not None:
+            state["expiry"].cancel()
+            state["expiry"] = None
+        if is_typing:
+            state["expiry"] = loop.call_later(self.timeout, self._expire, key)
+        state["typing"] = is_typing
+        # A change within the interval is picked up when the timer fires
+        if state["timer"] is None:
+            self._flush(key)
+
+    async def stop(self, sender_id):
+        """Announce that sender_id stopped typing everywhere, now"""
+        for key in [key for key in self._states if key[0] == sender_id]:
+            state = self._states.pop(key)
+            for handle in (state["timer"], state["expiry"]):
+                if handle is not None:
+                    handle.cancel()
+            if state["sent"]:
+                await self._notify(state["notify"], False, state["task"])
+
+    def _expire(self, key):
+        state = self._states[key]
+        state["expiry"] = None
+        state["typing"] = False
+        if state["timer"] is None:
+            self._flush(key)
+
+    def _flush(self, key):
+        state = self._states[key]
+        state["timer"] = None
+        if state["typing"] == state["sent"]:
+            if not state["typing"]:
+                del self._states[key]
+            return
+        state["sent"] = state["typing"]
+        state["task"] = asyncio.ensure_future(
+            self._notify(state["notify"], state["sent"], state["task"])
+        )
+        # Nothing else is sent for this chat until the timer fires
+        state["timer"] = self._loop.call_later(self.min_interval, self._flush, key)
+
+    async def _notify(self, notify, is_typing, previous):
+        # The recipient must get the changes in order
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await notify(is_typing)
+        except Exception as e:
+            print(f"Error sending typing status: {str(e)}")
+
+
+typing_state = TypingStateManager()
@@ -7,6 +7,8 @@ urlpatterns = [
         views.get_mutual_follows_with_chats,
         name="get_mutual_follows_with_chats",
     ),
+    path("<int:user_id>/inbox/", views.inbox, name="chat_inbox"),
+    path("<uuid:chat_uuid>/messages/", views.message_history, name="message_history"),
     path(
         "<uuid:chat_uuid>/read/<int:sender_id>/",
         views.read_user_messages,
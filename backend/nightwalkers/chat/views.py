@@ -4,7 +4,14 @@ from chat.serializers import MessageSerializer  # You'll need to create this
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.core.exceptions import ObjectDoesNotExist
-from chat.models import Chat, Message
+from chat.models import Chat, Message, ReadWatermark
+from chat.inbox import (
+    MAX_MESSAGE_PAGE_SIZE,
+    MESSAGE_PAGE_SIZE,
+    inbox_queryset,
+    message_page,
+    serialize_inbox_entry,
+)
 
 User = get_user_model()
 
@@ -25,19 +32,27 @@ def get_mutual_follows_with_chats(request, user_id):
             chat, created = Chat.objects.get_or_create_chat(current_user, user)
 
             # Get last 10 messages (or whatever limit you want)
-            messages = Message.objects.filter(chat=chat).order_by("timestamp")
+            messages = (
+                Message.objects.filter(chat=chat)
+                .select_related("sender")
+                .order_by("timestamp")
+            )
 
             serializer = UserSerializer(user)
-            message_serializer = MessageSerializer(messages, many=True)
+            message_serializer = MessageSerializer(
+                messages,
+                many=True,
+                context={"read_up_to": ReadWatermark.objects.read_up_to(chat)},
+            )
 
             response_data.append(
                 {
                     "user": serializer.data,
                     "chat_uuid": str(chat.uuid),
                     "messages": message_serializer.data,
-                    "unread_count": Message.objects.filter(chat=chat, read=False)
-                    .exclude(sender=current_user)
-                    .count(),
+                    "unread_count": ReadWatermark.objects.unread_count(
+                        chat, current_user
+                    ),
                 }
             )
 
@@ -49,6 +64,88 @@ def get_mutual_follows_with_chats(request, user_id):
         return JsonResponse({"error": f"Server error: {str(e)}"}, status=500)
 
 
+def inbox(request, user_id):
+    """
+    Chat list of a user: their mutual follows with the last message and the
+    unread count of their chat, most recent first
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        page = int(request.GET.get("page", 1))
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return JsonResponse({"error": "page and limit must be integers"}, status=400)
+    if page < 1 or not 1 <= limit <= 100:
+        return JsonResponse(
+            {"error": "page must be at least 1 and limit between 1 and 100"},
+            status=400,
+        )
+
+    try:
+        current_user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return JsonResponse({"error": "User not found"}, status=404)
+
+    offset = (page - 1) * limit
+    contacts = list(inbox_queryset(current_user)[offset : offset + limit + 1])
+    return JsonResponse(
+        {
+            "data": [serialize_inbox_entry(contact) for contact in contacts[:limit]],
+            "has_more": len(contacts) > limit,
+        },
+        status=200,
+    )
+
+
+def message_history(request, chat_uuid):
+    """
+    Messages of a chat, newest page first
+
+    Query params: before (message id, only older messages), limit
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        before = request.GET.get("before")
+        before = int(before) if before else None
+        limit = int(request.GET.get("limit", MESSAGE_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "before and limit must be integers"}, status=400)
+    if not 1 <= limit <= MAX_MESSAGE_PAGE_SIZE:
+        return JsonResponse(
+            {"error": f"limit must be between 1 and {MAX_MESSAGE_PAGE_SIZE}"},
+            status=400,
+        )
+
+    try:
+        chat = Chat.objects.get(uuid=chat_uuid)
+    except Chat.DoesNotExist:
+        return JsonResponse({"error": "Chat not found"}, status=404)
+
+    messages, has_more = message_page(chat, before, limit)
+    read_up_to = ReadWatermark.objects.read_up_to(chat)
+    return JsonResponse(
+        {
+            "messages": [
+                {
+                    "id": message.id,
+                    "sender_id": message.sender_id,
+                    "content": message.content,
+                    "timestamp": message.timestamp,
+                    "read": message.id <= read_up_to.get(message.sender_id, 0),
+                    "is_deleted": message.is_deleted,
+                }
+                for message in messages
+            ],
+            "has_more": has_more,
+            # Pass as before to get the previous page
+            "next_before": messages[0].id if has_more else None,
+        },
+        status=200,
+    )
+
+
 @csrf_exempt
 def read_user_messages(request, chat_uuid, sender_id):
     if request.method != "POST":
@@ -57,10 +154,15 @@ def read_user_messages(request, chat_uuid, sender_id):
     try:
         # Verify the chat exists and involves the current user
         chat = Chat.objects.get(uuid=chat_uuid)
-        # get sender user from sender_id
-        sender = User.objects.get(id=sender_id)
-        # Mark unread messages from this sender as read
-        Message.objects.filter(chat=chat, sender=sender, read=False).update(read=True)
+        # The reader is the other user of the chat
+        if sender_id == chat.user1_id:
+            reader_id = chat.user2_id
+        elif sender_id == chat.user2_id:
+            reader_id = chat.user1_id
+        else:
+            return JsonResponse({"error": "Sender not in chat"}, status=400)
+        # Move the reader's watermark to the last message
+        ReadWatermark.objects.mark_read(chat.id, reader_id)
 
         return JsonResponse(
             {
@@ -1,15 +1,15 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from django.db.models import Count
 from .models import Post, Comment, Like, CommentLike, ReportPost, ReportComment
+from .search import admin_search
 
 
 class CommentInline(admin.TabularInline):
     model = Comment
     extra = 0
-    readonly_fields = ("content_preview", "user_link", "date_created", "replies_count")
-    fields = ("content_preview", "user_link", "date_created", "replies_count")
+    readonly_fields = ("content_preview", "user_link", "date_created", "replies_total")
+    fields = ("content_preview", "user_link", "date_created", "replies_total")
     show_change_link = True
     can_delete = False
 
@@ -26,13 +26,13 @@ class CommentInline(admin.TabularInline):
 
     user_link.short_description = "User"
 
-    def replies_count(self, obj):
-        count = obj.replies.count()
+    def replies_total(self, obj):
+        count = obj.replies_count
         if count > 0:
             return format_html('<span style="color: #8e44ad;">{}</span>', count)
         return format_html('<span style="color: #7f8c8d;">0</span>')
 
-    replies_count.short_description = "Replies"
+    replies_total.short_description = "Replies"
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -86,8 +86,8 @@ class PostAdmin(admin.ModelAdmin):
         "content_preview",
         "user_link",
         "image_count",
-        "comments_count",
-        "likes_count",
+        "comments_total",
+        "likes_total",
         "date_created",
     )
     list_filter = (
@@ -101,20 +101,18 @@ class PostAdmin(admin.ModelAdmin):
         "date_updated",
         "user_link",
         "image_display",
-        "comments_count",
-        "likes_count",
+        "comments_total",
+        "likes_total",
         "original_post_link",
         "reposted_by_link",
     )
     inlines = [CommentInline, LikeInline, ReportPostInline]
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            comments_count=Count("comments", distinct=True),
-            likes_count=Count("likes", distinct=True),
-        )
-        return queryset
+    def get_search_results(self, request, queryset, search_term):
+        # The search_vector GIN index instead of icontains on every column
+        if not search_term.strip():
+            return queryset, False
+        return admin_search(queryset, search_term), False
 
     def post_type_badge(self, obj):
         if obj.is_repost:
@@ -152,29 +150,23 @@ class PostAdmin(admin.ModelAdmin):
 
     image_count.short_description = "Images"
 
-    def comments_count(self, obj):
-        if hasattr(obj, "comments_count"):
-            count = obj.comments_count
-        else:
-            count = obj.comments.count()
+    def comments_total(self, obj):
+        count = obj.comments_count
         if count > 0:
             return format_html('<span style="color: #2980b9;">{}</span>', count)
         return format_html('<span style="color: #7f8c8d;">0</span>')
 
-    comments_count.short_description = "Comments"
-    comments_count.admin_order_field = "-comments_count"
+    comments_total.short_description = "Comments"
+    comments_total.admin_order_field = "-comments_count"
 
-    def likes_count(self, obj):
-        if hasattr(obj, "likes_count"):
-            count = obj.likes_count
-        else:
-            count = obj.likes.count()
+    def likes_total(self, obj):
+        count = obj.likes_count
         if count > 0:
             return format_html('<span style="color: #c0392b;">{}</span>', count)
         return format_html('<span style="color: #7f8c8d;">0</span>')
 
-    likes_count.short_description = "Likes"
-    likes_count.admin_order_field = "-likes_count"
+    likes_total.short_description = "Likes"
+    likes_total.admin_order_field = "-likes_count"
 
     def image_display(self, obj):
         if not obj.image_urls:
@@ -219,7 +211,7 @@ class PostAdmin(admin.ModelAdmin):
     fieldsets = (
         (
             "Post Content",
-            {"fields": ("content", "image_display", "comments_count", "likes_count")},
+            {"fields": ("content", "image_display", "comments_total", "likes_total")},
         ),
         ("Post Information", {"fields": ("user_link", "date_created", "date_updated")}),
         (
@@ -309,8 +301,8 @@ class CommentAdmin(admin.ModelAdmin):
         "content_preview",
         "user_link",
         "post_link",
-        "replies_count",
-        "likes_count",
+        "replies_total",
+        "likes_total",
         "date_created",
     )
     list_filter = (
@@ -331,18 +323,16 @@ class CommentAdmin(admin.ModelAdmin):
         "user_link",
         "post_link",
         "parent_comment_link",
-        "replies_count",
-        "likes_count",
+        "replies_total",
+        "likes_total",
     )
     inlines = [ReplyInline, CommentLikeInline, ReportCommentInline]
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            replies_count=Count("replies", distinct=True),
-            likes_count=Count("comment_likes", distinct=True),
-        )
-        return queryset
+    def get_search_results(self, request, queryset, search_term):
+        # The search_vector GIN index instead of icontains on every column
+        if not search_term.strip():
+            return queryset, False
+        return admin_search(queryset, search_term), False
 
     def comment_type_badge(self, obj):
         if obj.parent_comment:
@@ -396,32 +386,26 @@ class CommentAdmin(admin.ModelAdmin):
 
     parent_comment_link.short_description = "Parent Comment"
 
-    def replies_count(self, obj):
-        if hasattr(obj, "replies_count"):
-            count = obj.replies_count
-        else:
-            count = obj.replies.count()
+    def replies_total(self, obj):
+        count = obj.replies_count
         if count > 0:
             return format_html('<span style="color: #8e44ad;">{}</span>', count)
         return format_html('<span style="color: #7f8c8d;">0</span>')
 
-    replies_count.short_description = "Replies"
-    replies_count.admin_order_field = "-replies_count"
+    replies_total.short_description = "Replies"
+    replies_total.admin_order_field = "-replies_count"
 
-    def likes_count(self, obj):
-        if hasattr(obj, "likes_count"):
-            count = obj.likes_count
-        else:
-            count = obj.comment_likes.count()
+    def likes_total(self, obj):
+        count = obj.likes_count
         if count > 0:
             return format_html('<span style="color: #c0392b;">{}</span>', count)
         return format_html('<span style="color: #7f8c8d;">0</span>')
 
-    likes_count.short_description = "Likes"
-    likes_count.admin_order_field = "-likes_count"
+    likes_total.short_description = "Likes"
+    likes_total.admin_order_field = "-likes_count"
 
     fieldsets = (
-        ("Comment Content", {"fields": ("content", "likes_count", "replies_count")}),
+        ("Comment Content", {"fields": ("content", "likes_total", "replies_total")}),
         (
             "Comment Information",
             {"fields": ("user_link", "date_created", "date_updated")},
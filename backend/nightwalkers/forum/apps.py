@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ForumConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "forum"
+
+    def ready(self):
+        # Keeps the denormalized likes/comments/replies counters up to date
+        from . import signals  # noqa: F401
@@ -0,0 +1,60 @@
+"""
+Comment threads stored as materialized paths
+
+Comment.path is the ids of the comment's ancestors and its own, each zero
+padded to COMMENT_PATH_DIGITS: "0000000012" is top level comment 12 and
+"00000000120000000034" its reply 34. Sorting a post's comments by path lists
+every thread depth first, and a subtree is a path prefix: both are range
+scans of the (post, path) index. Comments never change parent, so a path is
+set once, right after the comment is inserted (Comment.save).
+"""
+
+from .models import Comment
+
+
+def thread_queryset(post_id, root=None, max_depth=None):
+    """
+    Comments of a post, or of the subtree of root, in thread order
+
+    Args:
+        post_id (int): The post
+        root (Comment): Only return this comment and its replies
+        max_depth (int): Number of levels to return, all of them if None
+
+    Returns:
+        QuerySet: Comments ordered by path
+    """
+    comments = Comment.objects.filter(post_id=post_id)
+    top_depth = 0
+    if root is not None:
+        comments = comments.filter(path__startswith=root.path)
+        top_depth = root.depth
+    if max_depth is not None:
+        comments = comments.filter(depth__lt=top_depth + max_depth)
+    return comments.select_related("user").order_by("path")
+
+
+def build_tree(comments, serialize):
+    """
+    Nest comments sorted by path under their parents
+
+    Args:
+        comments (iterable): Comments in path order
+        serialize (callable): Comment to dict, the "replies" key is added
+
+    Returns:
+        list: Dicts of the top comments, replies nested in "replies"
+    """
+    nodes = {}
+    roots = []
+    for comment in comments:
+        node = serialize(comment)
+        node["replies"] = []
+        nodes[comment.id] = node
+        parent = nodes.get(comment.parent_comment_id)
+        # Parents come first in path order, the first comment is a root
+        if parent is None:
+            roots.append(node)
+        else:
+            parent["replies"].append(node)
+    return roots
@@ -0,0 +1,58 @@
+"""
+Denormalized engagement counters
+
+Post.likes_count, Post.comments_count, Comment.likes_count and
+Comment.replies_count are kept current by the signal handlers in
+forum/signals.py with single-row F() updates. reconcile_counters()
+recomputes them from the related tables to repair any drift (bulk
+operations, raw SQL, restored backups).
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Post, Comment, Like, CommentLike
+
+# (model, counter field, related model, foreign key of the related model)
+COUNTERS = [
+    (Post, "likes_count", Like, "post"),
+    (Post, "comments_count", Comment, "post"),
+    (Comment, "likes_count", CommentLike, "comment"),
+    (Comment, "replies_count", Comment, "parent_comment"),
+]
+
+
+def actual_count(related_model, foreign_key):
+    """Count of related rows pointing at the outer row, computed in SQL"""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def reconcile_counters(dry_run=False):
+    """
+    Fix the counters that do not match the related tables
+
+    Returns:
+        dict: Number of drifted rows by "Model.field"
+    """
+    drifted = {}
+    for model, field, related_model, foreign_key in COUNTERS:
+        actual = actual_count(related_model, foreign_key)
+        rows = (
+            model.objects.annotate(actual=actual)
+            .exclude(**{field: F("actual")})
+            .values_list("pk", flat=True)
+        )
+        ids = list(rows)
+        drifted[f"{model.__name__}.{field}"] = len(ids)
+        if ids and not dry_run:
+            model.objects.filter(pk__in=ids).update(**{field: actual})
+    return drifted
@@ -0,0 +1,131 @@
+import base64
+from datetime import datetime
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
+from accounts.models import Follow
+from .models import Post, Comment, Like, ReportPost
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(post):
+    """Opaque position of a post in the feed order (date_created, id)"""
+    return encode_position(post.date_created, post.id)
+
+
+def encode_position(date_created, post_id):
+    raw = f"{date_created.isoformat()}|{post_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (date_created, id) of the last post of the previous page
+    """
+    try:
+        date_created, post_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return datetime.fromisoformat(date_created), int(post_id)
+    except (ValueError, UnicodeError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+def feed_queryset(user, settings_type=""):
+    """
+    Posts of a feed in display order, reposts resolved in SQL
+
+    A repost stands for its original post (the view shows the original's
+    content and stored likes/comments counts). In the home feed, reposts of
+    authors the viewer follows are hidden (they see the original already),
+    and an original post shows up only once, as its most recent repost, or
+    as itself if nobody reposted it. The profile tabs keep all their rows.
+
+    Args:
+        user (User): The viewer
+        settings_type (str): "" for everything, or the profile tab to show
+
+    Returns:
+        QuerySet: Posts ordered by (-date_created, -id), None for an unknown
+        settings_type
+    """
+    posts = Post.objects.all()
+    if settings_type == "posts":
+        posts = posts.filter(user=user, is_repost=False)
+    elif settings_type == "reactions":
+        # show all the post user has liked
+        posts = posts.filter(
+            Exists(Like.objects.filter(post=OuterRef("pk"), user=user))
+        )
+    elif settings_type == "reports":
+        # show all the post user has reported
+        posts = posts.filter(
+            Exists(ReportPost.objects.filter(post=OuterRef("pk"), reporting_user=user))
+        )
+    elif settings_type == "comments":
+        # posts where user has commented
+        posts = posts.filter(
+            Exists(Comment.objects.filter(post=OuterRef("pk"), user=user))
+        )
+    elif settings_type == "flagged_posts":
+        # posts made by user that have been reported
+        posts = posts.filter(
+            Exists(ReportPost.objects.filter(post=OuterRef("pk"))), user=user
+        )
+    elif settings_type != "":
+        return None
+
+    # A repost whose original was deleted has nothing to show
+    posts = posts.exclude(is_repost=True, original_post__isnull=True)
+    if settings_type != "":
+        # The profile tabs show every row selected above
+        return posts.select_related(
+            "user", "original_post__user", "reposted_by"
+        ).order_by("-date_created", "-id")
+
+    followed = Follow.objects.filter(main_user=user).values("following_user_id")
+    # Newer reposts of the same original that the viewer gets to see
+    newer_reposts = (
+        Post.objects.filter(is_repost=True, original_post_id=OuterRef("shown_post_id"))
+        .filter(
+            Q(date_created__gt=OuterRef("date_created"))
+            | Q(date_created=OuterRef("date_created"), id__gt=OuterRef("id"))
+        )
+        .exclude(original_post__user_id__in=followed)
+    )
+
+    return (
+        posts.exclude(is_repost=True, original_post__user_id__in=followed)
+        .annotate(shown_post_id=Coalesce("original_post_id", "id"))
+        .exclude(Exists(newer_reposts))
+        .select_related("user", "original_post__user", "reposted_by")
+        .order_by("-date_created", "-id")
+    )
+
+
+def get_page(posts, limit, cursor=None, offset=0):
+    """
+    One page of a feed queryset
+
+    With a cursor the page starts right after the cursor's post (an indexed
+    range scan whatever the depth), offset is only kept for older clients.
+
+    Returns:
+        tuple: (list of posts, next page cursor or None if it was the last)
+    """
+    if cursor:
+        date_created, post_id = decode_cursor(cursor)
+        posts = posts.filter(
+            Q(date_created__lt=date_created)
+            | Q(date_created=date_created, id__lt=post_id)
+        )
+        page = list(posts[: limit + 1])
+    else:
+        page = list(posts[offset : offset + limit + 1])
+
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from forum.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized likes/comments/replies counters of posts "
+        "and comments and fix the ones that drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the drifted counters",
+        )
+
+    def handle(self, *args, **options):
+        drifted = reconcile_counters(dry_run=options["dry_run"])
+        verb = "drifted" if options["dry_run"] else "fixed"
+        for counter, rows in drifted.items():
+            self.stdout.write(f"{counter}: {rows} row(s) {verb}")
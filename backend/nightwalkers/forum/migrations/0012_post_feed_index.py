@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0011_reportcomment_reason"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["-date_created", "-id"], name="forum_post_feed_idx"
+            ),
+        ),
+    ]
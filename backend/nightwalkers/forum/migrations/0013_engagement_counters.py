@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:07
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model("forum", "Post")
+    Comment = apps.get_model("forum", "Comment")
+    Like = apps.get_model("forum", "Like")
+    CommentLike = apps.get_model("forum", "CommentLike")
+
+    def count(model, foreign_key):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(**{foreign_key: OuterRef("pk")})
+                .order_by()
+                .values(foreign_key)
+                .annotate(total=Count("pk"))
+                .values("total"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Post.objects.update(
+        likes_count=count(Like, "post"), comments_count=count(Comment, "post")
+    )
+    Comment.objects.update(
+        likes_count=count(CommentLike, "comment"),
+        replies_count=count(Comment, "parent_comment"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0012_post_feed_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="likes_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="replies_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="likes_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
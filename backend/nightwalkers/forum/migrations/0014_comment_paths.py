@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Paths of the existing comments, parents before their replies
+FILL_PATHS = """
+WITH RECURSIVE tree AS (
+    SELECT id, LPAD(id::text, 10, '0') AS path, 0 AS depth
+    FROM forum_comment
+    WHERE parent_comment_id IS NULL
+    UNION ALL
+    SELECT c.id, t.path || LPAD(c.id::text, 10, '0'), t.depth + 1
+    FROM forum_comment AS c
+    JOIN tree AS t ON c.parent_comment_id = t.id
+)
+UPDATE forum_comment
+SET path = tree.path, depth = tree.depth
+FROM tree
+WHERE forum_comment.id = tree.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0013_engagement_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.TextField(db_collation="C", default="", editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["post", "path"], name="forum_comment_path_idx"),
+        ),
+        migrations.RunSQL(FILL_PATHS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# Keep search_vector in sync with the text on every insert/update, then fill
+# it for the existing rows (the UPDATE fires the triggers)
+POST_TRIGGER = """
+CREATE FUNCTION forum_post_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER forum_post_search_vector_update
+BEFORE INSERT OR UPDATE OF title, content ON forum_post
+FOR EACH ROW EXECUTE FUNCTION forum_post_search_vector();
+
+UPDATE forum_post SET title = title;
+"""
+
+COMMENT_TRIGGER = """
+CREATE FUNCTION forum_comment_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', coalesce(NEW.content, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER forum_comment_search_vector_update
+BEFORE INSERT OR UPDATE OF content ON forum_comment
+FOR EACH ROW EXECUTE FUNCTION forum_comment_search_vector();
+
+UPDATE forum_comment SET content = content;
+"""
+
+DROP_POST_TRIGGER = """
+DROP TRIGGER IF EXISTS forum_post_search_vector_update ON forum_post;
+DROP FUNCTION IF EXISTS forum_post_search_vector();
+"""
+
+DROP_COMMENT_TRIGGER = """
+DROP TRIGGER IF EXISTS forum_comment_search_vector_update ON forum_comment;
+DROP FUNCTION IF EXISTS forum_comment_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0014_comment_paths"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="forum_comment_search_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="forum_post_search_idx"
+            ),
+        ),
+        migrations.RunSQL(POST_TRIGGER, DROP_POST_TRIGGER),
+        migrations.RunSQL(COMMENT_TRIGGER, DROP_COMMENT_TRIGGER),
+    ]
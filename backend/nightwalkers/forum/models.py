@@ -3,6 +3,8 @@ from django.conf import settings
 from django.contrib.postgres.fields import (
     ArrayField,
 )  # For storing image URLs as an array
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 
 class Post(models.Model):
@@ -39,6 +41,13 @@ class Post(models.Model):
         help_text="The user who reposted this post",
     )
 
+    # Denormalized counters, kept up to date by forum/signals.py
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+
+    # Weighted title + content, filled by a database trigger (forum/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     def __str__(self):
         if self.is_repost:
             return f"Repost by {self.reposted_by.get_full_name()} \
@@ -47,6 +56,15 @@ class Post(models.Model):
 
     class Meta:
         ordering = ["-date_created"]  # Orders posts by most recent first
+        indexes = [
+            # Keyset pagination of the feed (see forum/feed.py)
+            models.Index(fields=["-date_created", "-id"], name="forum_post_feed_idx"),
+            GinIndex(fields=["search_vector"], name="forum_post_search_idx"),
+        ]
+
+
+# Width of each comment id in Comment.path (see forum/comment_tree.py)
+COMMENT_PATH_DIGITS = 10
 
 
 class Comment(models.Model):
@@ -61,11 +79,40 @@ class Comment(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    # Denormalized counters, kept up to date by forum/signals.py
+    likes_count = models.IntegerField(default=0)
+    replies_count = models.IntegerField(default=0)
+
+    # Ids of the ancestors and of the comment itself, see forum/comment_tree.py
+    # (C collation: byte order, prefix searches can use the index)
+    path = models.TextField(default="", editable=False, db_collation="C")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Content, filled by a database trigger (forum/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     def __str__(self):
         return f"Comment by {self.user.get_full_name()} on {self.post.content}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            # The path ends with the id, known only once inserted
+            parent_path, depth = "", 0
+            if self.parent_comment_id:
+                parent_path = self.parent_comment.path
+                depth = self.parent_comment.depth + 1
+            self.path = parent_path + str(self.pk).zfill(COMMENT_PATH_DIGITS)
+            self.depth = depth
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=depth)
+
     class Meta:
         ordering = ["date_created"]  # Orders comments by oldest first
+        indexes = [
+            # Threads and subtrees in path order (forum/comment_tree.py)
+            models.Index(fields=["post", "path"], name="forum_comment_path_idx"),
+            GinIndex(fields=["search_vector"], name="forum_comment_search_idx"),
+        ]
 
 
 class ReportComment(models.Model):
@@ -0,0 +1,87 @@
+"""
+Full-text search of posts and comments, name search of users
+
+Post.search_vector (title weighted above content) and Comment.search_vector
+are tsvectors kept current by database triggers (migration 0015) and GIN
+indexed, so a search is an index lookup followed by ranking the matches.
+Names are matched with icontains, which PostgreSQL runs as
+UPPER(column::text) LIKE UPPER(pattern): the trigram indexes of accounts_user
+are built on that expression (accounts migration 0013) and serve it where
+pg_trgm is installed.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
+from .models import Post, Comment
+
+User = get_user_model()
+
+SEARCH_CONFIG = "english"
+SEARCH_TYPES = ("posts", "comments", "users")
+
+# Longer input is cut, it only makes the queries slower
+MAX_SEARCH_LENGTH = 200
+MAX_NAME_TERMS = 5
+
+
+def search_query(text):
+    """Web search syntax: words, "quoted phrases", or, -excluded"""
+    return SearchQuery(
+        text[:MAX_SEARCH_LENGTH], config=SEARCH_CONFIG, search_type="websearch"
+    )
+
+
+def search_posts(text):
+    """Original posts matching text, best match first"""
+    query = search_query(text)
+    return (
+        Post.objects.filter(is_repost=False, search_vector=query)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .select_related("user")
+        .order_by("-rank", "-date_created", "-id")
+    )
+
+
+def search_comments(text):
+    """Comments matching text, best match first"""
+    query = search_query(text)
+    return (
+        Comment.objects.filter(search_vector=query)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .select_related("user")
+        .order_by("-rank", "-date_created", "-id")
+    )
+
+
+def matching_users(text, users=None, email=False):
+    """
+    Users whose first or last name contains every word, or their email with
+    email=True, for staff only: emails must not be probed from public search
+    """
+    users = User.objects.all() if users is None else users
+    for term in text[:MAX_SEARCH_LENGTH].split()[:MAX_NAME_TERMS]:
+        match = Q(first_name__icontains=term) | Q(last_name__icontains=term)
+        if email:
+            match |= Q(email__icontains=term)
+        users = users.filter(match)
+    return users
+
+
+def search_users(text):
+    """Active users whose name matches text, most karma first"""
+    return matching_users(
+        text, User.objects.filter(is_active=True).exclude(is_banned=True)
+    ).order_by("-karma", "id")
+
+
+def admin_search(queryset, search_term, user_field="user"):
+    """
+    Admin changelist search through the search index instead of icontains
+
+    Matches the text of the rows, or the name/email of their user.
+    """
+    return queryset.filter(
+        Q(search_vector=search_query(search_term))
+        | Q(**{f"{user_field}__in": matching_users(search_term, email=True)})
+    )
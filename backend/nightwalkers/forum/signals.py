@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import Follow
+from .models import Post, Comment, Like, CommentLike, ReportPost
+from .timeline import push_post, remove_post, timelines
+from .viewer_state import invalidate_viewer_state
+
+
+def add_to_counter(model, pk, field, amount):
+    """Atomic in-database increment, never a read-modify-write"""
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**{field: F(field) + amount})
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        add_to_counter(Post, instance.post_id, "likes_count", 1)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    add_to_counter(Post, instance.post_id, "likes_count", -1)
+
+
+@receiver(post_save, sender=CommentLike)
+def comment_like_created(sender, instance, created, **kwargs):
+    if created:
+        add_to_counter(Comment, instance.comment_id, "likes_count", 1)
+
+
+@receiver(post_delete, sender=CommentLike)
+def comment_like_deleted(sender, instance, **kwargs):
+    add_to_counter(Comment, instance.comment_id, "likes_count", -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        add_to_counter(Post, instance.post_id, "comments_count", 1)
+        add_to_counter(Comment, instance.parent_comment_id, "replies_count", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Replies deleted in cascade come through here one by one as well
+    add_to_counter(Post, instance.post_id, "comments_count", -1)
+    add_to_counter(Comment, instance.parent_comment_id, "replies_count", -1)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        # Timelines are read outside the transaction, push once it is visible
+        transaction.on_commit(lambda: push_post(instance))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: remove_post(instance))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    # Which reposts the viewer gets depends on who they follow
+    timelines.drop(instance.main_user_id)
+    invalidate_viewer_state(instance.main_user_id)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=ReportPost)
+@receiver(post_delete, sender=ReportPost)
+def viewer_state_changed(sender, instance, **kwargs):
+    invalidate_viewer_state(
+        instance.reporting_user_id if sender is ReportPost else instance.user_id
+    )
@@ -1,7 +1,15 @@
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.db import connection
 from django.contrib.auth import get_user_model
 from .models import Post, Like, Comment, ReportPost, CommentLike, ReportComment
+from .search import admin_search, matching_users
+from .timeline import timelines
+from . import timeline
 import json
+from io import StringIO
+from unittest.mock import patch
 from django.urls import reverse
 
 # imporT follow model
@@ -122,11 +130,12 @@ class CreatePostTests(TestCase):
             "post_id": self.existing_post.id,
         }
 
-        response = self.client.post(
-            reverse("create_post"),
-            data=json.dumps(edit_data),
-            content_type="application/json",
-        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("create_post"),
+                data=json.dumps(edit_data),
+                content_type="application/json",
+            )
 
         data = self.parse_response(response)
         self.existing_post.refresh_from_db()
@@ -135,6 +144,9 @@ class CreatePostTests(TestCase):
         # Your view doesn't update title during edit
         self.assertEqual(data["title"], "Test Post")
         self.assertEqual(self.existing_post.content, "Updated content")
+        # The counters are left to the signals
+        (update,) = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertNotIn("count", update)
 
     def test_edit_post_different_user(self):
         other_user = User.objects.create_user(
@@ -469,6 +481,7 @@ class GetUserDataTests(TestCase):
 
 class GetPostsTests(TestCase):
     def setUp(self):
+        timelines.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             email="test@example.com",
@@ -602,6 +615,226 @@ class GetPostsTests(TestCase):
     #         self.assertEqual(repost_data["original_post_id"], self.post1.id)
     #         self.assertEqual(repost_data["reposted_by"]["id"], self.other_user.id)
 
+    def test_get_posts_cursor_pagination(self):
+        for i in range(3, 8):
+            Post.objects.create(
+                user=self.user, title=f"Post {i}", content=f"Content {i}"
+            )
+
+        seen = []
+        params = {"user_id": self.user.id, "limit": 3}
+        while True:
+            data = self.parse_response(self.client.get(reverse("get_posts"), params))
+            seen.extend(post["id"] for post in data["posts"])
+            if not data["has_more"]:
+                self.assertIsNone(data["next_cursor"])
+                break
+            params["cursor"] = data["next_cursor"]
+
+        expected = list(
+            Post.objects.order_by("-date_created", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_get_posts_invalid_cursor(self):
+        response = self.client.get(
+            reverse("get_posts"), {"user_id": self.user.id, "cursor": "not-a-cursor"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_posts_repost_dedup(self):
+        third_user = User.objects.create_user(
+            email="third@example.com",
+            password="testpass123",
+            first_name="Third",
+            last_name="User",
+        )
+        # post1's author is not followed by other_user: their feed shows the
+        # most recent repost instead of the original
+        older_repost = Post.objects.create(
+            user=third_user,
+            is_repost=True,
+            original_post=self.post1,
+            reposted_by=third_user,
+            title="",
+            content=self.post1.content,
+        )
+        newer_repost = Post.objects.create(
+            user=self.other_user,
+            is_repost=True,
+            original_post=self.post1,
+            reposted_by=self.other_user,
+            title="",
+            content=self.post1.content,
+        )
+        Comment.objects.create(user=third_user, post=self.post1, content="Again")
+
+        data = self.parse_response(
+            self.client.get(reverse("get_posts"), {"user_id": self.other_user.id})
+        )
+        ids = [post["id"] for post in data["posts"]]
+        self.assertEqual(ids, [newer_repost.id, self.post2.id])
+        repost_data = data["posts"][0]
+        self.assertEqual(repost_data["original_post_id"], self.post1.id)
+        self.assertEqual(repost_data["reposted_by"]["id"], self.other_user.id)
+        self.assertEqual(repost_data["likes_count"], 1)
+        self.assertEqual(repost_data["comments_count"], 2)
+        self.assertNotIn(older_repost.id, ids)
+
+        # user follows other_user, reposts of other_user's posts are hidden
+        repost_of_post2 = Post.objects.create(
+            user=third_user,
+            is_repost=True,
+            original_post=self.post2,
+            reposted_by=third_user,
+            title="",
+            content=self.post2.content,
+        )
+        data = self.parse_response(
+            self.client.get(reverse("get_posts"), {"user_id": self.user.id})
+        )
+        ids = [post["id"] for post in data["posts"]]
+        self.assertNotIn(repost_of_post2.id, ids)
+        self.assertIn(self.post2.id, ids)
+        self.assertEqual(ids.count(newer_repost.id) + ids.count(self.post1.id), 1)
+
+    def test_get_posts_tabs_keep_reposts(self):
+        def tab(settings_type):
+            data = self.parse_response(
+                self.client.get(
+                    reverse("get_posts"),
+                    {"user_id": self.user.id, "settings_type": settings_type},
+                )
+            )
+            return [post["id"] for post in data["posts"]]
+
+        # user follows other_user: both reposts are hidden from the home feed
+        own_repost = Post.objects.create(
+            user=self.user,
+            is_repost=True,
+            original_post=self.post2,
+            reposted_by=self.user,
+            title="",
+            content=self.post2.content,
+        )
+        Post.objects.create(
+            user=self.other_user,
+            is_repost=True,
+            original_post=self.post1,
+            reposted_by=self.other_user,
+            title="",
+            content=self.post1.content,
+        )
+        Like.objects.create(user=self.user, post=own_repost, like_type="Like")
+        Comment.objects.create(user=self.user, post=own_repost, content="Mine")
+        ReportPost.objects.create(
+            post=own_repost,
+            reporting_user=self.other_user,
+            post_owner=self.user,
+            is_repost=True,
+        )
+
+        self.assertNotIn(own_repost.id, tab(""))
+        # The post other_user reposted later stays on the author's tabs
+        self.assertEqual(tab("posts"), [self.post1.id])
+        self.assertEqual(tab("reactions"), [own_repost.id, self.post1.id])
+        self.assertEqual(tab("comments"), [own_repost.id, self.post1.id])
+        self.assertEqual(tab("flagged_posts"), [own_repost.id])
+
+    def test_get_posts_query_count_constant(self):
+        viewer = User.objects.create_user(
+            email="viewer@example.com",
+            password="testpass123",
+            first_name="Viewer",
+            last_name="User",
+        )
+        for i in range(20):
+            post = Post.objects.create(
+                user=self.other_user, title=f"Post {i}", content=f"Content {i}"
+            )
+            Post.objects.create(
+                user=self.user,
+                is_repost=True,
+                original_post=post,
+                reposted_by=self.user,
+                title="",
+                content=post.content,
+            )
+
+        params = {"user_id": viewer.id, "limit": 5}
+        # The first read also builds the viewer's timeline
+        data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        self.assertTrue(all(post["is_repost"] for post in data["posts"]))
+
+        params["cursor"] = data["next_cursor"]
+        with CaptureQueriesContext(connection) as first_page:
+            data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        self.assertTrue(all(post["is_repost"] for post in data["posts"]))
+
+        params["cursor"] = data["next_cursor"]
+        with CaptureQueriesContext(connection) as next_page:
+            self.client.get(reverse("get_posts"), params)
+        self.assertEqual(len(first_page), len(next_page))
+
+    def test_get_posts_viewer_state_limited_to_page(self):
+        # Old likes outside the page are not loaded
+        for i in range(10):
+            post = Post.objects.create(
+                user=self.other_user, title=f"Old {i}", content=f"Old {i}"
+            )
+            Like.objects.create(user=self.user, post=post)
+        newest = Post.objects.create(user=self.user, title="New", content="New")
+
+        params = {"user_id": self.user.id, "limit": 1}
+        with CaptureQueriesContext(connection) as queries:
+            data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        self.assertEqual(data["posts"][0]["id"], newest.id)
+        like_queries = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "forum_like"' in query["sql"]
+        ]
+        self.assertEqual(len(like_queries), 1)
+        self.assertIn(f"IN ({newest.id})", like_queries[0])
+
+        # Served from the cache the second time
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("get_posts"), params)
+        self.assertFalse(
+            any('FROM "forum_like"' in q["sql"] for q in queries.captured_queries)
+        )
+
+    def test_get_posts_viewer_state_invalidated_by_writes(self):
+        params = {"user_id": self.user.id}
+        data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        post2_data = next(p for p in data["posts"] if p["id"] == self.post2.id)
+        self.assertFalse(post2_data["user_has_liked"])
+
+        self.client.post(
+            reverse("like_post", args=[self.post2.id]),
+            json.dumps(
+                {"user_id": self.user.id, "is_liked": True, "like_type": "Love"}
+            ),
+            content_type="application/json",
+        )
+        data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        post2_data = next(p for p in data["posts"] if p["id"] == self.post2.id)
+        self.assertEqual(post2_data["like_type"], "Love")
+
+        # Changing the like type goes through update(), no signal
+        self.client.post(
+            reverse("like_post", args=[self.post2.id]),
+            json.dumps(
+                {"user_id": self.user.id, "is_liked": True, "like_type": "Clap"}
+            ),
+            content_type="application/json",
+        )
+        Follow.objects.filter(main_user=self.user).delete()
+        data = self.parse_response(self.client.get(reverse("get_posts"), params))
+        post2_data = next(p for p in data["posts"] if p["id"] == self.post2.id)
+        self.assertEqual(post2_data["like_type"], "Clap")
+        self.assertFalse(post2_data["is_following_author"])
+
     def test_get_posts_like_info(self):
         response = self.client.get(reverse("get_posts"), {"user_id": self.user.id})
         data = self.parse_response(response)
@@ -801,14 +1034,17 @@ class CommentViewTests(TestCase):
             "parent_comment_id": self.parent_comment.id,
             "is_edit": True,
         }
-        response = self.client.post(
-            reverse("comments", args=[self.post.id]),
-            data=json.dumps(data),
-            content_type="application/json",
-        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("comments", args=[self.post.id]),
+                data=json.dumps(data),
+                content_type="application/json",
+            )
         self.assertEqual(response.status_code, 200)
         self.parent_comment.refresh_from_db()
         self.assertEqual(self.parent_comment.content, "Edited content")
+        (update,) = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertNotIn("count", update)
 
     def test_get_comments_paginated(self):
         # Create more comments for pagination testing
@@ -1801,6 +2037,23 @@ class DeleteCommentViewTests(TestCase):
         response_data = json.loads(response.content)
         self.assertEqual(response_data["total_deleted"], 1)
 
+    def test_delete_comment_counts_subtree(self):
+        reply = Comment.objects.create(
+            user=self.user, post=self.post, parent_comment=self.comment, content="R"
+        )
+        Comment.objects.create(
+            user=self.user, post=self.post, parent_comment=reply, content="RR"
+        )
+        Comment.objects.create(user=self.user, post=self.post, content="Other")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(self.url)
+        self.assertEqual(json.loads(response.content)["total_deleted"], 3)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in queries.captured_queries)
+        )
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 1)
+
     # def test_delete_nonexistent_comment(self):
     #     invalid_url = reverse('delete_comment', args=[self.post.id, 9999])
     #     response = self.client.delete(invalid_url)
@@ -1943,3 +2196,446 @@ class DeletePostViewTests(TestCase):
     #         # Then try to delete it again through the view
     #         response = self.client.delete(self.url)
     #         self.assertEqual(response.status_code, 500)
+
+
+class EngagementCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.other_user = User.objects.create_user(
+            email="other@example.com",
+            first_name="Other",
+            last_name="User",
+            password="testpass123",
+        )
+        self.post = Post.objects.create(
+            user=self.user, title="Test Post", content="Test content"
+        )
+
+    def test_like_counters(self):
+        like = Like.objects.create(user=self.user, post=self.post)
+        Like.objects.create(user=self.other_user, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+
+        like.delete()
+        Like.objects.filter(user=self.other_user).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_and_reply_counters(self):
+        comment = Comment.objects.create(
+            user=self.user, post=self.post, content="Comment"
+        )
+        reply = Comment.objects.create(
+            user=self.other_user,
+            post=self.post,
+            parent_comment=comment,
+            content="Reply",
+        )
+        Comment.objects.create(
+            user=self.user, post=self.post, parent_comment=reply, content="Reply 2"
+        )
+        CommentLike.objects.create(user=self.other_user, comment=comment)
+
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        reply.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 3)
+        self.assertEqual(comment.replies_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+        self.assertEqual(reply.replies_count, 1)
+
+        # Deleting a reply deletes its own replies too
+        reply.delete()
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(comment.replies_count, 0)
+
+    def test_like_post_view_returns_counter(self):
+        response = self.client.post(
+            reverse("like_post", args=[self.post.id]),
+            json.dumps({"user_id": self.other_user.id, "is_liked": True}),
+            content_type="application/json",
+        )
+        self.assertEqual(json.loads(response.content)["likes_count"], 1)
+
+        response = self.client.post(
+            reverse("like_post", args=[self.post.id]),
+            json.dumps({"user_id": self.other_user.id, "is_liked": False}),
+            content_type="application/json",
+        )
+        self.assertEqual(json.loads(response.content)["likes_count"], 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        comment = Comment.objects.create(
+            user=self.user, post=self.post, content="Comment"
+        )
+        Like.objects.create(user=self.other_user, post=self.post)
+        Post.objects.filter(id=self.post.id).update(likes_count=7, comments_count=0)
+        Comment.objects.filter(id=comment.id).update(replies_count=3)
+
+        out = StringIO()
+        call_command("reconcile_forum_counters", "--dry-run", stdout=out)
+        self.assertIn("Post.likes_count: 1 row(s) drifted", out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 7)
+
+        out = StringIO()
+        call_command("reconcile_forum_counters", stdout=out)
+        self.assertIn("Comment.replies_count: 1 row(s) fixed", out.getvalue())
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(comment.replies_count, 0)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        timelines.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.other_user = User.objects.create_user(
+            email="other@example.com",
+            first_name="Other",
+            last_name="User",
+            password="testpass123",
+        )
+        self.post = Post.objects.create(
+            user=self.other_user, title="Test Post", content="Test content"
+        )
+
+    def feed_ids(self, user, **params):
+        response = self.client.get(reverse("get_posts"), {"user_id": user.id, **params})
+        return [post["id"] for post in json.loads(response.content)["posts"]]
+
+    def create_post(self, user, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(
+                user=user, title="Post", content="Content", **fields
+            )
+
+    def test_second_read_does_not_run_the_feed_query(self):
+        self.assertEqual(self.feed_ids(self.user), [self.post.id])
+        self.assertTrue(timelines.exists(self.user.id))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.feed_ids(self.user), [self.post.id])
+        self.assertFalse(
+            any("shown_post_id" in query["sql"] for query in queries.captured_queries)
+        )
+
+    def test_in_memory_timeline_expires_after_build(self):
+        # Other workers' posts never reach it, reads must not keep it alive
+        store = timeline.InMemoryTimelineStore(ttl=60)
+        with patch.object(timeline.time, "monotonic", return_value=1000):
+            store.replace(self.user.id, [(1, self.post.id, self.post.id)], True)
+        for now in (1030, 1059):
+            with patch.object(timeline.time, "monotonic", return_value=now):
+                self.assertEqual(
+                    store.page(self.user.id, 10), ([(1, self.post.id)], True)
+                )
+        with patch.object(timeline.time, "monotonic", return_value=1061):
+            self.assertIsNone(store.page(self.user.id, 10))
+
+    def test_new_posts_are_pushed_to_existing_timelines(self):
+        self.feed_ids(self.user)
+        new_post = self.create_post(self.other_user)
+        repost = self.create_post(
+            self.user,
+            is_repost=True,
+            original_post=self.post,
+            reposted_by=self.user,
+        )
+        self.assertEqual(self.feed_ids(self.user), [repost.id, new_post.id])
+        # Viewers without a timeline are not written to
+        self.assertFalse(timelines.exists(self.other_user.id))
+
+    def test_reposts_of_followed_authors_are_not_pushed(self):
+        Follow.objects.create(main_user=self.user, following_user=self.other_user)
+        self.feed_ids(self.user)
+        third_user = User.objects.create_user(
+            email="third@example.com",
+            first_name="Third",
+            last_name="User",
+            password="testpass123",
+        )
+        self.create_post(
+            third_user,
+            is_repost=True,
+            original_post=self.post,
+            reposted_by=third_user,
+        )
+        self.assertEqual(self.feed_ids(self.user), [self.post.id])
+
+    def test_follow_drops_the_timeline(self):
+        self.feed_ids(self.user)
+        Follow.objects.create(main_user=self.user, following_user=self.other_user)
+        self.assertFalse(timelines.exists(self.user.id))
+
+    def test_deleted_posts_leave_the_timeline(self):
+        new_post = self.create_post(self.other_user)
+        repost = self.create_post(
+            self.user,
+            is_repost=True,
+            original_post=self.post,
+            reposted_by=self.user,
+        )
+        self.assertEqual(self.feed_ids(self.user), [repost.id, new_post.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            repost.delete()
+        self.assertEqual(self.feed_ids(self.user), [new_post.id, self.post.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post.delete()
+        self.assertEqual(self.feed_ids(self.user), [self.post.id])
+
+    def test_pages_past_the_timeline_come_from_the_database(self):
+        posts = [self.create_post(self.other_user) for _ in range(4)]
+        expected = [post.id for post in reversed(posts)] + [self.post.id]
+
+        with patch.object(timeline, "TIMELINE_LENGTH", 3):
+            seen = []
+            params = {"user_id": self.user.id, "limit": 2}
+            while True:
+                response = self.client.get(reverse("get_posts"), params)
+                data = json.loads(response.content)
+                seen.extend(post["id"] for post in data["posts"])
+                if not data["has_more"]:
+                    break
+                params["cursor"] = data["next_cursor"]
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.feed_ids(self.user, offset=3, limit=5), expected[3:])
+
+    def test_cursor_moves_past_a_page_of_hidden_rows(self):
+        newer = [self.create_post(self.other_user) for _ in range(2)]
+        self.feed_ids(self.user)
+        # Deleted through another worker, still in this timeline
+        Post.objects.filter(id__in=[post.id for post in newer]).delete()
+
+        page, cursor = timeline.get_timeline_page(self.user, 2)
+        self.assertEqual(page, [])
+        self.assertIsNotNone(cursor)
+        page, cursor = timeline.get_timeline_page(self.user, 2, cursor=cursor)
+        self.assertEqual(page, [self.post])
+        self.assertIsNone(cursor)
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.post = Post.objects.create(
+            user=self.user, title="Test Post", content="Test content"
+        )
+        self.first = self.comment("First")
+        self.reply = self.comment("Reply", self.first)
+        self.nested = self.comment("Nested", self.reply)
+        self.second = self.comment("Second")
+        CommentLike.objects.create(user=self.user, comment=self.nested)
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(
+            user=self.user, post=self.post, parent_comment=parent, content=content
+        )
+
+    def get_thread(self, **params):
+        response = self.client.get(
+            reverse("comment_thread", args=[self.post.id]),
+            {"user_id": self.user.id, **params},
+        )
+        return response.status_code, json.loads(response.content)
+
+    def test_paths(self):
+        self.nested.refresh_from_db()
+        self.assertEqual(self.nested.depth, 2)
+        self.assertEqual(
+            self.nested.path,
+            "".join(
+                str(comment.id).zfill(10)
+                for comment in (self.first, self.reply, self.nested)
+            ),
+        )
+        self.assertEqual(
+            list(Comment.objects.order_by("path").values_list("id", flat=True)),
+            [self.first.id, self.reply.id, self.nested.id, self.second.id],
+        )
+
+    def test_whole_thread_in_one_comment_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            status, data = self.get_thread()
+        self.assertEqual(status, 200)
+        comment_queries = [
+            query
+            for query in queries.captured_queries
+            if 'FROM "forum_comment"' in query["sql"]
+        ]
+        self.assertEqual(len(comment_queries), 1)
+
+        first, second = data["comments"]
+        self.assertEqual(first["id"], self.first.id)
+        self.assertEqual(second["replies"], [])
+        nested = first["replies"][0]["replies"][0]
+        self.assertEqual(nested["id"], self.nested.id)
+        self.assertTrue(nested["user_has_liked"])
+
+    def test_depth_and_subtree(self):
+        _, data = self.get_thread(depth=1)
+        self.assertEqual(
+            [(c["id"], c["replies"]) for c in data["comments"]],
+            [(self.first.id, []), (self.second.id, [])],
+        )
+
+        _, data = self.get_thread(comment_id=self.reply.id, depth=2)
+        self.assertEqual(len(data["comments"]), 1)
+        self.assertEqual(data["comments"][0]["id"], self.reply.id)
+        self.assertEqual(data["comments"][0]["replies"][0]["id"], self.nested.id)
+
+        status, _ = self.get_thread(depth=0)
+        self.assertEqual(status, 400)
+        for params in ({"comment_id": "x"}, {"user_id": "x"}, {"depth": "x"}):
+            self.assertEqual(self.get_thread(**params)[0], 400)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="walker@example.com",
+            first_name="Night",
+            last_name="Walker",
+            password="testpass123",
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com",
+            first_name="Other",
+            last_name="Person",
+            password="testpass123",
+        )
+        self.title_match = Post.objects.create(
+            user=self.user, title="Safe routes downtown", content="Lit streets"
+        )
+        self.content_match = Post.objects.create(
+            user=self.other, title="Evening", content="Walking the safe route home"
+        )
+        self.unrelated = Post.objects.create(
+            user=self.other, title="Parks", content="Closed after dark"
+        )
+        self.comment = Comment.objects.create(
+            user=self.other, post=self.unrelated, content="The lights were broken"
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse("search"), params)
+        return response.status_code, json.loads(response.content)
+
+    def test_vectors_follow_edits(self):
+        status, data = self.search(q="benches")
+        self.assertEqual(data["results"], [])
+        self.unrelated.content = "Closed after dark, broken benches"
+        self.unrelated.save()
+        status, data = self.search(q="benches")
+        self.assertEqual([r["id"] for r in data["results"]], [self.unrelated.id])
+
+    def test_posts_ranked_title_first(self):
+        status, data = self.search(q="safe routes")
+        self.assertEqual(status, 200)
+        # Stemmed: "route" matches "routes", title weighs more than content
+        self.assertEqual(
+            [r["id"] for r in data["results"]],
+            [self.title_match.id, self.content_match.id],
+        )
+        self.assertEqual(data["results"][0]["user"]["first_name"], "Night")
+        self.assertFalse(data["has_more"])
+
+    def test_reposts_excluded(self):
+        Post.objects.create(
+            user=self.other,
+            title=self.title_match.title,
+            content=self.title_match.content,
+            is_repost=True,
+            original_post=self.title_match,
+        )
+        status, data = self.search(q="downtown")
+        self.assertEqual([r["id"] for r in data["results"]], [self.title_match.id])
+
+    def test_pages(self):
+        status, data = self.search(q="safe", limit=1)
+        self.assertEqual(len(data["results"]), 1)
+        self.assertTrue(data["has_more"])
+        status, data = self.search(q="safe", limit=1, page=2)
+        self.assertEqual([r["id"] for r in data["results"]], [self.content_match.id])
+        self.assertFalse(data["has_more"])
+
+    def test_comments(self):
+        status, data = self.search(q="light", type="comments")
+        self.assertEqual(status, 200)
+        self.assertEqual([r["id"] for r in data["results"]], [self.comment.id])
+        self.assertEqual(data["results"][0]["post_id"], self.unrelated.id)
+
+    def test_users(self):
+        self.other.karma = 5
+        self.other.save(update_fields=["karma"])
+        status, data = self.search(q="walk", type="users")
+        self.assertEqual([r["id"] for r in data["results"]], [self.user.id])
+        status, data = self.search(q="night walker", type="users")
+        self.assertEqual([r["id"] for r in data["results"]], [self.user.id])
+        self.assertNotIn("email", data["results"][0])
+        # Emails cannot be probed from the public search, only by staff
+        status, data = self.search(q="example.com", type="users")
+        self.assertEqual(data["results"], [])
+        self.assertEqual(
+            list(admin_search(Post.objects.all(), "walker@example")),
+            [self.title_match],
+        )
+
+    def test_uses_search_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search(q="safe")
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"search_vector" @@', queries[0]["sql"])
+
+    def test_user_search_matches_indexed_expression(self):
+        # accounts migration 0013 indexes exactly this expression
+        with CaptureQueriesContext(connection) as queries:
+            self.search(q="walk", type="users")
+        self.assertIn(
+            'UPPER("accounts_user"."first_name"::text) LIKE', queries[0]["sql"]
+        )
+        self.assertIn(
+            'UPPER("accounts_user"."last_name"::text) LIKE', queries[0]["sql"]
+        )
+
+    def test_user_search_uses_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("pg_trgm is not installed")
+            sql, params = matching_users("walk", email=True).query.sql_with_params()
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        for column in ("first_name", "last_name", "email"):
+            self.assertIn(f"accounts_user_{column}_upper_trgm", plan)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.search()[0], 400)
+        self.assertEqual(self.search(q="safe", type="routes")[0], 400)
+        self.assertEqual(self.search(q="safe", limit="x")[0], 400)
+        self.assertEqual(self.search(q="safe", page=0)[0], 400)
+        self.assertEqual(
+            self.client.post(reverse("search"), {"q": "x"}).status_code, 405
+        )
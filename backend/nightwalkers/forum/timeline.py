@@ -0,0 +1,422 @@
+"""
+Per-viewer home timelines
+
+The home feed (get_posts without settings_type) is read from a sorted set
+per viewer instead of running feed_queryset() on every page. A timeline
+holds one entry per original post shown to the viewer: the feed row to
+display (the post itself or its latest visible repost), scored by the row's
+date_created in microseconds.
+
+A timeline is built with a single feed_queryset() query the first time a
+viewer reads the feed (fan-out on read) and expires after TIMELINE_TTL
+without reads (shared store), or IN_MEMORY_TIMELINE_TTL after it was built
+(per process store). New posts and reposts are pushed into the timelines that
+exist (fan-out on write), so the write cost is bounded by the number of
+recently active viewers, not by the number of users. Only the most recent
+TIMELINE_LENGTH entries are kept, pages past them come from the database.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from bisect import insort
+from django.conf import settings
+from accounts.models import Follow
+from .feed import decode_cursor, encode_position, feed_queryset, get_page
+from .models import Post
+
+TIMELINE_LENGTH = 500
+TIMELINE_TTL = 60 * 30  # seconds
+# Counted from the build, see InMemoryTimelineStore
+IN_MEMORY_TIMELINE_TTL = 60
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def score_of(date):
+    """Exact microseconds since the epoch of an aware datetime"""
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+
+def date_of(score):
+    return EPOCH + timedelta(microseconds=score)
+
+
+class InMemoryTimelineStore:
+    """
+    Timelines of this process, for tests and single worker deployments
+
+    Posts written through another worker are never pushed here, so a
+    timeline expires ttl seconds after it was built, however often it is
+    read: with several workers the home feed is at most that stale.
+
+    Each timeline is {"entries": sorted [(score, row id, shown id)],
+    "rows": {shown id: (score, row id)}, "complete": bool, "built": time}.
+    """
+
+    def __init__(self, ttl=IN_MEMORY_TIMELINE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._timelines = {}
+        self._sequence = 0
+
+    def clear(self):
+        with self._lock:
+            self._timelines = {}
+
+    def sequence(self):
+        """Changes every time a push/removal happens, see build_timeline"""
+        return self._sequence
+
+    def _alive(self, owner, now):
+        timeline = self._timelines.get(owner)
+        if timeline is not None and now - timeline["built"] > self.ttl:
+            del self._timelines[owner]
+            return None
+        return timeline
+
+    def owners(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                owner
+                for owner in list(self._timelines)
+                if self._alive(owner, now) is not None
+            ]
+
+    def exists(self, owner):
+        with self._lock:
+            return self._alive(owner, time.monotonic()) is not None
+
+    def replace(self, owner, entries, complete, sequence=None):
+        """
+        Store a freshly built timeline
+
+        entries is a list of (score, row id, shown id). Nothing is stored if
+        sequence is given and pushes happened since it was read.
+
+        Returns:
+            bool: Whether the timeline was stored
+        """
+        with self._lock:
+            if sequence is not None and sequence != self._sequence:
+                return False
+            self._timelines[owner] = {
+                "entries": sorted(entries),
+                "rows": {shown: (score, row) for score, row, shown in entries},
+                "complete": complete,
+                "built": time.monotonic(),
+            }
+            return True
+
+    def drop(self, owner):
+        with self._lock:
+            self._sequence += 1
+            self._timelines.pop(owner, None)
+
+    def add(self, owners, score, row_id, shown_id):
+        """Show row_id for shown_id in the existing timelines of owners"""
+        with self._lock:
+            self._sequence += 1
+            for owner in owners:
+                timeline = self._timelines.get(owner)
+                if timeline is None:
+                    continue
+                previous = timeline["rows"].get(shown_id)
+                if previous is not None:
+                    if previous >= (score, row_id):
+                        continue
+                    timeline["entries"].remove((*previous, shown_id))
+                timeline["rows"][shown_id] = (score, row_id)
+                insort(timeline["entries"], (score, row_id, shown_id))
+                if len(timeline["entries"]) > TIMELINE_LENGTH:
+                    _, _, oldest = timeline["entries"].pop(0)
+                    del timeline["rows"][oldest]
+                    timeline["complete"] = False
+
+    def discard(self, owners, row_id, shown_id):
+        """
+        Remove row_id from the timelines of owners, None removes whatever
+        row shows shown_id
+
+        Returns:
+            list: Owners whose timeline showed it
+        """
+        removed = []
+        with self._lock:
+            self._sequence += 1
+            for owner in owners:
+                timeline = self._timelines.get(owner)
+                if timeline is None:
+                    continue
+                previous = timeline["rows"].get(shown_id)
+                if previous is None or row_id not in (None, previous[1]):
+                    continue
+                timeline["entries"].remove((*previous, shown_id))
+                del timeline["rows"][shown_id]
+                removed.append(owner)
+        return removed
+
+    def page(self, owner, limit, before=None, offset=0):
+        """
+        Up to limit entries after before=(score, row id), or after offset
+
+        Returns:
+            tuple: (list of (score, row id), whether the timeline is
+            complete), None if the owner has no timeline
+        """
+        now = time.monotonic()
+        with self._lock:
+            timeline = self._alive(owner, now)
+            if timeline is None:
+                return None
+            newest_first = reversed(timeline["entries"])
+            if before is not None:
+                newest_first = (
+                    entry for entry in newest_first if entry[:2] < tuple(before)
+                )
+            rows = []
+            for index, (score, row, _) in enumerate(newest_first):
+                if before is None and index < offset:
+                    continue
+                if len(rows) == limit:
+                    break
+                rows.append((score, row))
+            return rows, timeline["complete"]
+
+
+class RedisTimelineStore:
+    """
+    Timelines shared by every worker
+
+    forum:timeline:<owner> is a sorted set of shown ids scored by date,
+    forum:timeline:<owner>:rows maps each shown id to the row to display
+    (plus "complete"), forum:timelines scores owners by last read time.
+    """
+
+    def __init__(self, url, ttl=TIMELINE_TTL):
+        # Only needed when timelines are shared, like the redis cache backend
+        import redis
+
+        self.ttl = ttl
+        self.watch_error = redis.WatchError
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def _keys(self, owner):
+        return f"forum:timeline:{owner}", f"forum:timeline:{owner}:rows"
+
+    def clear(self):
+        for owner in self.client.zrange("forum:timelines", 0, -1):
+            self.client.delete(*self._keys(owner))
+        self.client.delete("forum:timelines")
+
+    def sequence(self):
+        return int(self.client.get("forum:timeline-sequence") or 0)
+
+    def owners(self):
+        self.client.zremrangebyscore("forum:timelines", "-inf", time.time() - self.ttl)
+        return [int(owner) for owner in self.client.zrange("forum:timelines", 0, -1)]
+
+    def exists(self, owner):
+        return bool(self.client.exists(self._keys(owner)[1]))
+
+    def replace(self, owner, entries, complete, sequence=None):
+        entries_key, rows_key = self._keys(owner)
+        with self.client.pipeline() as pipe:
+            pipe.watch("forum:timeline-sequence")
+            if sequence is not None and self.sequence() != sequence:
+                return False
+            pipe.multi()
+            pipe.delete(entries_key, rows_key)
+            if entries:
+                pipe.zadd(entries_key, {shown: score for score, _, shown in entries})
+                pipe.hset(rows_key, mapping={shown: row for _, row, shown in entries})
+            pipe.hset(rows_key, "complete", int(complete))
+            pipe.expire(entries_key, self.ttl)
+            pipe.expire(rows_key, self.ttl)
+            pipe.zadd("forum:timelines", {owner: time.time()})
+            try:
+                pipe.execute()
+            except self.watch_error:
+                return False
+        return True
+
+    def drop(self, owner):
+        self.client.incr("forum:timeline-sequence")
+        self.client.delete(*self._keys(owner))
+        self.client.zrem("forum:timelines", owner)
+
+    def add(self, owners, score, row_id, shown_id):
+        self.client.incr("forum:timeline-sequence")
+        with self.client.pipeline(transaction=False) as pipe:
+            for owner in owners:
+                pipe.exists(self._keys(owner)[1])
+            alive = [owner for owner, found in zip(owners, pipe.execute()) if found]
+        with self.client.pipeline(transaction=False) as pipe:
+            for owner in alive:
+                entries_key, rows_key = self._keys(owner)
+                # New rows are always the most recent of their original post
+                pipe.zadd(entries_key, {shown_id: score})
+                pipe.hset(rows_key, shown_id, row_id)
+                pipe.zremrangebyrank(entries_key, 0, -TIMELINE_LENGTH - 1)
+            pipe.execute()
+
+    def discard(self, owners, row_id, shown_id):
+        self.client.incr("forum:timeline-sequence")
+        removed = []
+        for owner in owners:
+            entries_key, rows_key = self._keys(owner)
+            shown_row = self.client.hget(rows_key, shown_id)
+            if shown_row is not None and row_id in (None, int(shown_row)):
+                self.client.zrem(entries_key, shown_id)
+                self.client.hdel(rows_key, shown_id)
+                removed.append(owner)
+        return removed
+
+    def page(self, owner, limit, before=None, offset=0):
+        entries_key, rows_key = self._keys(owner)
+        complete = self.client.hget(rows_key, "complete")
+        if complete is None:
+            return None
+        wanted = limit + (offset if before is None else 0)
+        # Redis orders equal scores by shown id, pages by row id: whole score
+        # groups are read, newest first, until enough rows are after before
+        rows = []
+        max_score = "+inf" if before is None else before[0]
+        while len(rows) < wanted:
+            shown = self.client.zrevrangebyscore(
+                entries_key, max_score, "-inf", start=0, num=wanted, withscores=True
+            )
+            if not shown:
+                break
+            lowest = shown[-1][1]
+            if len(shown) == wanted:
+                # The lowest score group may go on past the batch
+                shown = [entry for entry in shown if entry[1] != lowest]
+                shown += self.client.zrangebyscore(
+                    entries_key, lowest, lowest, withscores=True
+                )
+            row_ids = self.client.hmget(rows_key, [member for member, _ in shown])
+            rows += [
+                (int(score), int(row))
+                for (_, score), row in zip(shown, row_ids)
+                if row is not None
+                and (before is None or (int(score), int(row)) < tuple(before))
+            ]
+            if len(shown) < wanted:
+                break
+            max_score = f"({int(lowest)}"
+        rows = sorted(rows, reverse=True)[wanted - limit : wanted]
+        self.client.zadd("forum:timelines", {owner: time.time()})
+        self.client.expire(entries_key, self.ttl)
+        self.client.expire(rows_key, self.ttl)
+        # Trimmed by add() past TIMELINE_LENGTH, assume more rows exist then
+        if self.client.zcard(entries_key) >= TIMELINE_LENGTH:
+            complete = "0"
+        return rows, complete == "1"
+
+
+def get_timeline_store():
+    url = getattr(settings, "FORUM_TIMELINE_REDIS_URL", None)
+    if url:
+        return RedisTimelineStore(url)
+    return InMemoryTimelineStore()
+
+
+timelines = get_timeline_store()
+
+
+def build_timeline(user, store=None):
+    """
+    Build the viewer's timeline from the database
+
+    Returns:
+        list: The timeline entries, (score, row id, shown id)
+    """
+    store = store or timelines
+    sequence = store.sequence()
+    rows = list(
+        feed_queryset(user, "").values_list("date_created", "id", "shown_post_id")[
+            :TIMELINE_LENGTH
+        ]
+    )
+    entries = [(score_of(date), row, shown) for date, row, shown in rows]
+    # A post pushed while the query ran might be missing, build it again then
+    store.replace(user.id, entries, len(rows) < TIMELINE_LENGTH, sequence)
+    return entries
+
+
+def get_timeline_page(user, limit, cursor=None, offset=0, store=None):
+    """
+    Page of the viewer's home feed, same result as get_page(feed_queryset())
+
+    Returns:
+        tuple: (list of posts, next page cursor or None if it was the last)
+    """
+    store = store or timelines
+    before = None
+    if cursor:
+        date_created, post_id = decode_cursor(cursor)
+        before = (score_of(date_created), post_id)
+
+    result = store.page(user.id, limit + 1, before, offset)
+    if result is None:
+        build_timeline(user, store)
+        result = store.page(user.id, limit + 1, before, offset)
+    rows, complete = result if result is not None else ([], False)
+    if len(rows) <= limit and not complete:
+        # Past the stored window, page the database directly
+        return get_page(feed_queryset(user, ""), limit, cursor=cursor, offset=offset)
+
+    row_ids = [row for _, row in rows[:limit]]
+    posts = Post.objects.select_related(
+        "user", "original_post__user", "reposted_by"
+    ).in_bulk(row_ids)
+    page = [
+        posts[row]
+        for row in row_ids
+        # Reposts whose original was deleted in the meantime are not shown
+        if row in posts and not (posts[row].is_repost and not posts[row].original_post)
+    ]
+    if len(rows) > limit:
+        # From the row, its post may be gone or hidden
+        score, row = rows[limit - 1]
+        return page, encode_position(date_of(score), row)
+    return page, None
+
+
+def push_post(post, store=None):
+    """Fan a new post or repost out to the existing timelines"""
+    store = store or timelines
+    if post.is_repost and post.original_post_id is None:
+        return
+    owners = store.owners()
+    if post.is_repost:
+        # Reposts of followed authors are hidden, the original is there
+        hidden = set(
+            Follow.objects.filter(
+                main_user_id__in=owners,
+                following_user_id=post.original_post.user_id,
+            ).values_list("main_user_id", flat=True)
+        )
+        owners = [owner for owner in owners if owner not in hidden]
+    store.add(
+        owners,
+        score_of(post.date_created),
+        post.id,
+        post.original_post_id if post.is_repost else post.id,
+    )
+
+
+def remove_post(post, store=None):
+    """Take a deleted post or repost out of the existing timelines"""
+    store = store or timelines
+    if not post.is_repost:
+        # Its reposts are not shown anymore either
+        store.discard(store.owners(), None, post.id)
+        return
+    if post.original_post_id is None:
+        return
+    for owner in store.discard(store.owners(), post.id, post.original_post_id):
+        # An older repost or the original shows in its place, rebuild
+        store.drop(owner)
@@ -9,12 +9,19 @@ urlpatterns = [
     path("posts/repost/", views.create_repost, name="create_repost"),
     path("posts/<int:post_id>/", views.get_post, name="get_post"),
     path("posts/<int:post_id>/delete/", views.delete_post, name="delete_post"),
+    # Search endpoint
+    path("search/", views.search, name="search"),
     # Comment endpoints
     path(
         "posts/<int:post_id>/comments/",
         views.comments,
         name="comments",
     ),
+    path(
+        "posts/<int:post_id>/comments/thread/",
+        views.comment_thread,
+        name="comment_thread",
+    ),
     # Like endpoints
     path("posts/<int:post_id>/like/", views.like_post, name="like_post"),
     path("posts/<int:post_id>/unlike/", views.unlike_post, name="unlike_post"),
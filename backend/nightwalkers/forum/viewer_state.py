@@ -0,0 +1,89 @@
+"""
+What a viewer did to the posts of a feed page
+
+get_posts needs, for the posts on the page only, the viewer's like (and its
+type), whether they reported the post and whether they follow its author.
+load_viewer_state() fetches exactly that with one query per relation and
+keeps it in the cache for a short while. Like, follow and report writes
+bump the viewer's generation (see forum/signals.py), which makes every
+cached state of that viewer unreachable at once.
+"""
+
+import hashlib
+import time
+from django.core.cache import cache
+from accounts.models import Follow
+from .models import Like, ReportPost
+
+VIEWER_STATE_TIMEOUT = 60  # seconds
+
+
+def clock_version():
+    return time.time_ns() // 1000
+
+
+def generation_key(user_id):
+    return f"forum:viewer-state:{user_id}:generation"
+
+
+def get_generation(user_id):
+    # Seeded from the clock (in microseconds), an evicted counter never hands
+    # out a generation that older cached states are stored under
+    generation = cache.get(generation_key(user_id))
+    if generation is None:
+        cache.add(generation_key(user_id), clock_version(), timeout=None)
+        generation = cache.get(generation_key(user_id), clock_version())
+    return generation
+
+
+def invalidate_viewer_state(user_id):
+    """Forget the cached state of a viewer, call it after their writes"""
+    get_generation(user_id)
+    try:
+        cache.incr(generation_key(user_id))
+    except ValueError:
+        # Evicted in between
+        cache.set(generation_key(user_id), clock_version(), timeout=None)
+
+
+def viewer_state_key(user_id, generation, post_ids, author_ids):
+    ids = ",".join(map(str, sorted(post_ids))) + "|"
+    ids += ",".join(map(str, sorted(author_ids)))
+    digest = hashlib.sha1(ids.encode()).hexdigest()
+    return f"forum:viewer-state:{user_id}:{generation}:{digest}"
+
+
+def load_viewer_state(user_id, post_ids, author_ids):
+    """
+    The viewer's likes and reports of post_ids and follows of author_ids
+
+    Returns:
+        dict: {"likes": like_type by post id, "reported": set of post ids,
+        "following": set of author ids}
+    """
+    post_ids, author_ids = set(post_ids), set(author_ids)
+    key = viewer_state_key(user_id, get_generation(user_id), post_ids, author_ids)
+    state = cache.get(key)
+    if state is not None:
+        return state
+
+    state = {"likes": {}, "reported": set(), "following": set()}
+    if post_ids:
+        state["likes"] = dict(
+            Like.objects.filter(user_id=user_id, post_id__in=post_ids).values_list(
+                "post_id", "like_type"
+            )
+        )
+        state["reported"] = set(
+            ReportPost.objects.filter(
+                reporting_user_id=user_id, post_id__in=post_ids
+            ).values_list("post_id", flat=True)
+        )
+    if author_ids:
+        state["following"] = set(
+            Follow.objects.filter(
+                main_user_id=user_id, following_user_id__in=author_ids
+            ).values_list("following_user_id", flat=True)
+        )
+    cache.set(key, state, VIEWER_STATE_TIMEOUT)
+    return state
@@ -3,13 +3,29 @@ from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
 from map.models import SavedRoute
 from .models import Post, Comment, Like, CommentLike, ReportPost, ReportComment
 from accounts.models import Follow
-from django.db.models import Count, OuterRef, Subquery, IntegerField, Exists
+from accounts.karma import (
+    COMMENT_RECEIVED,
+    COMMENT_REPORTED,
+    FOLLOWER_GAINED,
+    LIKE_RECEIVED,
+    POST_CREATED,
+    POST_REPORTED,
+    REPOST_CREATED,
+    award_karma,
+    karma_batch,
+)
+from .comment_tree import build_tree, thread_queryset
+from .feed import InvalidCursor, feed_queryset, get_page
+from .search import SEARCH_TYPES, search_comments, search_posts, search_users
+from .timeline import get_timeline_page
+from .viewer_state import invalidate_viewer_state, load_viewer_state
 import json
-from notifications import notification_service
+from notifications.outbox import enqueue_notification
 
 User = get_user_model()
 
@@ -41,7 +57,8 @@ def create_post(request):
                 post = Post.objects.get(id=post_id)
                 post.content = content
                 post.image_urls = image_urls
-                post.save()
+                # Not the counters, signals may have moved them meanwhile
+                post.save(update_fields=["content", "image_urls", "date_updated"])
                 return JsonResponse(
                     {
                         "id": post.id,
@@ -83,8 +100,8 @@ def create_post(request):
         )
 
         # increase user profile karma by 10
-        user.karma += 10
-        user.save()
+        award_karma(user, POST_CREATED, "post_created")
+        user.refresh_from_db(fields=["karma"])
 
         # Include user details in the response
         return JsonResponse(
@@ -161,8 +178,7 @@ def create_repost(request):
         )
 
         # increase karma by 5
-        user.karma += 5
-        user.save()
+        award_karma(user, REPOST_CREATED, "repost_created")
 
         # Include repost details in the response
         return JsonResponse(
@@ -242,143 +258,45 @@ def get_posts(request):
         user_id = request.GET.get("user_id")  # Get the user ID from query parameters
         offset = int(request.GET.get("offset", 0))  # Get the offset (default: 0)
         limit = int(request.GET.get("limit", 5))  # Get the limit (default: 5)
+        # Position after the last post already loaded, prefer it over offset
+        cursor = request.GET.get("cursor")
         settings_type = request.GET.get(
             "settings_type", ""
         )  # Get the settings type (default: "")
-        # Fetch all likes by the current user in a single query
-        user_likes = Like.objects.filter(user_id=user_id).values_list(
-            "post_id", "like_type"
-        )
-
-        # Convert user_likes into a dictionary for quick lookup
-        user_likes_dict = {post_id: like_type for post_id, like_type in user_likes}
-
-        # Fetch all follow relationships for the current user
-        current_user_following = Follow.objects.filter(
-            main_user_id=user_id
-        ).values_list("following_user_id", flat=True)
-
-        # get all the posts that the user has reported
-        reported_posts = ReportPost.objects.filter(
-            reporting_user_id=user_id
-        ).values_list("post_id", flat=True)
-        # create set for quick lookup
-        reported_posts = set(reported_posts)
-
-        # Convert current_user_following into a set for quick lookup
-        current_user_following_set = set(current_user_following)
         user = get_object_or_404(User, id=user_id)
         print("settings_type:", settings_type)
-        # Annotate posts with distinct likes_count and comments_count
-        if settings_type == "":
-            posts = Post.objects.annotate(
-                likes_count=Count("likes", distinct=True),  # Distinct count for likes
-                comments_count=Count(
-                    "comments", distinct=True
-                ),  # Distinct count for comments
-            ).order_by("-date_created")
-        elif settings_type == "posts":
-            posts = (
-                Post.objects.filter(user=user, is_repost=False)
-                .annotate(
-                    likes_count=Count(
-                        "likes", distinct=True
-                    ),  # Distinct count for likes
-                    comments_count=Count(
-                        "comments", distinct=True
-                    ),  # Distinct count for comments
-                )
-                .order_by("-date_created")
-            )
-        elif settings_type == "reactions":
-            # show all the post user has liked
-            posts = (
-                Post.objects.filter(likes__user=user)
-                .annotate(
-                    likes_count=Count(
-                        "likes", distinct=True
-                    ),  # Distinct count for likes
-                    comments_count=Count(
-                        "comments", distinct=True
-                    ),  # Distinct count for comments
-                )
-                .order_by("-date_created")
-            )
-        elif settings_type == "reports":
-            # show all the post user has reported
-            posts = (
-                Post.objects.filter(reports__reporting_user=user)
-                .annotate(
-                    likes_count=Count(
-                        "likes", distinct=True
-                    ),  # Distinct count for likes
-                    comments_count=Count(
-                        "comments", distinct=True
-                    ),  # Distinct count for comments
-                )
-                .order_by("-date_created")
-            )
-        elif settings_type == "comments":
-            # find all the posts_id where user has commented \
-            # then filter the posts and annotate and order by \
-            # date and paginate amd return
-            posts = (
-                Post.objects.filter(comments__user=user)
-                .annotate(
-                    likes_count=Count(
-                        "likes", distinct=True
-                    ),  # Distinct count for likes
-                    comments_count=Count(
-                        "comments", distinct=True
-                    ),  # Distinct count for comments
-                )
-                .order_by("-date_created")
-            )
-        elif settings_type == "flagged_posts":
-            # show all the posts made by user that have been reported
-            # so find all the posts made by user that have been reported,
-            # then filter the posts and annotate and order by date
-
-            posts = (
-                Post.objects.filter(user=user)
-                .annotate(
-                    likes_count=Count("likes", distinct=True),
-                    comments_count=Count("comments", distinct=True),
-                    is_reported=Exists(ReportPost.objects.filter(post=OuterRef("pk"))),
+        try:
+            if settings_type == "":
+                # Home feed, from the viewer's precomputed timeline
+                page, next_cursor = get_timeline_page(
+                    user, limit, cursor=cursor, offset=offset
                 )
-                .filter(is_reported=True)
-                .order_by("-date_created")
-            )
+            else:
+                # Reposts are filtered and deduplicated in SQL
+                posts = feed_queryset(user, settings_type)
+                if posts is None:
+                    return JsonResponse({"error": "Invalid settings_type"}, status=400)
+                page, next_cursor = get_page(posts, limit, cursor=cursor, offset=offset)
+        except InvalidCursor:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+        # The viewer's likes, reports and follows, for this page only
+        shown_posts = [post.original_post if post.is_repost else post for post in page]
+        viewer_state = load_viewer_state(
+            user.id,
+            [post.id for post in shown_posts],
+            [post.user_id for post in shown_posts],
+        )
+        user_likes_dict = viewer_state["likes"]
+        reported_posts = viewer_state["reported"]
+        current_user_following_set = viewer_state["following"]
 
         # Prepare the response data
         posts_data = []
-        all_posts_so_far = set()
-        post_count = 0
-
-        for post in posts[offset:]:  # Apply offset to skip already fetched posts
-            if post_count >= limit:  # Stop after fetching the required number of posts
-                break
-
+        for post in page:
             if post.is_repost:
-                # If the post is a repost, fetch the original post details
+                # If the post is a repost, show the original post details
                 original_post = post.original_post
-
-                # If the post is a repost,
-                # only show it to the current user
-                # if the current user is not following the original author
-                if (
-                    original_post.user.id in current_user_following_set
-                    or original_post.id in all_posts_so_far
-                ):
-                    continue
-                all_posts_so_far.add(original_post.id)
-
-                # Calculate likes and comments for the original post
-                original_likes_count = Like.objects.filter(post=original_post).count()
-                original_comments_count = Comment.objects.filter(
-                    post=original_post,
-                ).count()
-
                 post_data = {
                     "id": post.id,
                     "is_reported": original_post.id in reported_posts,
@@ -391,8 +309,8 @@ def get_posts(request):
                     "user_fullname": original_post.user.get_full_name(),
                     "user_avatar": original_post.user.get_avatar_url(),
                     "user_karma": original_post.user.get_karma(),
-                    "comments_count": original_comments_count,
-                    "likes_count": original_likes_count,
+                    "comments_count": original_post.comments_count,
+                    "likes_count": original_post.likes_count,
                     "user_has_liked": original_post.id
                     in user_likes_dict,  # Check if the user has liked the post
                     "like_type": user_likes_dict.get(
@@ -412,10 +330,6 @@ def get_posts(request):
                     },
                 }
                 posts_data.append(post_data)
-                post_count += 1
-                continue
-
-            if post.id in all_posts_so_far:
                 continue
 
             post_data = {
@@ -440,13 +354,14 @@ def get_posts(request):
                 # Check if the current user is following the post author
             }
             posts_data.append(post_data)
-            post_count += 1
 
         return JsonResponse(
             {
                 "posts": posts_data,
-                "has_more": len(posts) > (offset + limit),
                 # Indicate if there are more posts to fetch
+                "has_more": next_cursor is not None,
+                # Pass it back as ?cursor= to get the next page
+                "next_cursor": next_cursor,
             },
             safe=False,
             status=200,
@@ -459,7 +374,6 @@ def get_posts(request):
 def get_post(request, post_id):
     if request.method == "GET":
         try:
-            print(f"All posts in DB: {Post.objects.all().values_list('id', flat=True)}")
             post = get_object_or_404(Post, id=post_id)
         except Post.DoesNotExist:
             return JsonResponse({"error": "Post not found"}, status=404)
@@ -477,9 +391,9 @@ def get_post(request, post_id):
                     "date_created": comment.date_created,
                     "user": comment.user.get_full_name(),
                 }
-                for comment in post.comments.all()
+                for comment in post.comments.select_related("user")
             ],
-            "likes_count": post.likes.count(),
+            "likes_count": post.likes_count,
         }
         return JsonResponse(post_data, status=200)
 
@@ -514,7 +428,8 @@ def comments(request, post_id):
                 print("content:", content)
                 comment = Comment.objects.get(id=parent_comment_id, user_id=user_id)
                 comment.content = content
-                comment.save()
+                # Not the counters, signals may have moved them meanwhile
+                comment.save(update_fields=["content", "date_updated"])
                 return JsonResponse(
                     {
                         "id": comment.id,
@@ -557,9 +472,7 @@ def comments(request, post_id):
                 return JsonResponse({"error": "Parent comment not found"}, status=404)
 
         # increase karma by 2 for the owner of the post
-        post_user = post.user
-        post_user.karma += 2
-        post_user.save()
+        award_karma(post.user_id, COMMENT_RECEIVED, "comment_received")
 
         # Create the comment
         comment = Comment.objects.create(
@@ -619,28 +532,12 @@ def comments(request, post_id):
                 like["comment_id"]: like["like_type"] for like in user_likes
             }
 
-            # Subquery to count replies for each comment
-            replies_subquery = (
-                Comment.objects.filter(parent_comment_id=OuterRef("id"))
-                .values("parent_comment_id")
-                .annotate(count=Count("id"))
-                .values("count")
-            )
-
-            # Annotate comments with the total number of likes and replies
+            # likes_count and replies_count are stored on the comments
             comments_query = (
                 Comment.objects.filter(
                     post_id=post_id, parent_comment=parent_comment
                 )  # Filter by post and parent comment
                 .select_related("user")
-                .annotate(
-                    likes_count=Count(
-                        "comment_likes", distinct=True
-                    ),  # Count total likes for each comment
-                    replies_count=Subquery(
-                        replies_subquery, output_field=IntegerField()
-                    ),  # Count total replies for each comment
-                )
                 .order_by("-date_created")  # Order by most recent
             )
 
@@ -650,29 +547,7 @@ def comments(request, post_id):
 
             # Serialize the comments along with user details and like information
             comments_data = [
-                {
-                    "id": comment.id,
-                    "post_id": comment.post_id,
-                    "content": comment.content,
-                    "date_created": comment.date_created,
-                    "user": {
-                        "id": comment.user.id,
-                        "avatar_url": comment.user.avatar_url,
-                        "email": comment.user.email,  # Only include if necessary
-                        "first_name": comment.user.first_name,
-                        "last_name": comment.user.last_name,
-                        "user_karma": comment.user.karma,
-                    },
-                    "likes_count": comment.likes_count,  # Total likes on the comment
-                    "replies_count": comment.replies_count
-                    or 0,  # Total replies to the comment
-                    # Check if the current user has liked the comment
-                    "user_has_liked": comment.id in user_likes_dict,
-                    "like_type": user_likes_dict.get(
-                        comment.id
-                    ),  # Get the like_type if the user has liked the comment
-                }
-                for comment in page_comments
+                serialize_comment(comment, user_likes_dict) for comment in page_comments
             ]
 
             # Return the paginated comments and pagination metadata
@@ -695,6 +570,146 @@ def comments(request, post_id):
     return JsonResponse({"error": "Method not allowed", "status": 405}, status=405)
 
 
+def serialize_comment(comment, user_likes_dict):
+    return {
+        "id": comment.id,
+        "post_id": comment.post_id,
+        "content": comment.content,
+        "date_created": comment.date_created,
+        "user": {
+            "id": comment.user.id,
+            "avatar_url": comment.user.avatar_url,
+            "email": comment.user.email,  # Only include if necessary
+            "first_name": comment.user.first_name,
+            "last_name": comment.user.last_name,
+            "user_karma": comment.user.karma,
+        },
+        "likes_count": comment.likes_count,  # Total likes on the comment
+        "replies_count": comment.replies_count,  # Total replies
+        # Check if the current user has liked the comment
+        "user_has_liked": comment.id in user_likes_dict,
+        "like_type": user_likes_dict.get(
+            comment.id
+        ),  # Get the like_type if the user has liked the comment
+    }
+
+
+# Whole comment thread of a post, or of one comment, nested
+def comment_thread(request, post_id):
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed", "status": 405}, status=405)
+
+    user_id = request.GET.get("user_id")
+    if not user_id:
+        return JsonResponse({"error": "user_id is required"}, status=400)
+    try:
+        user_id = int(user_id)
+        # Optional: only the replies of this comment
+        comment_id = request.GET.get("comment_id")
+        comment_id = int(comment_id) if comment_id else None
+        # Optional: number of levels to return (1 = no replies)
+        depth = request.GET.get("depth")
+        depth = int(depth) if depth else None
+    except ValueError:
+        return JsonResponse(
+            {"error": "user_id, comment_id and depth must be integers"}, status=400
+        )
+    if depth is not None and depth < 1:
+        return JsonResponse({"error": "depth must be at least 1"}, status=400)
+
+    post = get_object_or_404(Post, id=post_id)
+    root = None
+    if comment_id is not None:
+        root = get_object_or_404(Comment, id=comment_id, post=post)
+
+    # One indexed range scan for the whole thread
+    thread = list(thread_queryset(post.id, root=root, max_depth=depth))
+    user_likes_dict = dict(
+        CommentLike.objects.filter(
+            user_id=user_id, comment_id__in=[comment.id for comment in thread]
+        ).values_list("comment_id", "like_type")
+    )
+    tree = build_tree(
+        thread, lambda comment: serialize_comment(comment, user_likes_dict)
+    )
+    return JsonResponse({"comments": tree, "status": 200}, status=200)
+
+
+def serialize_search_user(user):
+    return {
+        "id": user.id,
+        "avatar_url": user.avatar_url,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "user_karma": user.karma,
+    }
+
+
+def serialize_search_result(search_type, row):
+    if search_type == "users":
+        return serialize_search_user(row)
+    result = {
+        "id": row.id,
+        "content": row.content,
+        "date_created": row.date_created,
+        "user": serialize_search_user(row.user),
+        "likes_count": row.likes_count,
+        "rank": row.rank,
+    }
+    if search_type == "posts":
+        result["title"] = row.title
+        result["comments_count"] = row.comments_count
+    else:
+        result["post_id"] = row.post_id
+        result["parent_comment_id"] = row.parent_comment_id
+        result["replies_count"] = row.replies_count
+    return result
+
+
+# Search posts, comments or users
+def search(request):
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed", "status": 405}, status=405)
+
+    text = request.GET.get("q", "").strip()
+    search_type = request.GET.get("type", "posts")
+    if not text:
+        return JsonResponse({"error": "q is required"}, status=400)
+    if search_type not in SEARCH_TYPES:
+        return JsonResponse(
+            {"error": f"type must be one of {', '.join(SEARCH_TYPES)}"}, status=400
+        )
+    try:
+        page = int(request.GET.get("page", 1))
+        limit = int(request.GET.get("limit", 10))
+    except ValueError:
+        return JsonResponse({"error": "page and limit must be integers"}, status=400)
+    if page < 1 or not 1 <= limit <= 50:
+        return JsonResponse(
+            {"error": "page must be at least 1 and limit between 1 and 50"},
+            status=400,
+        )
+
+    searches = {
+        "posts": search_posts,
+        "comments": search_comments,
+        "users": search_users,
+    }
+    offset = (page - 1) * limit
+    # One row past the page tells whether there is a next one, no COUNT(*)
+    rows = list(searches[search_type](text)[offset : offset + limit + 1])
+    return JsonResponse(
+        {
+            "results": [
+                serialize_search_result(search_type, row) for row in rows[:limit]
+            ],
+            "has_more": len(rows) > limit,
+            "status": 200,
+        },
+        status=200,
+    )
+
+
 # Like a post
 @csrf_exempt
 def like_post(request, post_id):
@@ -715,23 +730,23 @@ def like_post(request, post_id):
                 # remove
                 Like.objects.filter(user=user, post=post).delete()
                 # reducer karma by 1 for the owner of the post
-                post_user = post.user
-                post_user.karma -= 1
-                post_user.save()
+                award_karma(post.user_id, -LIKE_RECEIVED, "like_removed")
             else:
                 # update
                 Like.objects.filter(user=user, post=post).update(like_type=like_type)
+                # update() sends no signal, the viewer's cached like_type is stale
+                invalidate_viewer_state(user.id)
         else:
             # Create a new like
             Like.objects.create(user=user, post=post, like_type=like_type)
             # increase karma by 1 for the owner of the post
-            post_user = post.user
-            post_user.karma += 1
-            post_user.save()
+            award_karma(post.user_id, LIKE_RECEIVED, "like_received")
+        # The counter was updated in the database by the like signals
+        post.refresh_from_db(fields=["likes_count"])
         return JsonResponse(
             {
                 "message": "Post liked successfully",
-                "likes_count": post.likes.count(),
+                "likes_count": post.likes_count,
                 "status": 201,
             },
             status=201,
@@ -752,8 +767,9 @@ def unlike_post(request, post_id):
             return JsonResponse({"error": "You have not liked this post"}, status=400)
 
         like.delete()
+        post.refresh_from_db(fields=["likes_count"])
         return JsonResponse(
-            {"message": "Post unliked successfully", "likes_count": post.likes.count()},
+            {"message": "Post unliked successfully", "likes_count": post.likes_count},
             status=200,
         )
 
@@ -776,19 +792,6 @@ def follow_unfollow_user(request, user_id):
         # Get the main user and post user
         main_user = User.objects.get(id=main_user_id)
         post_user = User.objects.get(id=post_user_id)
-        if follow:
-            notification_service.send_to_user(
-                user_id=post_user.id,
-                title="New Follower",
-                body=f"{main_user.first_name} has followed you!",
-                data={
-                    "url": "/messages/123",
-                    "type": "follow",
-                    "title": "New Follower",
-                    "body": f"{main_user.first_name} has followed you!",
-                },
-            )
-
         if follow:
             # Check if the main user is already following the post user
             if main_user.following.filter(id=post_user_id).exists():
@@ -796,11 +799,24 @@ def follow_unfollow_user(request, user_id):
                     {"error": "You are already following this user"}, status=400
                 )
 
-            # Create a new follow relationship
-            Follow.objects.create(main_user=main_user, following_user=post_user)
-            # increase karma by 3 if someone follows you
-            post_user.karma += 3
-            post_user.save()
+            # The follow, its karma and its notification are written together
+            with transaction.atomic():
+                # Create a new follow relationship
+                Follow.objects.create(main_user=main_user, following_user=post_user)
+                # increase karma by 3 if someone follows you
+                award_karma(post_user, FOLLOWER_GAINED, "follower_gained")
+                # Sent by the dispatch_notifications worker
+                enqueue_notification(
+                    user_id=post_user.id,
+                    title="New Follower",
+                    body=f"{main_user.first_name} has followed you!",
+                    data={
+                        "url": "/messages/123",
+                        "type": "follow",
+                        "title": "New Follower",
+                        "body": f"{main_user.first_name} has followed you!",
+                    },
+                )
             return JsonResponse({"message": "User followed successfully"}, status=201)
 
         else:
@@ -816,8 +832,7 @@ def follow_unfollow_user(request, user_id):
             # Delete the follow relationship
             follow_relationship.delete()
             # reduce karma by 3 if someone unfollows you
-            post_user.karma -= 3
-            post_user.save()
+            award_karma(post_user, -FOLLOWER_GAINED, "follower_lost")
             return JsonResponse({"message": "User unfollowed successfully"}, status=200)
 
     except User.DoesNotExist:
@@ -872,10 +887,11 @@ def like_comment(request, comment_id):
                     status=400,
                 )
         # Return the updated likes count and success message
+        comment.refresh_from_db(fields=["likes_count"])
         return JsonResponse(
             {
                 "message": message,
-                "likes_count": comment.comment_likes.count(),  # Use the related_name
+                "likes_count": comment.likes_count,
                 "status": 201,
             },
             status=201,
@@ -941,11 +957,14 @@ def report_post(request, post_id):
             is_repost=bool(repost_user),  # Set is_repost based on repost_user
         )
 
-        # Deduct karma from the post owner
-        post_owner.karma -= 10
-        post_owner.save()
+        # Deduct karma from the post owner and the repost user (if applicable)
+        with karma_batch():
+            award_karma(post_owner, POST_REPORTED, "post_reported")
+            if repost_user:
+                award_karma(repost_user, POST_REPORTED, "post_reported")
 
-        notification_service.send_to_user(
+        # Sent by the dispatch_notifications worker
+        enqueue_notification(
             user_id=post_owner.id,
             title="Post Reported",
             body="People are reporting your posts",
@@ -957,11 +976,6 @@ def report_post(request, post_id):
             },
         )
 
-        # Deduct karma from the repost user (if applicable)
-        if repost_user:
-            repost_user.karma -= 10
-            repost_user.save()
-
         return JsonResponse({"message": "Post reported successfully"}, status=201)
 
     return JsonResponse({"error": "Method not allowed"}, status=405)
@@ -1019,9 +1033,7 @@ def report_comment(request):
     )
 
     # Decrease the karma of the user who created the comment by 5
-    comment_user = comment.user
-    comment_user.karma -= 5
-    comment_user.save()
+    award_karma(comment.user_id, COMMENT_REPORTED, "comment_reported")
 
     return JsonResponse(
         {"message": "Comment reported successfully. Karma decreased by 5."},
@@ -1042,17 +1054,10 @@ def delete_comment(request, post_id, comment_id):
         post = get_object_or_404(Post, id=post_id)
         comment = get_object_or_404(Comment, id=comment_id, post=post)
 
-        # Count the number of comments before deletion
-        comments_before = Comment.objects.filter(post=post).count()
-
-        # Delete the comment (this will cascade to delete all replies)
-        comment.delete()
-
-        # Count the number of comments after deletion
-        comments_after = Comment.objects.filter(post=post).count()
-
-        # Calculate the number of comments deleted
-        total_deleted = comments_before - comments_after
+        # Delete the comment (this will cascade to delete all replies), the
+        # collector reports how many comments went with it
+        _, deleted = comment.delete()
+        total_deleted = deleted.get(Comment._meta.label, 0)
 
         return JsonResponse(
             {
@@ -4,7 +4,8 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django import forms
 from .models import IssueOnLocationReport
-import json
+from .moderation import approve_reports, revoke_reports
+import traceback
 
 
 class IssueOnLocationReportAdminForm(forms.ModelForm):
@@ -44,6 +45,7 @@ class IssueOnLocationReportAdmin(admin.ModelAdmin):
     )
     readonly_fields = ("created_at", "user_link", "location_map")
     date_hierarchy = "created_at"
+    actions = ["approve_selected", "revoke_selected"]
 
     def status_badge(self, obj):
         """Return colored status badge based on report status"""
@@ -174,56 +176,30 @@ class IssueOnLocationReportAdmin(admin.ModelAdmin):
         if is_approval_revoked and obj.heatmap_point_id:
             try:
                 print(f"Processing approval revocation for report {obj.id}")
+                point_id = obj.heatmap_point_id
+                result = revoke_reports([obj], status=obj.status)
+                obj.heatmap_point_id = None
 
-                # Use the API endpoint for revocation
-                from django.test import RequestFactory
-
-                process_url = reverse("revoke-report-approval")
-                factory = RequestFactory()
-                process_request = factory.post(process_url, data={"report_id": obj.id})
-                process_request.user = request.user
-
-                # Call the view directly
-                from django.urls import resolve
-
-                view_func, args, kwargs = resolve(process_url)
-                response = view_func(process_request)
-
-                # Process the response
-                response_data = json.loads(response.content.decode("utf-8"))
-                print(f"Response status: {response.status_code}")
-                print(f"Response content: {response_data}")
-
-                if response.status_code >= 400:
-                    messages.error(
+                new_count = result["new_counts"].get(point_id)
+                if result["deleted_points"]:
+                    messages.info(
                         request,
                         (
-                            "The approval was revoked, but there was an error on map: "
-                            f"{response_data.get('error', 'Unknown error')}",
+                            "Approval revoked and heatmap point"
+                            " removed because complaint count reached 0."
                         ),
                     )
                 else:
-                    if response_data.get("was_deleted", False):
-                        messages.info(
-                            request,
-                            (
-                                "Approval revoked and heatmap point"
-                                " removed because complaint count reached 0."
-                            ),
-                        )
-                    else:
-                        messages.info(
-                            request,
-                            (
-                                "Approval revoked and map point updated. New Count: "
-                                f"{response_data.get('new_complaint_count')}"
-                            ),
-                        )
+                    messages.info(
+                        request,
+                        (
+                            "Approval revoked and map point updated. New Count: "
+                            f"{new_count}"
+                        ),
+                    )
 
             except Exception as e:
                 print(f"Error processing approval revocation: {str(e)}")
-                import traceback
-
                 traceback.print_exc()
 
                 messages.error(
@@ -242,76 +218,82 @@ class IssueOnLocationReportAdmin(admin.ModelAdmin):
         if is_newly_approved:
             try:
                 print(f"Processing newly approved report {obj.id}")
+                result = approve_reports([obj])
+                point_id = result["point_ids"].get(obj.id)
+                if point_id is not None:
+                    obj.heatmap_point_id = point_id
 
-                # Direct server-side call using Django's built-in methods
-                from django.test import RequestFactory
-
-                process_url = reverse("process-approved-report")
-                factory = RequestFactory()
-                process_request = factory.post(process_url, data={"report_id": obj.id})
-                process_request.user = request.user
-
-                # Call the view directly
-                from django.urls import resolve
-
-                view_func, args, kwargs = resolve(process_url)
-                response = view_func(process_request)
-
-                # Process the response
-                response_data = json.loads(response.content.decode("utf-8"))
-                print(f"Response status: {response.status_code}")
-                print(f"Response content: {response_data}")
-
-                if response.status_code >= 400:
-                    messages.error(
+                # Success message based on what action was taken
+                if result["updated_points"]:
+                    messages.success(
                         request,
                         (
-                            "The report was approved, "
-                            "but there was an error processing it: "
-                            f"{response_data.get('error', 'Unknown error')}"
+                            "Report approved and added to existing point"
+                            f" (ID: {point_id}). New complaint count: "
+                            f"{result['new_counts'].get(point_id)}"
+                        ),
+                    )
+                elif result["created_points"]:
+                    messages.success(
+                        request,
+                        (
+                            "Report approved and new point "
+                            f"created with ID: {point_id}"
                         ),
                     )
-                else:
-                    # Store the heatmap point ID in the report
-                    point_id = response_data.get("point_id")
-
-                    # Update the report with the heatmap point ID
-                    obj.heatmap_point_id = point_id
-                    obj.save(update_fields=["heatmap_point_id"])
-
-                    # Success message based on what action was taken
-                    if response_data.get("message") == "Updated existing point":
-                        messages.success(
-                            request,
-                            (
-                                "Report approved and added to existing point"
-                                f" (ID: {point_id}). New complaint count: "
-                                f"{response_data.get('new_complaint_count')}"
-                            ),
-                        )
-                    else:
-                        messages.success(
-                            request,
-                            (
-                                "Report approved and new point "
-                                f"created with ID: {point_id}"
-                            ),
-                        )
 
             except Exception as e:
                 print(f"Error processing approved report: {str(e)}")
-                import traceback
-
                 traceback.print_exc()
 
                 messages.error(
                     request,
                     (
                         "The report was approved, "
-                        f"but there was an error processing it: {str(e)}",
+                        f"but there was an error processing it: {str(e)}"
                     ),
                 )
 
+    @admin.action(description="Approve selected reports and add them to the map")
+    def approve_selected(self, request, queryset):
+        try:
+            result = approve_reports(queryset)
+        except Exception as e:
+            traceback.print_exc()
+            self.message_user(
+                request, f"Could not approve the reports: {str(e)}", messages.ERROR
+            )
+            return
+        self.message_user(
+            request,
+            (
+                f"{result['processed']} report(s) added to the map: "
+                f"{result['updated_points']} point(s) updated, "
+                f"{result['created_points']} created."
+            ),
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Revoke approval of selected reports")
+    def revoke_selected(self, request, queryset):
+        try:
+            result = revoke_reports(queryset)
+        except Exception as e:
+            traceback.print_exc()
+            self.message_user(
+                request, f"Could not revoke the reports: {str(e)}", messages.ERROR
+            )
+            return
+        self.message_user(
+            request,
+            (
+                f"{result['processed']} report(s) removed from the map: "
+                f"{result['updated_points']} point(s) updated, "
+                f"{result['deleted_points']} removed."
+            ),
+            messages.SUCCESS,
+        )
+
 
 # Register the model with the custom admin class
 admin.site.register(IssueOnLocationReport, IssueOnLocationReportAdmin)
@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+import pyproj
+import shapely
+
+# UTM zone 18N (appropriate for NYC), buffers are computed in meters there.
+# Transformers are expensive to build and thread-safe, build them once.
+WGS84_TO_UTM = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:26918", always_xy=True)
+UTM_TO_WGS84 = pyproj.Transformer.from_crs("EPSG:26918", "EPSG:4326", always_xy=True)
+
+# NYC avg block dimensions: short side ~80m, long side ~270m
+MIN_AVOID_RADIUS = 80  # meters (approximately one short NYC block)
+MAX_AVOID_RADIUS = 200  # meters (less than one long NYC block)
+MAX_RADIUS_COMPLAINTS = 100
+
+# Simplify to reduce complexity (helps with API request size)
+SIMPLIFY_TOLERANCE = 0.0002
+
+
+def avoid_radii(complaints):
+    """Avoidance radius in meters, growing with the number of complaints"""
+    complaint_factor = np.minimum(
+        1.0, np.asarray(complaints, dtype=np.float64) / MAX_RADIUS_COMPLAINTS
+    )
+    return MIN_AVOID_RADIUS + (MAX_AVOID_RADIUS - MIN_AVOID_RADIUS) * complaint_factor
+
+
+def _to_wgs84(coords):
+    longitudes, latitudes = UTM_TO_WGS84.transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([longitudes, latitudes])
+
+
+def build_avoid_polygons(longitudes, latitudes, complaints):
+    """
+    Buffer hotspots in UTM and bring the buffers back to WGS84, all at once
+
+    Returns:
+        numpy.ndarray: One simplified Polygon per hotspot
+    """
+    if len(longitudes) == 0:
+        return np.array([], dtype=object)
+    x, y = WGS84_TO_UTM.transform(
+        np.asarray(longitudes, dtype=np.float64),
+        np.asarray(latitudes, dtype=np.float64),
+    )
+    buffers = shapely.buffer(shapely.points(x, y), avoid_radii(complaints))
+    return shapely.simplify(shapely.transform(buffers, _to_wgs84), SIMPLIFY_TOLERANCE)
+
+
+class AvoidPolygonStore:
+    """
+    Avoidance polygons by hotspot id
+
+    A hotspot never moves, but its radius depends on its complaint count, so
+    entries are stored with the count they were built for and rebuilt when a
+    report changes it.
+    """
+
+    def __init__(self):
+        self._polygons = {}
+        self._lock = threading.Lock()
+
+    def fill(self, ids, longitudes, latitudes, complaints):
+        """Precompute the polygons of many hotspots in one vectorized pass"""
+        polygons = build_avoid_polygons(longitudes, latitudes, complaints)
+        entries = {
+            int(hotspot_id): (float(count), polygon)
+            for hotspot_id, count, polygon in zip(ids, complaints, polygons)
+        }
+        with self._lock:
+            self._polygons.update(entries)
+
+    def get_many(self, hotspots):
+        """
+        Polygons for a list of hotspot dictionaries, in the same order
+
+        Hotspots that are missing (or have no id) are built in one batch,
+        only the ones with an id are kept for next time.
+        """
+        polygons = [None] * len(hotspots)
+        missing = []
+        for i, hotspot in enumerate(hotspots):
+            entry = self._polygons.get(hotspot.get("id"))
+            if entry is not None and entry[0] == float(hotspot["complaints"]):
+                polygons[i] = entry[1]
+            else:
+                missing.append(i)
+
+        if missing:
+            built = build_avoid_polygons(
+                [hotspots[i]["longitude"] for i in missing],
+                [hotspots[i]["latitude"] for i in missing],
+                [hotspots[i]["complaints"] for i in missing],
+            )
+            with self._lock:
+                for i, polygon in zip(missing, built):
+                    polygons[i] = polygon
+                    if hotspots[i].get("id") is not None:
+                        self._polygons[hotspots[i]["id"]] = (
+                            float(hotspots[i]["complaints"]),
+                            polygon,
+                        )
+
+        return polygons
+
+    def clear(self):
+        with self._lock:
+            self._polygons = {}
+
+    def __len__(self):
+        return len(self._polygons)
+
+
+avoid_polygon_store = AvoidPolygonStore()
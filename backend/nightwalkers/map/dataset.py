@@ -0,0 +1,37 @@
+import time
+from django.core.cache import cache
+
+DATASET_VERSION_KEY = "map:crime-dataset-version"
+
+
+def clock_version():
+    return time.time_ns() // 1000
+
+
+def get_dataset_version():
+    """
+    Return the current version of the filtered_grouped_data_centroid table.
+
+    Everything derived from the crime table (heatmap tiles, cached routes...)
+    is keyed on this number, so bumping it invalidates all of it at once.
+    The counter is seeded from the clock (in microseconds, bumps never come
+    that fast) so that losing the key (cache restart, eviction) never hands
+    out a version that was already used. Clients see it in heatmap ETags.
+    """
+    version = cache.get(DATASET_VERSION_KEY)
+    if version is None:
+        cache.add(DATASET_VERSION_KEY, clock_version(), timeout=None)
+        version = cache.get(DATASET_VERSION_KEY, clock_version())
+    return version
+
+
+def bump_dataset_version():
+    """Mark the crime table as changed and return the new version"""
+    get_dataset_version()
+    try:
+        return cache.incr(DATASET_VERSION_KEY)
+    except ValueError:
+        # Key was evicted between the get and the incr
+        version = clock_version()
+        cache.set(DATASET_VERSION_KEY, version, timeout=None)
+        return version
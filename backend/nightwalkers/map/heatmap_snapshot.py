@@ -0,0 +1,182 @@
+import json
+import threading
+from django.core.cache import cache
+from django.db import connection
+from .dataset import bump_dataset_version, get_dataset_version
+from .tiles import PRIMARY_THRESHOLD, pack_points, parse_intensity
+
+# Snapshots are keyed by dataset version, so they never need to expire
+HEATMAP_CACHE_TIMEOUT = 60 * 60 * 24
+
+HEATMAP_FORMATS = {
+    "json": "application/json",
+    "float32": "application/octet-stream",
+}
+
+
+def layer_of(complaints):
+    """Layer a point with this many complaints belongs to, None if none"""
+    if complaints is None:
+        return None
+    return "primary" if complaints >= PRIMARY_THRESHOLD else "secondary"
+
+
+def encode_point(latitude, longitude, complaints):
+    """
+    Serialize one point in both formats
+
+    Returns:
+        tuple: (JSON object bytes, packed float32 bytes, see tiles.pack_points)
+    """
+    fragment = json.dumps(
+        {
+            "latitude": latitude,
+            "longitude": longitude,
+            "intensity": parse_intensity(complaints),
+        }
+    ).encode()
+    return fragment, pack_points([(latitude, longitude, complaints)])
+
+
+def heatmap_cache_key(version, layer, payload_format):
+    return f"map:heatmap:{version}:{layer}:{payload_format}"
+
+
+def heatmap_etag(version, layer, payload_format):
+    return f'"heatmap-{layer}-{payload_format}-{version}"'
+
+
+class HeatmapSnapshot:
+    """
+    Materialized full heatmap layers, served as ready byte strings
+
+    Each layer is kept as {ogc_fid: encoded point} for one dataset version
+    (centroids may share coordinates, so they are keyed by id). Report
+    approvals/revocations change a single point, so record_point() patches
+    the layers of this process and publishes the payloads of the new version
+    without reading the table again. Layers that were never loaded here, or
+    are behind another worker's bump, are rebuilt from the database on the
+    next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._layers = {}
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self._layers = {}
+
+    def fetch_layer(self, layer):
+        """
+        Returns:
+            dict: Encoded points by ogc_fid, in table order
+        """
+        operator_sql = ">=" if layer == "primary" else "<"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""SELECT ogc_fid,
+                ST_Y(wkb_geometry) AS latitude,
+                ST_X(wkb_geometry) AS longitude,
+                CMPLNT_NUM
+                FROM filtered_grouped_data_centroid
+                WHERE CMPLNT_NUM {operator_sql} %s;""",
+                [PRIMARY_THRESHOLD],
+            )
+            rows = cursor.fetchall()
+        return {
+            point_id: encode_point(latitude, longitude, complaints)
+            for point_id, latitude, longitude, complaints in rows
+        }
+
+    def _serialize(self, points, payload_format):
+        if payload_format == "json":
+            return b"[" + b",".join(point[0] for point in points.values()) + b"]"
+        return b"".join(point[1] for point in points.values())
+
+    def _publish(self, version, layer, points):
+        cache.set_many(
+            {
+                heatmap_cache_key(version, layer, payload_format): self._serialize(
+                    points, payload_format
+                )
+                for payload_format in HEATMAP_FORMATS
+            },
+            HEATMAP_CACHE_TIMEOUT,
+        )
+
+    def get_payload(self, layer, payload_format="json"):
+        """
+        Serialized layer for the current dataset version
+
+        Returns:
+            tuple: (payload bytes, dataset version)
+        """
+        version = get_dataset_version()
+        key = heatmap_cache_key(version, layer, payload_format)
+        payload = cache.get(key)
+        if payload is not None:
+            return payload, version
+
+        with self._lock:
+            points = self._layers.get(layer) if self.version == version else None
+        if points is None:
+            points = self.fetch_layer(layer)
+
+        with self._lock:
+            if self.version is None or self.version < version:
+                self.version = version
+                self._layers = {layer: points}
+            elif self.version == version:
+                points = self._layers.setdefault(layer, points)
+            # Points are patched in place, serialize them under the lock
+            self._publish(version, layer, points)
+            payload = self._serialize(points, payload_format)
+        return payload, version
+
+    def record_point(self, point_id, latitude, longitude, complaints):
+        """
+        Record a point changed by a report and bump the dataset version
+
+        Call it after the change is written to filtered_grouped_data_centroid.
+        point_id is the point's ogc_fid, complaints the new count, None or 0
+        when the point was removed.
+
+        Returns:
+            int: The new dataset version
+        """
+        return self.record_points([(point_id, latitude, longitude, complaints)])
+
+    def record_points(self, points):
+        """
+        Same as record_point for many (point_id, latitude, longitude,
+        complaints), with a single version bump
+        """
+        previous = get_dataset_version()
+        version = bump_dataset_version()
+
+        with self._lock:
+            if self.version != previous or version != previous + 1:
+                # Another change slipped in between, let the next read reload
+                self.version = None
+                self._layers = {}
+                return version
+
+            for point_id, latitude, longitude, complaints in points:
+                target = layer_of(complaints) if complaints else None
+                for layer, layer_points in self._layers.items():
+                    if layer == target:
+                        layer_points[point_id] = encode_point(
+                            latitude, longitude, complaints
+                        )
+                    else:
+                        layer_points.pop(point_id, None)
+            for layer, layer_points in self._layers.items():
+                self._publish(version, layer, layer_points)
+            self.version = version
+        return version
+
+
+heatmap_snapshot = HeatmapSnapshot()
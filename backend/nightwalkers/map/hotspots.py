@@ -0,0 +1,219 @@
+import threading
+import time
+import numpy as np
+import shapely
+from django.db import connection
+from .avoid_polygons import avoid_polygon_store
+from .dataset import get_dataset_version
+from .tiles import PRIMARY_THRESHOLD
+
+# First search radius around the route in degrees (~500m in NYC). The radius
+# grows until no point outside of it could still make the top results.
+INITIAL_SEARCH_RADIUS = 0.005
+SEARCH_RADIUS_GROWTH = 4
+MAX_SEARCH_RADIUS = 360
+
+# Reload even without a version bump, in case the table was re-imported
+MAX_INDEX_AGE = 60 * 60
+
+
+def hotspot_score(complaints, distance):
+    """Balance between proximity and crime intensity (higher is worse)"""
+    return (complaints * 0.7) / np.power(distance + 0.001, 1.5)
+
+
+def segment_distances(points, starts, ends):
+    """Planar distance from each point to the matching segment (same units)"""
+    direction = ends - starts
+    length_sq = np.einsum("ij,ij->i", direction, direction)
+    projection = np.einsum("ij,ij->i", points - starts, direction)
+    t = np.clip(
+        np.divide(
+            projection,
+            length_sq,
+            out=np.zeros_like(projection),
+            where=length_sq > 0,
+        ),
+        0.0,
+        1.0,
+    )
+    closest = starts + t[:, None] * direction
+    return np.hypot(points[:, 0] - closest[:, 0], points[:, 1] - closest[:, 1])
+
+
+class HotspotIndex:
+    """
+    In-memory copy of the crime hotspots (CMPLNT_NUM >= 5) with an STRtree,
+    so the routing pipeline can pick hotspots near a route without a
+    database round trip.
+
+    Arrays are swapped in one assignment on reload, readers always see a
+    consistent snapshot without taking the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.loaded_at = 0
+        self.load_rows([])
+
+    def load_rows(self, rows):
+        """
+        Build the index from (ogc_fid, latitude, longitude, complaints) rows
+        """
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        coords = np.array([(row[2], row[1]) for row in rows], dtype=np.float64).reshape(
+            -1, 2
+        )
+        complaints = np.array(
+            [float(row[3]) if row[3] is not None else 0.0 for row in rows],
+            dtype=np.float64,
+        )
+        tree = shapely.STRtree(shapely.points(coords))
+        self._data = (ids, coords, complaints, tree)
+
+    def load(self):
+        """Load the hotspots from filtered_grouped_data_centroid"""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        version = get_dataset_version()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT ogc_fid,
+                ST_Y(wkb_geometry) AS latitude,
+                ST_X(wkb_geometry) AS longitude,
+                CMPLNT_NUM
+                FROM filtered_grouped_data_centroid
+                WHERE CMPLNT_NUM >= %s;""",
+                [PRIMARY_THRESHOLD],
+            )
+            self.load_rows(cursor.fetchall())
+        self.version = version
+        self.loaded_at = time.monotonic()
+        print(f"Loaded {len(self)} crime hotspots (dataset version {version})")
+
+    def is_stale(self):
+        if self.version is None:
+            return True
+        if time.monotonic() - self.loaded_at > MAX_INDEX_AGE:
+            return True
+        return self.version != get_dataset_version()
+
+    def ensure_fresh(self):
+        """Reload the index if the crime table changed since the last load"""
+        if self.is_stale():
+            with self._lock:
+                # Another thread may have reloaded while we were waiting
+                if self.is_stale():
+                    self._load()
+
+    def invalidate(self):
+        """Force a reload on the next query"""
+        self.version = None
+
+    def warm_up(self):
+        """
+        Load the index and the avoidance polygons of every hotspot in a
+        background thread so the first route is fast
+        """
+
+        def _load():
+            try:
+                self.ensure_fresh()
+                ids, coords, complaints, _ = self._data
+                avoid_polygon_store.fill(ids, coords[:, 0], coords[:, 1], complaints)
+            except Exception as e:
+                print(f"Could not load the crime hotspot index: {str(e)}")
+            finally:
+                connection.close()
+
+        threading.Thread(target=_load, daemon=True).start()
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def query(self, route, limit=10, exclude=None, min_distance=0.005):
+        """
+        Find the hotspots with the highest score relative to a route
+
+        Args:
+            route (LineString): Route geometry in WGS84
+            limit (int): Maximum number of hotspots to return
+            exclude (list): Hotspots whose surroundings should be skipped
+            min_distance (float): Exclusion distance around them in degrees
+
+        Returns:
+            list: Hotspot dictionaries ordered by decreasing score
+        """
+        ids, coords, complaints, tree = self._data
+        route_coords = shapely.get_coordinates(route)
+        if len(ids) == 0 or len(route_coords) == 0 or limit <= 0:
+            return []
+        if len(route_coords) == 1:
+            route_coords = np.repeat(route_coords, 2, axis=0)
+
+        # Work segment by segment: a long diagonal route has a huge bounding
+        # box, its individual segments do not
+        starts, ends = route_coords[:-1], route_coords[1:]
+        lower, upper = np.minimum(starts, ends), np.maximum(starts, ends)
+
+        excluded = np.array(
+            [(h["longitude"], h["latitude"]) for h in exclude or []],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        max_complaints = complaints.max()
+        radius = INITIAL_SEARCH_RADIUS
+
+        while True:
+            boxes = shapely.box(
+                lower[:, 0] - radius,
+                lower[:, 1] - radius,
+                upper[:, 0] + radius,
+                upper[:, 1] + radius,
+            )
+            segment_idx, point_idx = tree.query(boxes)
+            pair_distances = segment_distances(
+                coords[point_idx], starts[segment_idx], ends[segment_idx]
+            )
+            within = pair_distances <= radius
+
+            # Distance to the route is the distance to its closest segment
+            route_distances = np.full(len(ids), np.inf)
+            np.minimum.at(route_distances, point_idx[within], pair_distances[within])
+            candidates = np.flatnonzero(np.isfinite(route_distances))
+            searched_everything = (
+                len(candidates) == len(ids) or radius >= MAX_SEARCH_RADIUS
+            )
+
+            if len(excluded) and len(candidates):
+                offsets = coords[candidates, None, :] - excluded[None, :, :]
+                nearest = np.hypot(offsets[..., 0], offsets[..., 1]).min(axis=1)
+                candidates = candidates[nearest > min_distance]
+
+            distances = route_distances[candidates]
+            scores = hotspot_score(complaints[candidates], distances)
+            order = np.argsort(-scores, kind="stable")[:limit]
+
+            # Nothing outside the radius can beat the current last result
+            outside_bound = hotspot_score(max_complaints, radius)
+            if searched_everything or (
+                len(order) == limit and scores[order[-1]] >= outside_bound
+            ):
+                break
+            radius *= SEARCH_RADIUS_GROWTH
+
+        return [
+            {
+                "id": int(ids[candidates[i]]),
+                "latitude": float(coords[candidates[i], 1]),
+                "longitude": float(coords[candidates[i], 0]),
+                "complaints": float(complaints[candidates[i]]),
+                "distance": float(distances[i]),
+            }
+            for i in order
+        ]
+
+
+hotspot_index = HotspotIndex()
@@ -0,0 +1,63 @@
+import time
+import geopandas as gpd
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from map.dataset import get_dataset_version
+from map.road_graph import (
+    build_road_graph,
+    fetch_crime_points,
+    save_road_graph,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the local walking graph from road segments split at "
+        "intersections (see generate_blocks.py), weighted by crime risk"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "segments", nargs="+", help="Shapefile/GeoParquet of road segments"
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.ROAD_GRAPH_DIR,
+            help="Directory the graph arrays are written to",
+        )
+        parser.add_argument(
+            "--no-risk",
+            action="store_true",
+            help=(
+                "Skip the crime risk weights, the server computes them " "on first use"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        frames = []
+        for path in options["segments"]:
+            if path.endswith(".parquet"):
+                frames.append(gpd.read_parquet(path))
+            else:
+                frames.append(gpd.read_file(path))
+        roads = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True))
+        if roads.crs is not None:
+            roads = roads.to_crs("EPSG:4326")
+
+        version, crime_points = None, None
+        if not options["no_risk"]:
+            # Read before the points, see RoadGraph.refresh_weights
+            version = get_dataset_version()
+            crime_points = fetch_crime_points()
+        arrays = build_road_graph(roads.geometry.values, crime_points)
+        save_road_graph(arrays, options["output"], version)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Saved {len(arrays['indptr']) - 1} nodes and "
+                f"{len(arrays['neighbors'])} edges to {options['output']} "
+                f"in {time.monotonic() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from map.segmentation import DEFAULT_TILE_SIZE, generate_blocks
+
+
+class Command(BaseCommand):
+    help = (
+        "Split road shapefiles (e.g. the NYC TIGER roads of each borough) "
+        "into segments between intersections"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("roads", nargs="+", help="Road Shapefiles/GeoParquet")
+        parser.add_argument(
+            "--output",
+            default="output_data/nyc_blocks.shp",
+            help="Output file: Shapefile, GeoPackage... or GeoParquet (needs pyarrow)",
+        )
+        parser.add_argument(
+            "--tile-size",
+            type=float,
+            default=DEFAULT_TILE_SIZE,
+            help="Tile size in degrees",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Worker processes"
+        )
+
+    def handle(self, *args, **options):
+        generate_blocks(
+            options["roads"],
+            options["output"],
+            tile_size=options["tile_size"],
+            workers=options["workers"],
+            log=self.stdout.write,
+        )
@@ -0,0 +1,315 @@
+"""
+Bulk approval/revocation of IssueOnLocationReport
+
+process_approved_report and revoke_report_approval (views.py) handle one
+report per request. These functions handle any number of reports in one
+transaction with a handful of set-based statements: one lateral spatial
+join to find the nearby points, one UPDATE ... FROM (VALUES ...) for the
+complaint counts and one multi-row INSERT for the new points.
+"""
+
+import uuid
+from collections import Counter
+import numpy as np
+from django.db import connection, transaction
+from .avoid_polygons import WGS84_TO_UTM
+from .heatmap_snapshot import heatmap_snapshot
+from .models import IssueOnLocationReport
+
+# A report joins an existing point closer than this (see _check_nearby_points)
+NEARBY_DISTANCE = 100  # meters
+
+# Rows per statement, keeps the VALUES lists and their parameters bounded
+BATCH_SIZE = 500
+
+
+def batches(items):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start : start + BATCH_SIZE]
+
+
+def values_list(row_sql, count):
+    """VALUES body with count rows of row_sql"""
+    return ", ".join([row_sql] * count)
+
+
+def find_nearby_points(cursor, reports, max_distance_meters=NEARBY_DISTANCE):
+    """
+    Closest point within max_distance_meters of each report
+
+    Returns:
+        dict: ogc_fid by report id, reports with no nearby point are missing
+    """
+    nearby = {}
+    for batch in batches(reports):
+        params = []
+        for report in batch:
+            params.extend([report.id, report.longitude, report.latitude])
+        rows = values_list("(%s::integer, %s::float8, %s::float8)", len(batch))
+        cursor.execute(
+            f"""
+            SELECT r.report_id, p.ogc_fid
+            FROM (
+                SELECT report_id,
+                       ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) AS location
+                FROM (VALUES {rows}) AS v (report_id, longitude, latitude)
+            ) AS r
+            CROSS JOIN LATERAL (
+                SELECT ogc_fid
+                FROM filtered_grouped_data_centroid
+                WHERE ST_DWithin(
+                          wkb_geometry::geography,
+                          r.location::geography,
+                          %s
+                      )
+                ORDER BY wkb_geometry <-> r.location
+                LIMIT 1
+            ) AS p;
+            """,
+            params + [max_distance_meters],
+        )
+        nearby.update(dict(cursor.fetchall()))
+    return nearby
+
+
+def group_reports(reports, max_distance_meters=NEARBY_DISTANCE):
+    """
+    Split reports with no nearby point into the new points they create
+
+    Processed one by one, a report creates a point and the next reports
+    within max_distance_meters of it join that point. Same here, the first
+    report of each group is where its point is created.
+
+    Returns:
+        list: Lists of reports, one per new point
+    """
+    if not reports:
+        return []
+    x, y = WGS84_TO_UTM.transform(
+        np.array([report.longitude for report in reports], dtype=np.float64),
+        np.array([report.latitude for report in reports], dtype=np.float64),
+    )
+    groups = []
+    anchors = []
+    for i, report in enumerate(reports):
+        if anchors:
+            distances = np.hypot(x[anchors] - x[i], y[anchors] - y[i])
+            closest = int(np.argmin(distances))
+            if distances[closest] <= max_distance_meters:
+                groups[closest].append(report)
+                continue
+        anchors.append(i)
+        groups.append([report])
+    return groups
+
+
+def change_complaint_counts(cursor, changes):
+    """
+    Add a (possibly negative) number of complaints to many points
+
+    Args:
+        changes (dict): Complaints to add by ogc_fid
+
+    Returns:
+        dict: (new count, latitude, longitude) by ogc_fid
+    """
+    counts = {}
+    for batch in batches(list(changes.items())):
+        params = [value for change in batch for value in change]
+        rows = values_list("(%s::integer, %s::integer)", len(batch))
+        cursor.execute(
+            f"""
+            UPDATE filtered_grouped_data_centroid AS c
+            SET cmplnt_num = GREATEST(0, c.cmplnt_num + v.added),
+                ratio      = CASE
+                                 WHEN c.total_popu > 0
+                                     THEN GREATEST(0, c.cmplnt_num + v.added)::float
+                                     / c.total_popu
+                                 ELSE 0
+                END
+            FROM (VALUES {rows}) AS v (ogc_fid, added)
+            WHERE c.ogc_fid = v.ogc_fid
+            RETURNING c.ogc_fid,
+                c.cmplnt_num,
+                ST_Y(c.wkb_geometry),
+                ST_X(c.wkb_geometry);
+            """,
+            params,
+        )
+        for point_id, count, latitude, longitude in cursor.fetchall():
+            counts[point_id] = (count, latitude, longitude)
+    return counts
+
+
+def insert_points(cursor, groups):
+    """
+    Create one point per group of reports, at the first report
+
+    Returns:
+        list: ogc_fid of each group's new point
+    """
+    # RETURNING rows are matched on road_seg_i, two groups must never share one
+    road_ids = set()
+    while len(road_ids) < len(groups):
+        road_ids.add(f"R-{uuid.uuid4().hex[:8].upper()}")
+    road_ids = list(road_ids)
+    point_ids = {}
+    for batch in batches(list(zip(road_ids, groups))):
+        params = []
+        for road_id, group in batch:
+            params.extend([road_id, len(group), group[0].longitude, group[0].latitude])
+        rows = values_list(
+            "(%s, 0, %s, 0.0, ST_SetSRID(ST_MakePoint(%s, %s), 4326))", len(batch)
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO filtered_grouped_data_centroid
+                (road_seg_i, total_popu, cmplnt_num, ratio, wkb_geometry)
+            VALUES {rows}
+            RETURNING road_seg_i, ogc_fid;
+            """,
+            params,
+        )
+        # RETURNING does not guarantee the VALUES order
+        point_ids.update(dict(cursor.fetchall()))
+    return [point_ids[road_id] for road_id in road_ids]
+
+
+def delete_points(cursor, point_ids):
+    if point_ids:
+        cursor.execute(
+            """
+            DELETE
+            FROM filtered_grouped_data_centroid
+            WHERE ogc_fid = ANY(%s);
+            """,
+            [list(point_ids)],
+        )
+
+
+def approve_reports(reports, max_distance_meters=NEARBY_DISTANCE):
+    """
+    Approve reports and add them to filtered_grouped_data_centroid
+
+    Reports already on the heatmap are only marked approved, so running it
+    twice never counts a report twice.
+
+    Args:
+        reports (iterable): IssueOnLocationReport instances or ids
+
+    Returns:
+        dict: {"processed", "updated_points", "created_points", "point_ids",
+        "new_counts"}, point_ids maps each processed report id to its heatmap
+        point, new_counts each changed point to its complaint count
+    """
+    ids = [getattr(report, "id", report) for report in reports]
+    with transaction.atomic():
+        locked = list(
+            IssueOnLocationReport.objects.select_for_update()
+            .filter(id__in=ids)
+            .order_by("id")
+        )
+        IssueOnLocationReport.objects.filter(id__in=ids).exclude(
+            status="approved"
+        ).update(status="approved")
+        pending = [report for report in locked if report.heatmap_point_id is None]
+        if not pending:
+            return {
+                "processed": 0,
+                "updated_points": 0,
+                "created_points": 0,
+                "point_ids": {},
+                "new_counts": {},
+            }
+
+        with connection.cursor() as cursor:
+            point_ids = find_nearby_points(cursor, pending, max_distance_meters)
+            counts = change_complaint_counts(cursor, Counter(point_ids.values()))
+
+            groups = group_reports(
+                [report for report in pending if report.id not in point_ids],
+                max_distance_meters,
+            )
+            for group, point_id in zip(groups, insert_points(cursor, groups)):
+                first = group[0]
+                counts[point_id] = (len(group), first.latitude, first.longitude)
+                for report in group:
+                    point_ids[report.id] = point_id
+
+        for report in pending:
+            report.heatmap_point_id = point_ids[report.id]
+        IssueOnLocationReport.objects.bulk_update(pending, ["heatmap_point_id"])
+
+        # Readers must not rebuild the heatmap from the table before commit
+        changed = [
+            (point_id, latitude, longitude, count)
+            for point_id, (count, latitude, longitude) in counts.items()
+        ]
+        transaction.on_commit(lambda: heatmap_snapshot.record_points(changed))
+
+    return {
+        "processed": len(pending),
+        "updated_points": len(counts) - len(groups),
+        "created_points": len(groups),
+        "point_ids": point_ids,
+        "new_counts": {point_id: row[0] for point_id, row in counts.items()},
+    }
+
+
+def revoke_reports(reports, status="pending"):
+    """
+    Take reports off filtered_grouped_data_centroid and set their status
+
+    Points left with no complaint are deleted.
+
+    Args:
+        reports (iterable): IssueOnLocationReport instances or ids
+        status (str): Status of the approved reports afterwards
+
+    Returns:
+        dict: {"processed", "updated_points", "deleted_points", "new_counts"},
+        new_counts maps each changed point to its complaint count
+    """
+    ids = [getattr(report, "id", report) for report in reports]
+    with transaction.atomic():
+        locked = list(
+            IssueOnLocationReport.objects.select_for_update()
+            .filter(id__in=ids)
+            .order_by("id")
+        )
+        IssueOnLocationReport.objects.filter(id__in=ids, status="approved").update(
+            status=status
+        )
+        attached = [report for report in locked if report.heatmap_point_id]
+        if not attached:
+            return {
+                "processed": 0,
+                "updated_points": 0,
+                "deleted_points": 0,
+                "new_counts": {},
+            }
+
+        removed = Counter(report.heatmap_point_id for report in attached)
+        with connection.cursor() as cursor:
+            counts = change_complaint_counts(
+                cursor, {point_id: -count for point_id, count in removed.items()}
+            )
+            emptied = [point_id for point_id, row in counts.items() if row[0] == 0]
+            delete_points(cursor, emptied)
+
+        for report in attached:
+            report.heatmap_point_id = None
+        IssueOnLocationReport.objects.bulk_update(attached, ["heatmap_point_id"])
+
+        changed = [
+            (point_id, latitude, longitude, count)
+            for point_id, (count, latitude, longitude) in counts.items()
+        ]
+        transaction.on_commit(lambda: heatmap_snapshot.record_points(changed))
+
+    return {
+        "processed": len(attached),
+        "updated_points": len(counts) - len(emptied),
+        "deleted_points": len(emptied),
+        "new_counts": {point_id: row[0] for point_id, row in counts.items()},
+    }
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class ORSClient:
+    """
+    Shared OpenRouteService client
+
+    - one requests.Session, so connections (and their TLS handshakes) are
+      pooled and kept alive between route requests
+    - every call has a timeout
+    - identical requests that are in flight at the same time are coalesced:
+      the first caller does the upstream call, the others wait for its result
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=None, pool_size=None):
+        self.base_url = base_url or settings.ORS_BASE_URL
+        self.api_key = api_key
+        self.timeout = timeout or settings.ORS_TIMEOUT
+        pool_size = pool_size or settings.ORS_POOL_SIZE
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"{self.api_key or os.getenv('ORS_API_KEY')}",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+
+    def directions(self, body, profile="foot-walking"):
+        """
+        Send a directions request
+
+        Args:
+            body (dict): ORS directions request body
+            profile (str): ORS routing profile
+
+        Returns:
+            requests.Response: The raw response, shared with any identical
+            request that was in flight at the same time
+        """
+        key = (profile, json.dumps(body, sort_keys=True))
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            response = self.session.post(
+                f"{self.base_url}/v2/directions/{profile}",
+                json=body,
+                headers=self.headers,
+                timeout=self.timeout,
+            )
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def adirections(self, body, profile="foot-walking"):
+        """Async version of directions, runs the pooled call in a thread"""
+        return await asyncio.to_thread(self.directions, body, profile)
+
+
+ors_client = ORSClient()
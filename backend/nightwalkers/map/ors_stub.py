@@ -0,0 +1,143 @@
+"""
+Local stand-in for the OpenRouteService directions API, so routing can be
+tested (and developed) offline.
+
+    with StubORSServer() as server:
+        client = ORSClient(base_url=server.url)
+
+Or run it by hand and point ORS_BASE_URL at it:
+
+    python -m map.ors_stub 8090
+"""
+
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import polyline
+
+WALKING_SPEED = 1.4  # meters per second
+
+
+def straight_route(coordinates):
+    """Build an ORS-like response walking in straight lines between points"""
+    distance = 0.0
+    for (lon1, lat1), (lon2, lat2) in zip(coordinates, coordinates[1:]):
+        dx = (lon2 - lon1) * 111320 * math.cos(math.radians((lat1 + lat2) / 2))
+        dy = (lat2 - lat1) * 110540
+        distance += math.hypot(dx, dy)
+
+    return {
+        "routes": [
+            {
+                "summary": {
+                    "distance": round(distance, 1),
+                    "duration": round(distance / WALKING_SPEED, 1),
+                },
+                "geometry": polyline.encode(coordinates, geojson=True),
+            }
+        ],
+        "metadata": {"service": "stub"},
+    }
+
+
+class StubORSServer:
+    """
+    Threaded HTTP server answering POST /v2/directions/<profile>
+
+    Attributes:
+        requests (list): (path, body) of every request received
+        delay (float): Seconds to wait before answering each request
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.requests = []
+        self.delay = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, status_code, message="Route could not be found"):
+        """Answer the next request with an ORS style error"""
+        with self._lock:
+            self._failures.append((status_code, message))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._reply(400, {"error": {"message": "Invalid JSON"}})
+
+                with stub._lock:
+                    stub.requests.append((self.path, body))
+                if stub.delay:
+                    time.sleep(stub.delay)
+
+                if not self.path.startswith("/v2/directions/"):
+                    return self._reply(404, {"error": {"message": "Not found"}})
+
+                failure = stub._next_failure()
+                if failure:
+                    status_code, message = failure
+                    return self._reply(
+                        status_code, {"error": {"code": 2009, "message": message}}
+                    )
+
+                coordinates = body.get("coordinates") or []
+                if len(coordinates) < 2:
+                    return self._reply(
+                        400, {"error": {"message": "Need at least 2 coordinates"}}
+                    )
+                self._reply(200, straight_route(coordinates))
+
+            def _reply(self, status_code, payload):
+                content = json.dumps(payload).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    server = StubORSServer(port=port)
+    print(f"Stub ORS listening on {server.url}")
+    server._server.serve_forever()
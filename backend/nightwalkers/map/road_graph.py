@@ -0,0 +1,409 @@
+import heapq
+import math
+import os
+import threading
+import numpy as np
+import polyline
+import shapely
+from django.conf import settings
+from django.db import connection
+from .avoid_polygons import WGS84_TO_UTM
+from .dataset import get_dataset_version
+
+# Segment endpoints closer than this (in degrees, ~0.1m) are the same node
+NODE_PRECISION = 6
+
+# Crime points add risk to the segments within RISK_RADIUS meters, linearly
+# decreasing with distance. A segment with RISK_SCALE weighted complaints
+# around it costs twice its length on the safer route.
+RISK_RADIUS = 100
+RISK_SCALE = 25
+
+# Trips starting/ending further than this from the graph are left to ORS
+MAX_SNAP_DISTANCE = 300  # meters
+
+WALKING_SPEED = 1.4  # meters per second
+
+GRAPH_ARRAYS = [
+    "node_lonlat",
+    "node_xy",
+    "indptr",
+    "neighbors",
+    "edge_segment",
+    "edge_reversed",
+    "segment_length",
+    "segment_weight",
+    "segment_offsets",
+    "segment_coords",
+]
+
+
+def fetch_crime_points():
+    """
+    Returns:
+        numpy.ndarray: (longitude, latitude, complaints) of every crime point
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT ST_X(wkb_geometry) AS longitude,
+            ST_Y(wkb_geometry) AS latitude,
+            CMPLNT_NUM
+            FROM filtered_grouped_data_centroid
+            WHERE CMPLNT_NUM > 0;"""
+        )
+        rows = cursor.fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def to_utm(lonlat):
+    x, y = WGS84_TO_UTM.transform(lonlat[:, 0], lonlat[:, 1])
+    return np.column_stack([x, y])
+
+
+def segment_weights(utm_lines, segment_length, crime_points=None):
+    """
+    Risk weights of the segments: their length, increased by the crime points
+    within RISK_RADIUS
+
+    Args:
+        utm_lines (numpy.ndarray): Segment LineStrings in UTM
+        segment_length (numpy.ndarray): Length of each segment in meters
+        crime_points (numpy.ndarray): (longitude, latitude, complaints) rows
+
+    Returns:
+        numpy.ndarray: float32 weight of each segment
+    """
+    risk = np.zeros(len(utm_lines))
+    if crime_points is not None and len(crime_points):
+        points = shapely.points(to_utm(crime_points[:, :2]))
+        point_idx, line_idx = shapely.STRtree(utm_lines).query(
+            points, predicate="dwithin", distance=RISK_RADIUS
+        )
+        distances = shapely.distance(points[point_idx], utm_lines[line_idx])
+        risk = np.bincount(
+            line_idx,
+            weights=crime_points[point_idx, 2] * (1 - distances / RISK_RADIUS),
+            minlength=len(utm_lines),
+        )
+    return (segment_length * (1 + risk / RISK_SCALE)).astype(np.float32)
+
+
+def build_road_graph(segments, crime_points=None):
+    """
+    Build the compressed sparse row (CSR) walking graph of road segments
+
+    Every segment becomes an edge in both directions between its endpoints.
+    Edges of node i are neighbors[indptr[i]:indptr[i + 1]], the geometry,
+    length and risk weight of an edge are stored per segment.
+
+    Args:
+        segments (list): LineStrings in WGS84, split at intersections
+        crime_points (numpy.ndarray): (longitude, latitude, complaints) rows
+
+    Returns:
+        dict: Graph arrays by name (see GRAPH_ARRAYS)
+    """
+    lines = shapely.get_parts(np.asarray(segments, dtype=object))
+    lines = lines[shapely.get_num_coordinates(lines) >= 2]
+
+    coords, line_index = shapely.get_coordinates(lines, return_index=True)
+    counts = np.bincount(line_index, minlength=len(lines))
+    segment_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    # Nodes are the distinct segment endpoints
+    starts = coords[segment_offsets[:-1]]
+    ends = coords[segment_offsets[1:] - 1]
+    endpoints = np.vstack([starts, ends]).round(NODE_PRECISION)
+    node_lonlat, inverse = np.unique(endpoints, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    source, target = inverse[: len(lines)], inverse[len(lines) :]
+
+    utm_lines = shapely.linestrings(to_utm(coords), indices=line_index)
+    segment_length = shapely.length(utm_lines)
+
+    segment_weight = segment_weights(utm_lines, segment_length, crime_points)
+
+    # Both directions of every segment, grouped by start node
+    segment_ids = np.arange(len(lines), dtype=np.int32)
+    edge_source = np.concatenate([source, target])
+    edge_target = np.concatenate([target, source])
+    edge_segment = np.concatenate([segment_ids, segment_ids])
+    edge_reversed = np.concatenate(
+        [np.zeros(len(lines), dtype=bool), np.ones(len(lines), dtype=bool)]
+    )
+    loops = edge_source == edge_target
+    order = np.argsort(edge_source[~loops], kind="stable")
+    indptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(edge_source[~loops], minlength=len(node_lonlat)))]
+    )
+
+    return {
+        "node_lonlat": node_lonlat,
+        "node_xy": to_utm(node_lonlat),
+        "indptr": indptr.astype(np.int64),
+        "neighbors": edge_target[~loops][order].astype(np.int32),
+        "edge_segment": edge_segment[~loops][order],
+        "edge_reversed": edge_reversed[~loops][order],
+        "segment_length": segment_length.astype(np.float32),
+        "segment_weight": segment_weight,
+        "segment_offsets": segment_offsets,
+        "segment_coords": coords,
+    }
+
+
+def save_road_graph(arrays, directory, version=None):
+    """
+    Save the graph arrays, version is the dataset version of the crime
+    points segment_weight was computed from (None if it was not)
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in GRAPH_ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+    version_path = os.path.join(directory, "dataset_version.npy")
+    if version is not None:
+        np.save(version_path, np.array(version, dtype=np.int64))
+    elif os.path.exists(version_path):
+        os.remove(version_path)
+
+
+class RoadGraph:
+    """
+    Local safety router over the CSR road graph saved by build_road_graph
+
+    The arrays are memory-mapped, so every worker process shares the same
+    pages and startup only costs the node lookup tree.
+
+    The risk weights follow the crime table: once the dataset version moves
+    past the one they were computed from, trips are left to ORS (whose
+    avoid polygons are already up to date) while the weights are recomputed
+    in the background.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._arrays = None
+        self._tree = None
+        # (dataset version, segment weights), swapped as a whole
+        self._risk = (None, None)
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, arrays, version=None):
+        graph = cls(None)
+        graph._set_arrays(arrays, version)
+        return graph
+
+    def _set_arrays(self, arrays, version=None):
+        self._tree = shapely.STRtree(shapely.points(arrays["node_xy"]))
+        # Plain floats for the A* heuristic, numpy scalar access is much slower
+        self._node_x = arrays["node_xy"][:, 0].tolist()
+        self._node_y = arrays["node_xy"][:, 1].tolist()
+        self._risk = (version, arrays["segment_weight"])
+        self._arrays = arrays
+
+    def is_available(self):
+        if self._arrays is not None:
+            return True
+        if not self.directory or not os.path.exists(
+            os.path.join(self.directory, "indptr.npy")
+        ):
+            return False
+        with self._lock:
+            if self._arrays is None:
+                version_path = os.path.join(self.directory, "dataset_version.npy")
+                self._set_arrays(
+                    {
+                        name: np.load(
+                            os.path.join(self.directory, f"{name}.npy"), mmap_mode="r"
+                        )
+                        for name in GRAPH_ARRAYS
+                    },
+                    (
+                        int(np.load(version_path))
+                        if os.path.exists(version_path)
+                        else None
+                    ),
+                )
+        return True
+
+    def refresh_weights(self, version, crime_points=None):
+        """
+        Recompute the risk weights from the crime points of dataset version
+
+        The version must be read before the crime points are fetched, so a
+        change made meanwhile leaves the weights stale rather than mislabeled.
+        """
+        if crime_points is None:
+            crime_points = fetch_crime_points()
+        offsets = self._arrays["segment_offsets"]
+        utm_lines = shapely.linestrings(
+            to_utm(np.asarray(self._arrays["segment_coords"])),
+            indices=np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)),
+        )
+        segment_length = np.asarray(self._arrays["segment_length"], dtype=np.float64)
+        self._risk = (
+            version,
+            segment_weights(utm_lines, segment_length, crime_points),
+        )
+
+    def _refresh_in_background(self, version):
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+
+            def refresh():
+                try:
+                    self.refresh_weights(version)
+                except Exception as e:
+                    print(f"Could not refresh the road graph weights: {str(e)}")
+                finally:
+                    connection.close()
+
+            self._refresh_thread = threading.Thread(target=refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def __len__(self):
+        return len(self._arrays["indptr"]) - 1 if self.is_available() else 0
+
+    def nearest_node(self, lonlat):
+        """Closest node to a [longitude, latitude] pair, None if too far"""
+        point = shapely.points(to_utm(np.array([lonlat], dtype=np.float64)))[0]
+        node = int(self._tree.nearest(point))
+        distance = math.dist(self._arrays["node_xy"][node], (point.x, point.y))
+        return node if distance <= MAX_SNAP_DISTANCE else None
+
+    def shortest_path(self, source, target, weights):
+        """
+        A* search, the straight-line distance is admissible since no edge
+        weighs less than its length
+
+        Args:
+            weights (numpy.ndarray): Cost of each segment
+
+        Returns:
+            list: Edge indexes from source to target, None if unreachable
+        """
+        indptr = self._arrays["indptr"]
+        neighbors = self._arrays["neighbors"]
+        edge_segment = self._arrays["edge_segment"]
+        node_x, node_y = self._node_x, self._node_y
+        target_x, target_y = node_x[target], node_y[target]
+
+        def heuristic(node):
+            return math.hypot(node_x[node] - target_x, node_y[node] - target_y)
+
+        costs = {source: 0.0}
+        previous_edge = {}
+        closed = set()
+        heap = [(heuristic(source), 0.0, source)]
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in closed:
+                continue
+            closed.add(node)
+
+            first, last = indptr[node], indptr[node + 1]
+            edge_costs = cost + weights[edge_segment[first:last]]
+            for edge, neighbor, neighbor_cost in zip(
+                range(first, last),
+                neighbors[first:last].tolist(),
+                edge_costs.tolist(),
+            ):
+                if neighbor_cost < costs.get(neighbor, math.inf):
+                    costs[neighbor] = neighbor_cost
+                    previous_edge[neighbor] = edge
+                    heapq.heappush(
+                        heap,
+                        (neighbor_cost + heuristic(neighbor), neighbor_cost, neighbor),
+                    )
+        else:
+            return None
+
+        path = []
+        node = target
+        while node != source:
+            edge = previous_edge[node]
+            path.append(edge)
+            node = int(np.searchsorted(indptr, edge, side="right") - 1)
+        return path[::-1]
+
+    def path_to_route(self, path):
+        """Format a path like an OpenRouteService directions response"""
+        offsets = self._arrays["segment_offsets"]
+        segment_coords = self._arrays["segment_coords"]
+        coords = []
+        distance = 0.0
+        for edge in path:
+            segment = self._arrays["edge_segment"][edge]
+            points = segment_coords[offsets[segment] : offsets[segment + 1]]
+            if self._arrays["edge_reversed"][edge]:
+                points = points[::-1]
+            coords.extend(map(tuple, points[1:] if coords else points))
+            distance += float(self._arrays["segment_length"][segment])
+
+        return {
+            "routes": [
+                {
+                    "summary": {
+                        "distance": round(distance, 1),
+                        "duration": round(distance / WALKING_SPEED, 1),
+                    },
+                    "geometry": polyline.encode(coords, geojson=True),
+                }
+            ],
+            "metadata": {"engine": "road_graph"},
+        }
+
+    def route(self, departure, destination, version=None):
+        """
+        Shortest and safest walking routes between two [longitude, latitude]
+
+        Args:
+            version (int): Dataset version the routes are for (the current one
+                by default), e.g. the one they are cached under
+
+        Returns:
+            dict: {"initial_route", "safer_route"} in ORS format, None when the
+            graph is not available, does not cover the trip or its risk
+            weights are not from that version
+        """
+        try:
+            if not self.is_available():
+                return None
+            if version is None:
+                version = get_dataset_version()
+            weights_version, weights = self._risk
+            if weights_version != version:
+                if weights_version is None or weights_version < version:
+                    self._refresh_in_background(version)
+                return None
+            source = self.nearest_node(departure)
+            target = self.nearest_node(destination)
+            if source is None or target is None:
+                return None
+            if source == target:
+                return None
+
+            shortest = self.shortest_path(
+                source, target, self._arrays["segment_length"]
+            )
+            safest = self.shortest_path(source, target, weights)
+            if shortest is None or safest is None:
+                return None
+
+            safer_route = self.path_to_route(safest)
+            safer_route["metadata"]["phase"] = "Road graph"
+            return {
+                "initial_route": self.path_to_route(shortest),
+                "safer_route": safer_route,
+            }
+        except Exception as e:
+            print(f"Local routing failed, falling back to ORS: {str(e)}")
+            return None
+
+
+road_graph = RoadGraph(settings.ROAD_GRAPH_DIR)
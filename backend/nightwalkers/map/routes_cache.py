@@ -0,0 +1,24 @@
+# Departure/destination are snapped to a grid of this size in degrees
+# (~20m in NYC), so requests from the same corner share a cached route
+ROUTE_GRID_SIZE = 0.0002
+
+# Routes are keyed by dataset version, the timeout only covers changes on the
+# ORS side (street closures, map updates). The cache backend evicts the least
+# recently used routes when it is full.
+ROUTE_CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def snap(coordinate):
+    """Index of the grid cell a longitude/latitude falls into"""
+    return round(coordinate / ROUTE_GRID_SIZE)
+
+
+def route_cache_key(version, departure, destination):
+    """
+    Args:
+        departure (list): [longitude, latitude]
+        destination (list): [longitude, latitude]
+    """
+    return "map:route:{}:{}:{}:{}:{}".format(
+        version, *map(snap, departure), *map(snap, destination)
+    )
@@ -0,0 +1,197 @@
+"""
+Split road centerlines (NYC TIGER road shapefiles) into segments between
+intersections, the input of the local road graph (see road_graph.py).
+
+The area is cut into square tiles. Each tile nodes the roads around it
+(shapely.node) and keeps the segments whose midpoint falls inside the tile,
+so segments crossing tile borders are produced exactly once. Tiles are
+independent and run in a process pool.
+"""
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import shapely
+
+# ~2km x ~2km in NYC
+DEFAULT_TILE_SIZE = 0.02
+
+
+# Roads and their STRtree, set once per worker process by init_worker
+_lines = None
+_tree = None
+
+
+def init_worker(lines):
+    global _lines, _tree
+    _lines = lines
+    _tree = shapely.STRtree(lines)
+
+
+def tile_indexes(points, origin, tile_size):
+    """(column, row) of the tile containing each point"""
+    coords = shapely.get_coordinates(points)
+    return np.floor((coords - origin) / tile_size).astype(np.int64)
+
+
+def node_tile(origin, tile_size, tile):
+    """
+    Segments whose midpoint is inside a tile, split at every intersection
+
+    The roads are clipped to a search area around the tile and noded
+    together. The area grows until no piece reaching into the tile is cut
+    by its edge: then every road crossing those pieces took part in the
+    noding.
+
+    Args:
+        origin (numpy.ndarray): Lower left corner of the tile grid
+        tile_size (float): Tile width/height in degrees
+        tile (tuple): (column, row) of the tile
+
+    Returns:
+        numpy.ndarray: Segment LineStrings
+    """
+    xmin, ymin = origin + np.array(tile) * tile_size
+    tile_box = shapely.box(xmin, ymin, xmin + tile_size, ymin + tile_size)
+    shapely.prepare(tile_box)
+    area = tile_box
+
+    while True:
+        roads = _lines[_tree.query(area, predicate="intersects")]
+        # Not clip_by_rect, it drops roads lying on the edge of the area
+        roads = shapely.get_parts(shapely.intersection(roads, area))
+        roads = roads[shapely.get_type_id(roads) == shapely.GeometryType.LINESTRING]
+        noded = shapely.get_parts(shapely.node(shapely.multilinestrings(roads)))
+
+        # Pieces reaching into the tile were cut short if they touch the edge
+        # of the search area, look further out for their real split points
+        touching = noded[shapely.intersects(tile_box, noded)]
+        edge = area.boundary
+        shapely.prepare(edge)
+        cut = touching[shapely.intersects(edge, touching)]
+        if len(cut) == 0:
+            break
+        xmin, ymin, xmax, ymax = shapely.total_bounds([area, *cut])
+        margin = tile_size / 2
+        area = shapely.box(xmin - margin, ymin - margin, xmax + margin, ymax + margin)
+
+    midpoints = shapely.line_interpolate_point(noded, 0.5, normalized=True)
+    inside = np.all(tile_indexes(midpoints, origin, tile_size) == tile, axis=1)
+    return noded[inside]
+
+
+def segment_roads(lines, tile_size=DEFAULT_TILE_SIZE, workers=None, progress=None):
+    """
+    Split roads into segments between intersections
+
+    Args:
+        lines (list): LineStrings/MultiLineStrings in WGS84
+        tile_size (float): Tile width/height in degrees
+        workers (int): Processes to use, 1 runs in this process
+        progress (callable): Called with (tiles done, total tiles, segments)
+
+    Returns:
+        numpy.ndarray: Segment LineStrings
+    """
+    lines = shapely.get_parts(np.asarray(lines, dtype=object))
+    lines = lines[~shapely.is_empty(lines)]
+    if len(lines) == 0:
+        return lines
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(lines)
+    origin = np.array([xmin, ymin])
+    columns = math.floor((xmax - xmin) / tile_size) + 1
+    rows = math.floor((ymax - ymin) / tile_size) + 1
+
+    # One bulk STRtree query finds the tiles with roads in them
+    tiles = [(column, row) for column in range(columns) for row in range(rows)]
+    boxes = shapely.box(
+        [xmin + column * tile_size for column, _ in tiles],
+        [ymin + row * tile_size for _, row in tiles],
+        [xmin + (column + 1) * tile_size for column, _ in tiles],
+        [ymin + (row + 1) * tile_size for _, row in tiles],
+    )
+    tile_idx, _ = shapely.STRtree(lines).query(boxes, predicate="intersects")
+    jobs = [(origin, tile_size, tiles[i]) for i in np.unique(tile_idx)]
+
+    results = []
+    segment_count = 0
+    if workers == 1:
+        init_worker(lines)
+        completed = (node_tile(*job) for job in jobs)
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(lines,)
+        )
+        futures = [executor.submit(node_tile, *job) for job in jobs]
+        completed = (future.result() for future in as_completed(futures))
+
+    try:
+        for done, segments in enumerate(completed, start=1):
+            results.append(segments)
+            segment_count += len(segments)
+            if progress:
+                progress(done, len(jobs), segment_count)
+    finally:
+        if workers != 1:
+            executor.shutdown(cancel_futures=True)
+
+    return np.concatenate(results) if results else np.array([], dtype=object)
+
+
+def read_roads(paths):
+    """Read road files (Shapefile, GeoParquet...) into one WGS84 GeoDataFrame"""
+    # File I/O only, the segmentation itself does not need geopandas
+    import geopandas as gpd
+    import pandas as pd
+
+    frames = []
+    for path in paths:
+        frame = (
+            gpd.read_parquet(path) if path.endswith(".parquet") else gpd.read_file(path)
+        )
+        if frame.crs is not None:
+            frame = frame.to_crs("EPSG:4326")
+        frames.append(frame)
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+
+
+def write_segments(segments, path):
+    """
+    Write segments to any format GDAL can write, or to GeoParquet for
+    .parquet, which needs pyarrow (not in requirements.txt)
+    """
+    import geopandas as gpd
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    frame = gpd.GeoDataFrame(geometry=segments, crs="EPSG:4326")
+    if path.endswith(".parquet"):
+        frame.to_parquet(path)
+    else:
+        frame.to_file(path)
+
+
+def generate_blocks(
+    paths, output, tile_size=DEFAULT_TILE_SIZE, workers=None, log=print
+):
+    """Full pipeline: read the roads, segment them and write the result"""
+    start = time.monotonic()
+    roads = read_roads(paths)
+    log(f"Read {len(roads)} roads from {len(paths)} file(s)")
+
+    def progress(done, total, segments):
+        if done == total or done % max(1, total // 20) == 0:
+            log(f"Tiles {done}/{total}, {segments} segments")
+
+    segments = segment_roads(
+        roads.geometry.values, tile_size=tile_size, workers=workers, progress=progress
+    )
+    write_segments(segments, output)
+    log(
+        f"Wrote {len(segments)} segments to {output} in {time.monotonic() - start:.1f}s"
+    )
+    return segments
@@ -4,8 +4,13 @@ from rest_framework.test import APIClient
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from .models import IssueOnLocationReport
+from .avoid_polygons import WGS84_TO_UTM
+from .moderation import approve_reports, revoke_reports
 from unittest.mock import patch
+import itertools
 import json
+import math
+import uuid
 
 User = get_user_model()
 
@@ -514,3 +519,246 @@ class ReportApprovalTests(BaseTestCase):
         self.assertEqual(
             response_data["message"], "Report has no associated heatmap point"
         )
+
+
+class FakeCentroidCursor:
+    """
+    Stand-in for filtered_grouped_data_centroid (not in the test database)
+    that answers the statements of map.moderation
+    """
+
+    def __init__(self, points):
+        # {ogc_fid: [complaints, latitude, longitude]}
+        self.points = {point_id: list(point) for point_id, point in points.items()}
+        self.statements = []
+        self.ids = itertools.count(max(points, default=0) + 1)
+        self.rows = []
+
+    def distance(self, point, longitude, latitude):
+        x1, y1 = WGS84_TO_UTM.transform(point[2], point[1])
+        x2, y2 = WGS84_TO_UTM.transform(longitude, latitude)
+        return math.hypot(x1 - x2, y1 - y2)
+
+    def execute(self, sql, params):
+        statement = sql.split()[0]
+        self.statements.append(statement)
+        if statement == "SELECT":
+            *values, max_distance = params
+            self.rows = []
+            for i in range(0, len(values), 3):
+                report_id, longitude, latitude = values[i : i + 3]
+                distances = {
+                    point_id: self.distance(point, longitude, latitude)
+                    for point_id, point in self.points.items()
+                }
+                nearby = [
+                    point_id
+                    for point_id in distances
+                    if distances[point_id] <= max_distance
+                ]
+                if nearby:
+                    self.rows.append((report_id, min(nearby, key=distances.get)))
+        elif statement == "UPDATE":
+            self.rows = []
+            for i in range(0, len(params), 2):
+                point = self.points[params[i]]
+                point[0] = max(0, point[0] + params[i + 1])
+                self.rows.append((params[i], *point))
+        elif statement == "INSERT":
+            self.rows = []
+            for i in range(0, len(params), 4):
+                road_id, count, longitude, latitude = params[i : i + 4]
+                point_id = next(self.ids)
+                self.points[point_id] = [count, latitude, longitude]
+                self.rows.append((road_id, point_id))
+        elif statement == "DELETE":
+            for point_id in params[0]:
+                del self.points[point_id]
+
+    def fetchall(self):
+        return self.rows
+
+
+class BulkModerationTests(BaseTestCase):
+    """Tests for map.moderation and the report admin bulk actions."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin_user = User.objects.create_superuser(
+            email="admin@example.com",
+            password="adminpass123",
+            first_name="Admin",
+            last_name="User",
+        )
+        # One existing point in midtown with 3 complaints
+        self.cursor = FakeCentroidCursor({7: (3, 40.7580, -73.9855)})
+        patcher = patch("map.moderation.connection")
+        mock_connection = patcher.start()
+        mock_connection.cursor.return_value.__enter__.return_value = self.cursor
+        self.addCleanup(patcher.stop)
+
+    def create_report(self, latitude, longitude, **kwargs):
+        return IssueOnLocationReport.objects.create(
+            user=self.user1,
+            title="Bulk Moderation Report",
+            description=(
+                "This is a detailed description of a report used to test the "
+                "bulk moderation of reports."
+            ),
+            location_str="Test Location",
+            latitude=latitude,
+            longitude=longitude,
+            **kwargs,
+        )
+
+    def test_approve_reports(self):
+        """Reports join nearby points or share new points, in few statements"""
+        near_point = self.create_report(40.7583, -73.9853)
+        downtown = self.create_report(40.7128, -74.0060)
+        downtown_close = self.create_report(40.7130, -74.0058)
+        brooklyn = self.create_report(40.6782, -73.9442, status="approved")
+
+        with patch("map.moderation.heatmap_snapshot") as mock_snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = approve_reports(
+                    [near_point, downtown, downtown_close, brooklyn]
+                )
+
+        self.assertEqual(self.cursor.statements, ["SELECT", "UPDATE", "INSERT"])
+        self.assertEqual(result["processed"], 4)
+        self.assertEqual(result["updated_points"], 1)
+        self.assertEqual(result["created_points"], 2)
+
+        for report in [near_point, downtown, downtown_close, brooklyn]:
+            report.refresh_from_db()
+            self.assertEqual(report.status, "approved")
+            self.assertEqual(report.heatmap_point_id, result["point_ids"][report.id])
+        self.assertEqual(near_point.heatmap_point_id, 7)
+        self.assertEqual(downtown.heatmap_point_id, downtown_close.heatmap_point_id)
+        self.assertNotEqual(downtown.heatmap_point_id, brooklyn.heatmap_point_id)
+
+        self.assertEqual(self.cursor.points[7][0], 4)
+        self.assertEqual(self.cursor.points[downtown.heatmap_point_id][0], 2)
+        self.assertEqual(self.cursor.points[brooklyn.heatmap_point_id][0], 1)
+        self.assertEqual(result["new_counts"][7], 4)
+
+        # The heatmap is updated once, after commit
+        mock_snapshot.record_points.assert_called_once()
+        self.assertCountEqual(
+            mock_snapshot.record_points.call_args[0][0],
+            [
+                (7, 40.7580, -73.9855, 4),
+                (downtown.heatmap_point_id, 40.7128, -74.0060, 2),
+                (brooklyn.heatmap_point_id, 40.6782, -73.9442, 1),
+            ],
+        )
+
+        # Reports already on the map are not counted twice
+        self.cursor.statements = []
+        result = approve_reports([near_point, downtown])
+        self.assertEqual(result["processed"], 0)
+        self.assertEqual(self.cursor.statements, [])
+        self.assertEqual(self.cursor.points[7][0], 4)
+
+    def test_approve_reports_batches(self):
+        """Large selections are split into bounded statements"""
+        reports = [self.create_report(40.70 + i * 0.01, -74.0) for i in range(5)]
+        with patch("map.moderation.BATCH_SIZE", 2), patch(
+            "map.moderation.heatmap_snapshot"
+        ):
+            result = approve_reports(reports)
+
+        self.assertEqual(result["created_points"], 5)
+        self.assertEqual(self.cursor.statements.count("SELECT"), 3)
+        self.assertEqual(self.cursor.statements.count("INSERT"), 3)
+        self.assertEqual(len(set(result["point_ids"].values())), 5)
+
+    def test_approve_reports_road_id_collision(self):
+        """Groups get distinct points even if their random road ids collide"""
+        reports = [self.create_report(40.70 + i * 0.01, -74.0) for i in range(2)]
+        colliding = [uuid.UUID(int=1 << 96), uuid.UUID(int=1 << 96)]
+        with patch(
+            "map.moderation.uuid.uuid4",
+            side_effect=colliding + [uuid.UUID(int=2 << 96)],
+        ), patch("map.moderation.heatmap_snapshot"):
+            result = approve_reports(reports)
+
+        self.assertEqual(result["created_points"], 2)
+        self.assertEqual(len(set(result["point_ids"].values())), 2)
+
+    def test_revoke_reports(self):
+        """Counts are decremented together and emptied points deleted"""
+        self.cursor.points[8] = [1, 40.7128, -74.0060]
+        first = self.create_report(
+            40.7580, -73.9855, status="approved", heatmap_point_id=7
+        )
+        second = self.create_report(
+            40.7581, -73.9856, status="approved", heatmap_point_id=7
+        )
+        alone = self.create_report(
+            40.7128, -74.0060, status="approved", heatmap_point_id=8
+        )
+        pending = self.create_report(40.7, -74.0)
+
+        with patch("map.moderation.heatmap_snapshot") as mock_snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = revoke_reports([first, second, alone, pending])
+
+        self.assertEqual(self.cursor.statements, ["UPDATE", "DELETE"])
+        self.assertEqual(result["processed"], 3)
+        self.assertEqual(result["updated_points"], 1)
+        self.assertEqual(result["deleted_points"], 1)
+        self.assertEqual(result["new_counts"], {7: 1, 8: 0})
+        self.assertEqual(self.cursor.points, {7: [1, 40.7580, -73.9855]})
+
+        for report in [first, second, alone]:
+            report.refresh_from_db()
+            self.assertEqual(report.status, "pending")
+            self.assertIsNone(report.heatmap_point_id)
+
+        self.assertCountEqual(
+            mock_snapshot.record_points.call_args[0][0],
+            [(7, 40.7580, -73.9855, 1), (8, 40.7128, -74.0060, 0)],
+        )
+
+    def test_admin_bulk_actions(self):
+        """Moderators approve and revoke whole selections from the admin"""
+        reports = [self.create_report(40.7128, -74.0060) for _ in range(3)]
+        changelist_url = reverse("admin:map_issueonlocationreport_changelist")
+        self.client.login(email="admin@example.com", password="adminpass123")
+
+        with patch("map.moderation.heatmap_snapshot"):
+            response = self.client.post(
+                changelist_url,
+                {
+                    "action": "approve_selected",
+                    "_selected_action": [report.id for report in reports],
+                },
+                follow=True,
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "3 report(s) added to the map")
+        point_ids = set(
+            IssueOnLocationReport.objects.filter(
+                id__in=[report.id for report in reports]
+            ).values_list("heatmap_point_id", flat=True)
+        )
+        self.assertEqual(len(point_ids), 1)
+        self.assertEqual(self.cursor.points[point_ids.pop()][0], 3)
+
+        with patch("map.moderation.heatmap_snapshot"):
+            response = self.client.post(
+                changelist_url,
+                {
+                    "action": "revoke_selected",
+                    "_selected_action": [report.id for report in reports],
+                },
+                follow=True,
+            )
+        self.assertContains(response, "3 report(s) removed from the map")
+        self.assertEqual(list(self.cursor.points), [7])
+        self.assertFalse(
+            IssueOnLocationReport.objects.filter(
+                id__in=[report.id for report in reports], status="approved"
+            ).exists()
+        )
@@ -1,12 +1,26 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from rest_framework import status, serializers
 from unittest.mock import patch, MagicMock
+import asyncio
+import heapq
+import tempfile
 import requests
 import json
-from shapely.geometry import Point, Polygon, MultiPolygon
+import threading
+import time
+import numpy as np
+import polyline
+import pyproj
+import shapely
+from concurrent.futures import ThreadPoolExecutor
+from shapely import wkt
+from shapely.geometry import LineString, Point, Polygon, MultiPolygon
+from shapely.ops import transform
 
 from .models import SavedRoute
 from .views import (
@@ -17,6 +31,15 @@ from .views import (
     get_safer_ors_route,
 )
 from .serializers import NYC_BOUNDS, is_within_nyc
+from .avoid_polygons import WGS84_TO_UTM, AvoidPolygonStore
+from .dataset import bump_dataset_version, get_dataset_version
+from .heatmap_snapshot import heatmap_snapshot
+from .hotspots import HotspotIndex, hotspot_index
+from .ors import ORSClient
+from .ors_stub import StubORSServer
+from .road_graph import RoadGraph, build_road_graph, save_road_graph
+from .segmentation import segment_roads
+from .tiles import tile_bounds, unpack_points
 
 User = get_user_model()
 
@@ -53,12 +76,14 @@ class SplitHeatmapDataTestCase(BaseTestCase):
         super().setUp()
         self.primary_url = reverse("primary-heatmap")
         self.secondary_url = reverse("secondary-heatmap")
+        cache.clear()
+        heatmap_snapshot.clear()
 
         # Sample data to be returned by the cursor
         self.mock_data = [
-            (40.7128, -74.0060, "5"),
-            (40.7580, -73.9855, "10"),
-            (40.7431, -73.9712, None),
+            (1, 40.7128, -74.0060, "5"),
+            (2, 40.7580, -73.9855, "10"),
+            (3, 40.7431, -73.9712, None),
         ]
 
     def authenticate(self):
@@ -234,9 +259,9 @@ class SplitHeatmapDataTestCase(BaseTestCase):
         # Mock cursor to return data with invalid values
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7128, -74.0060, "invalid"),  # String that isn't a number
-            (40.7580, -73.9855, {}),  # Invalid type
-            (40.7431, -73.9712, None),  # None value
+            (1, 40.7128, -74.0060, "invalid"),  # String that isn't a number
+            (2, 40.7580, -73.9855, {}),  # Invalid type
+            (3, 40.7431, -73.9712, None),  # None value
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -261,9 +286,9 @@ class SplitHeatmapDataTestCase(BaseTestCase):
         # Mock cursor to return data with invalid values
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7128, -74.0060, "invalid"),  # String that isn't a number
-            (40.7580, -73.9855, {}),  # Invalid type
-            (40.7431, -73.9712, None),  # None value
+            (1, 40.7128, -74.0060, "invalid"),  # String that isn't a number
+            (2, 40.7580, -73.9855, {}),  # Invalid type
+            (3, 40.7431, -73.9712, None),  # None value
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -570,6 +595,9 @@ class RouteViewAPITestCase(BaseTestCase):
         # URL for API endpoint
         self.url = reverse("get-route")
 
+        # Routes are cached across requests
+        cache.clear()
+
         # Sample valid data for requests - using NYC coordinates
         self.valid_data = {
             "departure": [40.7128, -74.0060],  # Manhattan coordinates
@@ -662,13 +690,13 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertFalse(is_within_nyc(39.0000, -74.0060))  # Too far south
         self.assertFalse(is_within_nyc(40.7128, -72.0000))  # Too far east
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_unauthenticated_access_denied(self, mock_post):
         """Test that unauthenticated users cannot access the endpoint"""
         response = self.api_client.post(self.url, self.valid_data, format="json")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_authenticated_access_allowed(self, mock_post):
         """Test that authenticated users can access the endpoint"""
         # Setup mock for OpenRouteService
@@ -684,7 +712,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("initial_route", response.data)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_route_with_coordinates(self, mock_post):
         """Test getting a route using coordinates"""
         # Setup mock for OpenRouteService
@@ -700,7 +728,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["initial_route"], self.mock_ors_response)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_coordinates_within_nyc_boundaries(self, mock_post):
         """Test that coordinates within NYC boundaries pass validation"""
         # Setup mock for OpenRouteService
@@ -722,7 +750,7 @@ class RouteViewAPITestCase(BaseTestCase):
         response = self.api_client.post(self.url, valid_data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_departure_outside_nyc_boundaries(self, mock_post):
         """Test that departure coordinates outside NYC boundaries fail validation"""
         # Authenticate user
@@ -743,7 +771,7 @@ class RouteViewAPITestCase(BaseTestCase):
             str(response.data["details"]["departure"][0]),
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_destination_outside_nyc_boundaries(self, mock_post):
         """Test that destination coordinates outside NYC boundaries fail validation"""
         # Authenticate user
@@ -764,7 +792,7 @@ class RouteViewAPITestCase(BaseTestCase):
             str(response.data["details"]["destination"][0]),
         )
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_both_coordinates_outside_nyc_boundaries(self, mock_post):
         """Test that both departure and
         destination coordinates outside NYC boundaries fail validation"""
@@ -783,7 +811,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertIn("departure", response.data["details"])
         self.assertIn("destination", response.data["details"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_edge_coordinates_within_nyc_boundaries(self, mock_post):
         """Test coordinates at the edge of NYC boundaries"""
         # Setup mock for OpenRouteService
@@ -811,7 +839,7 @@ class RouteViewAPITestCase(BaseTestCase):
         response = self.api_client.post(self.url, edge_data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_just_outside_nyc_boundaries(self, mock_post):
         """Test coordinates just outside NYC boundaries"""
         # Authenticate user
@@ -831,7 +859,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("departure", response.data["details"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     @patch("polyline.decode")
     @patch("django.db.connection.cursor")
     def test_safer_route_generation_failure(
@@ -857,7 +885,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertIsNone(response.data["safer_route"])
         self.assertIn("message", response.data)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_openrouteservice_error(self, mock_post):
         """Test handling of errors from OpenRouteService"""
         # Setup mock for OpenRouteService error
@@ -870,7 +898,7 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
         self.assertIn("error", response.data)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     @patch("polyline.decode")
     @patch("map.views.process_route_with_crime_data")
     def test_successful_safer_route_generation(
@@ -898,6 +926,65 @@ class RouteViewAPITestCase(BaseTestCase):
         self.assertEqual(response.data["initial_route"], self.mock_ors_response)
         self.assertEqual(response.data["safer_route"], self.mock_safer_route)
 
+    @patch("map.views.process_route_with_crime_data")
+    @patch("requests.Session.post")
+    def test_route_cache_hit(self, mock_post, mock_process):
+        """Test that a repeated (or ~20m away) request skips ORS entirely"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = self.mock_ors_response
+        mock_post.return_value = mock_response
+        mock_process.return_value = self.mock_safer_route
+        self.api_client.force_authenticate(user=self.user1)
+
+        first = self.api_client.post(self.url, self.valid_data, format="json")
+        nearby_data = dict(self.valid_data, departure=[40.71285, -74.00605])
+        second = self.api_client.post(self.url, nearby_data, format="json")
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.data["safer_route"], self.mock_safer_route)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(mock_process.call_count, 1)
+
+        # A different departure block is a different route
+        other_data = dict(self.valid_data, departure=[40.7150, -74.0060])
+        self.api_client.post(self.url, other_data, format="json")
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("map.views.process_route_with_crime_data")
+    @patch("requests.Session.post")
+    def test_route_cache_invalidated_by_dataset_version(self, mock_post, mock_process):
+        """Test that changing the hotspot data recomputes cached routes"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = self.mock_ors_response
+        mock_post.return_value = mock_response
+        mock_process.return_value = self.mock_safer_route
+        self.api_client.force_authenticate(user=self.user1)
+
+        self.api_client.post(self.url, self.valid_data, format="json")
+        bump_dataset_version()
+        self.api_client.post(self.url, self.valid_data, format="json")
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(mock_process.call_count, 2)
+
+    @patch("map.views.process_route_with_crime_data")
+    @patch("requests.Session.post")
+    def test_failed_safer_route_not_cached(self, mock_post, mock_process):
+        """Test that errors are retried instead of being served from cache"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = self.mock_ors_response
+        mock_post.return_value = mock_response
+        mock_process.return_value = {"error": "OpenRouteService API error: 500"}
+        self.api_client.force_authenticate(user=self.user1)
+
+        self.api_client.post(self.url, self.valid_data, format="json")
+        mock_process.side_effect = Exception("Database error")
+        self.api_client.post(self.url, self.valid_data, format="json")
+        self.api_client.post(self.url, self.valid_data, format="json")
+
+        self.assertEqual(mock_post.call_count, 3)
+
 
 class HeatmapDataTestCase(BaseTestCase):
     """Test cases for the HeatmapDataView"""
@@ -905,12 +992,14 @@ class HeatmapDataTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
         self.url = reverse("heatmap-data")  # URL for heatmap data endpoint
+        cache.clear()
+        heatmap_snapshot.clear()
 
         # Sample data to be returned by the cursor
         self.mock_data = [
-            (40.7128, -74.0060, "5"),
-            (40.7580, -73.9855, "10"),
-            (40.7431, -73.9712, None),
+            (1, 40.7128, -74.0060, "5"),
+            (2, 40.7580, -73.9855, "10"),
+            (3, 40.7431, -73.9712, None),
         ]
 
     def authenticate(self):
@@ -968,12 +1057,13 @@ class HeatmapDataTestCase(BaseTestCase):
         elif "params" in kwargs:
             self.assertEqual(kwargs["params"][0], 7)  # Check threshold value
 
-        # Test with default (no type parameter should default to primary)
+        # Test with default (no type parameter should default to primary),
+        # served from the snapshot without querying again
         mock_cursor_instance.execute.reset_mock()
         response = self.api_client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        args, kwargs = mock_cursor_instance.execute.call_args
-        self.assertIn("WHERE CMPLNT_NUM >= %s", args[0])
+        self.assertEqual(len(json.loads(response.content)), 3)
+        mock_cursor_instance.execute.assert_not_called()
 
     @patch("django.db.connection.cursor")
     def test_secondary_data_retrieval(self, mock_cursor):
@@ -1002,12 +1092,12 @@ class HeatmapDataTestCase(BaseTestCase):
         elif "params" in kwargs:
             self.assertEqual(kwargs["params"][0], 7)  # Check threshold value
 
-        # Test with type=secondary (string version)
+        # Test with type=secondary (string version), same snapshot
         mock_cursor_instance.execute.reset_mock()
         response = self.api_client.get(f"{self.url}?type=secondary")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        args, kwargs = mock_cursor_instance.execute.call_args
-        self.assertIn("WHERE CMPLNT_NUM < %s", args[0])
+        self.assertEqual(len(json.loads(response.content)), 3)
+        mock_cursor_instance.execute.assert_not_called()
 
     @patch("django.db.connection.cursor")
     def test_invalid_type_parameter(self, mock_cursor):
@@ -1060,9 +1150,9 @@ class HeatmapDataTestCase(BaseTestCase):
         # Mock cursor to return data with invalid values
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7128, -74.0060, "invalid"),  # String that isn't a number
-            (40.7580, -73.9855, {}),  # Invalid type
-            (40.7431, -73.9712, None),  # None value
+            (1, 40.7128, -74.0060, "invalid"),  # String that isn't a number
+            (2, 40.7580, -73.9855, {}),  # Invalid type
+            (3, 40.7431, -73.9712, None),  # None value
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -1079,6 +1169,275 @@ class HeatmapDataTestCase(BaseTestCase):
         self.assertEqual(data[2]["intensity"], 0.0)
 
 
+class HeatmapSnapshotTestCase(BaseTestCase):
+    """Test cases for the materialized heatmap layers and their ETags"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        heatmap_snapshot.clear()
+        self.api_client.force_authenticate(user=self.user1)
+        self.primary_url = reverse("primary-heatmap")
+        self.secondary_url = reverse("secondary-heatmap")
+        self.rows = {
+            "primary": [(1, 40.7128, -74.0060, 5), (2, 40.7580, -73.9855, 10)],
+            "secondary": [(3, 40.7431, -73.9712, 4), (4, 40.7300, -73.9900, 1)],
+        }
+
+        def fetchall():
+            sql = self.cursor.execute.call_args[0][0]
+            return self.rows["primary" if ">=" in sql else "secondary"]
+
+        self.cursor = MagicMock()
+        self.cursor.fetchall.side_effect = fetchall
+        patcher = patch("django.db.connection.cursor")
+        mock_cursor = patcher.start()
+        mock_cursor.return_value.__enter__.return_value = self.cursor
+        self.addCleanup(patcher.stop)
+
+    def get_points(self, url):
+        response = self.api_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            (point["latitude"], point["longitude"], point["intensity"])
+            for point in json.loads(response.content)
+        ]
+
+    def test_etag_not_modified(self):
+        """A matching If-None-Match gets a 304 without loading the layer"""
+        response = self.api_client.get(self.primary_url)
+        etag = response["ETag"]
+        self.cursor.execute.reset_mock()
+
+        response = self.api_client.get(self.primary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+        self.cursor.execute.assert_not_called()
+
+        # Weak validators and lists of ETags match too
+        response = self.api_client.get(
+            self.primary_url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Other layers and formats have their own ETag
+        response = self.api_client.get(self.secondary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_changes_with_dataset_version(self):
+        """Any change to the crime table invalidates the ETag"""
+        etag = self.api_client.get(self.primary_url)["ETag"]
+        bump_dataset_version()
+
+        response = self.api_client.get(self.primary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_binary_format(self):
+        """encoding=float32 serves the layer as packed float32 triples"""
+        response = self.api_client.get(f"{self.primary_url}?encoding=float32")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        points = unpack_points(response.content)
+        np.testing.assert_allclose(
+            points, [[-74.0060, 40.7128, 5], [-73.9855, 40.7580, 10]], rtol=1e-6
+        )
+
+        response = self.api_client.get(f"{self.primary_url}?encoding=csv")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_record_point_updates_layers_incrementally(self):
+        """Approvals/revocations patch the loaded layers, no query needed"""
+        self.get_points(self.primary_url)
+        self.get_points(self.secondary_url)
+        etag = self.api_client.get(self.primary_url)["ETag"]
+        self.cursor.execute.reset_mock()
+
+        # Existing point updated in place
+        heatmap_snapshot.record_point(2, 40.7580, -73.9855, 11)
+        # Secondary point reaching the threshold moves to the primary layer
+        heatmap_snapshot.record_point(3, 40.7431, -73.9712, 5)
+        # Point revoked down to 0 leaves the heatmap
+        heatmap_snapshot.record_point(4, 40.7300, -73.9900, 0)
+        # New point from an approved report
+        heatmap_snapshot.record_point(5, 40.7000, -74.0100, 1)
+        # Another centroid at the same coordinates is a separate point
+        heatmap_snapshot.record_point(6, 40.7000, -74.0100, 2)
+
+        self.assertEqual(
+            self.get_points(self.primary_url),
+            [
+                (40.7128, -74.0060, 5.0),
+                (40.7580, -73.9855, 11.0),
+                (40.7431, -73.9712, 5.0),
+            ],
+        )
+        self.assertEqual(
+            self.get_points(self.secondary_url),
+            [(40.7000, -74.0100, 1.0), (40.7000, -74.0100, 2.0)],
+        )
+        self.cursor.execute.assert_not_called()
+
+        response = self.api_client.get(self.primary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_record_point_without_snapshot_reloads(self):
+        """Changes made while no layer is loaded are read from the table"""
+        heatmap_snapshot.record_point(2, 40.7580, -73.9855, 11)
+        self.rows["primary"] = [(1, 40.7128, -74.0060, 5), (2, 40.7580, -73.9855, 11)]
+
+        self.assertEqual(
+            self.get_points(self.primary_url),
+            [(40.7128, -74.0060, 5.0), (40.7580, -73.9855, 11.0)],
+        )
+        self.assertTrue(self.cursor.execute.called)
+
+    def test_concurrent_bump_drops_snapshot(self):
+        """A bump the snapshot did not see forces a reload"""
+        self.get_points(self.primary_url)
+        bump_dataset_version()
+        heatmap_snapshot.record_point(2, 40.7580, -73.9855, 11)
+        self.rows["primary"] = [(2, 40.7580, -73.9855, 11)]
+        self.cursor.execute.reset_mock()
+
+        self.assertEqual(self.get_points(self.primary_url), [(40.7580, -73.9855, 11.0)])
+        self.assertTrue(self.cursor.execute.called)
+
+
+class HeatmapTileTestCase(BaseTestCase):
+    """Test cases for the cached binary HeatmapTileView"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Tile covering lower Manhattan at zoom 12
+        self.url = reverse("heatmap-tile", args=[12, 1205, 1540])
+
+        self.mock_data = [
+            (40.7128, -74.0060, 5),
+            (40.7580, -73.9855, "10"),
+            (40.7431, -73.9712, None),
+        ]
+
+    def authenticate(self):
+        """Helper method to authenticate the client"""
+        self.api_client.force_authenticate(user=self.user1)
+
+    def mock_rows(self, mock_cursor, rows):
+        mock_cursor_instance = MagicMock()
+        mock_cursor_instance.fetchall.return_value = rows
+        mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
+        return mock_cursor_instance
+
+    @patch("django.db.connection.cursor")
+    def test_authentication_required(self, mock_cursor):
+        """Test that authentication is required for tiles"""
+        response = self.api_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        mock_cursor.assert_not_called()
+
+    @patch("django.db.connection.cursor")
+    def test_tile_is_packed_float32(self, mock_cursor):
+        """Test that the tile body is packed lon/lat/intensity float32 triples"""
+        self.authenticate()
+        self.mock_rows(mock_cursor, self.mock_data)
+
+        response = self.api_client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["X-Point-Count"], "3")
+
+        points = unpack_points(response.content)
+        self.assertEqual(points.shape, (3, 3))
+        self.assertAlmostEqual(float(points[0][0]), -74.0060, places=4)
+        self.assertAlmostEqual(float(points[0][1]), 40.7128, places=4)
+        self.assertEqual(float(points[1][2]), 10.0)
+        # Missing complaint counts become 0
+        self.assertEqual(float(points[2][2]), 0.0)
+
+    @patch("django.db.connection.cursor")
+    def test_tile_query_uses_bbox_and_layer(self, mock_cursor):
+        """Test that the tile query is restricted to the tile bbox and layer"""
+        self.authenticate()
+        mock_cursor_instance = self.mock_rows(mock_cursor, [])
+
+        self.api_client.get(f"{self.url}?type=secondary")
+
+        args, kwargs = mock_cursor_instance.execute.call_args
+        self.assertIn("wkb_geometry && ST_MakeEnvelope", args[0])
+        self.assertIn("CMPLNT_NUM < %s", args[0])
+        west, south, east, north = tile_bounds(12, 1205, 1540)
+        self.assertEqual(args[1][:4], [west, south, east, north])
+        self.assertEqual(args[1][4], 5)
+
+    @patch("django.db.connection.cursor")
+    def test_tile_is_cached(self, mock_cursor):
+        """Test that a repeated tile request does not query the database"""
+        self.authenticate()
+        self.mock_rows(mock_cursor, self.mock_data)
+
+        first = self.api_client.get(self.url)
+        second = self.api_client.get(self.url)
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(mock_cursor.call_count, 1)
+
+    @patch("django.db.connection.cursor")
+    def test_version_bump_invalidates_tiles(self, mock_cursor):
+        """Test that bumping the dataset version rebuilds the tile"""
+        self.authenticate()
+        self.mock_rows(mock_cursor, self.mock_data)
+
+        first = self.api_client.get(self.url)
+        bump_dataset_version()
+        self.mock_rows(mock_cursor, self.mock_data[:1])
+        second = self.api_client.get(self.url)
+
+        self.assertNotEqual(first["X-Dataset-Version"], second["X-Dataset-Version"])
+        self.assertEqual(second["X-Point-Count"], "1")
+
+    @patch("django.db.connection.cursor")
+    def test_invalid_tile(self, mock_cursor):
+        """Test that out of range tile coordinates are rejected"""
+        self.authenticate()
+
+        response = self.api_client.get(reverse("heatmap-tile", args=[2, 4, 0]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.api_client.get(reverse("heatmap-tile", args=[25, 0, 0]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.api_client.get(f"{self.url}?type=invalid")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        mock_cursor.assert_not_called()
+
+    @patch("django.db.connection.cursor")
+    def test_tile_db_error(self, mock_cursor):
+        """Test handling of database errors while building a tile"""
+        self.authenticate()
+        mock_cursor.return_value.__enter__.side_effect = Exception("Database error")
+
+        response = self.api_client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def test_tile_bounds(self):
+        """Test the slippy-map tile to bbox conversion"""
+        self.assertEqual(tile_bounds(0, 0, 0)[0], -180.0)
+        self.assertAlmostEqual(tile_bounds(0, 0, 0)[3], 85.0511, places=4)
+
+        west, south, east, north = tile_bounds(12, 1205, 1540)
+        self.assertTrue(west < -74.0060 < east)
+        self.assertTrue(south < 40.7128 < north)
+
+
+# These tests follow the ORS calls one by one, speculative variants are
+# covered by RouteSpeculationTestCase
+@override_settings(ROUTE_SPECULATIVE_HOTSPOT_LIMITS=[])
 class RouteSafetyFunctionsTestCase(BaseTestCase):
     """Test cases for the route safety processing functions"""
 
@@ -1113,24 +1472,39 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         self.departure = [-74.0060, 40.7128]
         self.destination = [-118.2437, 34.0522]
 
+        # Reload the hotspot index from the mocked cursor in each test
+        hotspot_index.invalidate()
+
     @patch("django.db.connection.cursor")
     def test_get_crime_hotspots(self, mock_cursor):
         """Test the get_crime_hotspots function"""
-        # Mock the cursor response
+        # Mock the rows loaded into the hotspot index
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7200, -74.0100, 15, 0.01),
-            (40.7300, -74.0200, 20, 0.02),
+            (1, 40.7200, -74.0100, 15),
+            (2, 40.7300, -74.0200, 20),
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
         result = get_crime_hotspots(self.linestring)
 
         self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]["latitude"], 40.7200)
-        self.assertEqual(result[0]["longitude"], -74.0100)
-        self.assertEqual(result[0]["complaints"], 15)
-        self.assertEqual(result[0]["distance"], 0.01)
+        self.assertEqual({hotspot["id"] for hotspot in result}, {1, 2})
+        first = next(hotspot for hotspot in result if hotspot["id"] == 1)
+        self.assertEqual(first["latitude"], 40.7200)
+        self.assertEqual(first["longitude"], -74.0100)
+        self.assertEqual(first["complaints"], 15)
+        self.assertAlmostEqual(
+            first["distance"],
+            Point(-74.0100, 40.7200).distance(wkt.loads(self.linestring)),
+        )
+
+        # Hotspots come back by decreasing score
+        scores = [
+            hotspot["complaints"] / (hotspot["distance"] + 0.001) ** 1.5
+            for hotspot in result
+        ]
+        self.assertEqual(scores, sorted(scores, reverse=True))
 
     @patch("django.db.connection.cursor")
     def test_get_crime_hotspots_db_error(self, mock_cursor):
@@ -1145,23 +1519,26 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
     @patch("django.db.connection.cursor")
     def test_get_additional_hotspots(self, mock_cursor):
         """Test the get_additional_hotspots function"""
-        # Mock the cursor response
+        # The index contains the existing hotspots and two new ones
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7400, -74.0300, 12, 0.03),
-            (40.7500, -74.0400, 18, 0.04),
+            (1, 40.7200, -74.0100, 15),
+            (2, 40.7300, -74.0200, 20),
+            (3, 40.7400, -74.0300, 12),
+            (4, 40.7500, -74.0400, 18),
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
         # Call the function with existing hotspots
         result = get_additional_hotspots(self.linestring, self.mock_hotspots)
 
-        # Verify results
+        # Verify results, the existing hotspots are excluded
         self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]["latitude"], 40.7400)
-        self.assertEqual(result[0]["longitude"], -74.0300)
-        self.assertEqual(result[0]["complaints"], 12)
-        self.assertEqual(result[0]["distance"], 0.03)
+        self.assertEqual({hotspot["id"] for hotspot in result}, {3, 4})
+        added = next(hotspot for hotspot in result if hotspot["id"] == 3)
+        self.assertEqual(added["latitude"], 40.7400)
+        self.assertEqual(added["longitude"], -74.0300)
+        self.assertEqual(added["complaints"], 12)
 
     @patch("django.db.connection.cursor")
     def test_get_additional_hotspots_db_error(self, mock_cursor):
@@ -1193,28 +1570,8 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
         self.assertIsNone(result)
 
-    @patch("map.views.transform")
-    def test_create_avoid_polygons_with_scaled_radius(self, mock_transform):
+    def test_create_avoid_polygons_with_scaled_radius(self):
         """Test create_avoid_polygons with complaints-based radius scaling"""
-        # We need to mock the transform function to control the output polygon sizes
-        # This helps us verify the scaling logic without relying on external libraries
-
-        # For the low complaints test, create a small polygon
-        small_polygon = Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])
-
-        # For the high complaints test, create a larger polygon
-        large_polygon = Polygon([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
-
-        # Configure the mock to return our controlled polygons
-        mock_transform.side_effect = [
-            # First hotspot with low complaints
-            Point(1, 1),  # point_utm (first transform call)
-            small_polygon,  # buffer_wgs84 (second transform call)
-            # Second hotspot with high complaints
-            Point(1, 1),  # point_utm (third transform call)
-            large_polygon,  # buffer_wgs84 (fourth transform call)
-        ]
-
         # Create two hotspots with significantly different complaint numbers
         low_complaint_hotspots = [
             {
@@ -1244,12 +1601,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         # Verify that the high complaint polygon was created with a larger area
         self.assertGreater(high_result.area, low_result.area)
 
-        # Verify that transform was called
-        self.assertTrue(mock_transform.called)
-        # We expect 4 calls (2 for each hotspot × 2 hotspots)
-        self.assertGreaterEqual(mock_transform.call_count, 2)
-
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_get_safer_ors_route(self, mock_post):
         """Test the get_safer_ors_route function"""
         # Create a simple avoid polygon
@@ -1285,7 +1637,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         self.assertIn("options", kwargs["json"])
         self.assertIn("avoid_polygons", kwargs["json"]["options"])
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_get_safer_ors_route_error(self, mock_post):
         """Test get_safer_ors_route handling of API errors"""
         # Mock ORS response to raise an exception
@@ -1295,7 +1647,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
         self.assertIn("error", result)
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_get_safer_ors_route_status_413(self, mock_post):
         """Test handling of 413 (payload too large) error"""
         # Create a mock response with 413 status
@@ -1374,7 +1726,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
     @patch("polyline.decode")
     @patch("django.db.connection.cursor")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_process_route_with_crime_data(
         self, mock_post, mock_cursor, mock_polyline_decode
     ):
@@ -1382,19 +1734,15 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         # Mock polyline decode to return coordinates
         mock_polyline_decode.return_value = [[-74.0060, 40.7128], [-118.2437, 34.0522]]
 
-        # Mock cursor for crime data - first for phase 1 hotspots, then for phase 2
+        # Mock cursor for crime data, loaded once into the hotspot index
         mock_cursor_instance = MagicMock()
-        # Phase 1 hotspots
-        mock_cursor_instance.fetchall.side_effect = [
-            [
-                (40.7200, -74.0100, 15, 0.01),
-                (40.7300, -74.0200, 20, 0.02),
-            ],
+        mock_cursor_instance.fetchall.return_value = [
+            # Phase 1 hotspots
+            (1, 40.7200, -74.0100, 15),
+            (2, 40.7300, -74.0200, 20),
             # Phase 2 hotspots
-            [
-                (40.7400, -74.0300, 12, 0.03),
-                (40.7500, -74.0400, 18, 0.04),
-            ],
+            (3, 40.7400, -74.0300, 12),
+            (4, 40.7500, -74.0400, 18),
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -1427,7 +1775,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
     @patch("polyline.decode")
     @patch("django.db.connection.cursor")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_process_route_error_in_intermediate_route(
         self, mock_post, mock_cursor, mock_polyline_decode
     ):
@@ -1438,8 +1786,8 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         # Mock cursor for crime data
         mock_cursor_instance = MagicMock()
         mock_cursor_instance.fetchall.return_value = [
-            (40.7200, -74.0100, 15, 0.01),
-            (40.7300, -74.0200, 20, 0.02),
+            (1, 40.7200, -74.0100, 15),
+            (2, 40.7300, -74.0200, 20),
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -1457,7 +1805,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
     @patch("polyline.decode")
     @patch("django.db.connection.cursor")
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_process_route_with_two_phase_hotspots(
         self, mock_post, mock_cursor, mock_polyline_decode
     ):
@@ -1478,15 +1826,13 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
 
         # Phase 1 and Phase 2 hotspots
         mock_cursor_instance = MagicMock()
-        mock_cursor_instance.fetchall.side_effect = [
-            [  # Phase 1 hotspots
-                (40.7200, -74.0100, 15, 0.01),
-                (40.7300, -74.0200, 20, 0.02),
-            ],
-            [  # Phase 2 hotspots (different locations)
-                (41.0200, -76.0100, 12, 0.01),
-                (41.0300, -76.0200, 18, 0.02),
-            ],
+        mock_cursor_instance.fetchall.return_value = [
+            # Phase 1 hotspots
+            (1, 40.7200, -74.0100, 15),
+            (2, 40.7300, -74.0200, 20),
+            # Phase 2 hotspots (different locations)
+            (3, 41.0200, -76.0100, 12),
+            (4, 41.0300, -76.0200, 18),
         ]
         mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
@@ -1512,8 +1858,8 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
             result["routes"][0]["geometry"], "final_route_with_all_hotspots_avoided"
         )
 
-        # Verify we called cursor.execute twice (once for each phase)
-        self.assertEqual(mock_cursor_instance.fetchall.call_count, 2)
+        # The hotspot index is loaded once, both phases query it in memory
+        self.assertEqual(mock_cursor_instance.fetchall.call_count, 1)
 
         # Verify we called polyline.decode twice (once for each route)
         self.assertEqual(mock_polyline_decode.call_count, 2)
@@ -1557,25 +1903,17 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
                 [-118.2437, 34.0522],
             ]
 
-            # Mock cursor for crime data - for phase 1 and phase 2 hotspots
+            # Mock cursor for crime data - phase 1 picks up both hotspots
             with patch("django.db.connection.cursor") as mock_cursor:
                 mock_cursor_instance = MagicMock()
-                # Phase 1 hotspots
-                mock_cursor_instance.fetchall.side_effect = [
-                    [
-                        (40.7200, -74.0100, 15, 0.01),
-                        (40.7300, -74.0200, 20, 0.02),
-                    ],
-                    # Phase 2 hotspots
-                    [
-                        (40.7400, -74.0300, 12, 0.03),
-                        (40.7500, -74.0400, 18, 0.04),
-                    ],
+                mock_cursor_instance.fetchall.return_value = [
+                    (1, 40.7200, -74.0100, 15),
+                    (2, 40.7300, -74.0200, 20),
                 ]
                 mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
 
                 # Mock ORS responses - success for phase 1, error for phase 2
-                with patch("requests.post") as mock_post:
+                with patch("requests.Session.post") as mock_post:
                     # Phase 1 successful response
                     phase1_response = MagicMock()
                     phase1_response.ok = True
@@ -1632,51 +1970,25 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
             },
         ]
 
-        # Patch the transform function to
-        # control the output and allow us to test the radii
-        with patch("map.views.transform") as mock_transform:
-            # Mock Point objects for the return values of transform
-            point_mock = Point(1, 1)
-
-            # Set up different polygon sizes to return based on the scaled radii
-            small_polygon = Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])
-            medium_polygon = Polygon([(0, 0), (0, 1.5), (1.5, 1.5), (1.5, 0), (0, 0)])
-            large_polygon = Polygon([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
-
-            # Mock the transform returns in sequence
-            mock_transform.side_effect = [
-                # First hotspot (low complaints)
-                point_mock,  # transform(project, point)
-                small_polygon,  # transform(project_back, buffer_utm)
-                # Second hotspot (medium complaints)
-                point_mock,  # transform(project, point)
-                medium_polygon,  # transform(project_back, buffer_utm)
-                # Third hotspot (high complaints)
-                point_mock,  # transform(project, point)
-                large_polygon,  # transform(project_back, buffer_utm)
-            ]
-
-            # Call the function
-            result = create_avoid_polygons(test_hotspots)
-
-            # Verify results
-            self.assertIsInstance(result, MultiPolygon)
-            self.assertEqual(len(result.geoms), 3)
-
-            # Check that the radii were scaled properly (by checking the polygon areas)
-            # Sort polygons by area to match our expectation
-            sorted_polygons = sorted(result.geoms, key=lambda p: p.area)
-
-            # Low complaints should have smallest area
-            self.assertEqual(sorted_polygons[0].area, small_polygon.area)
-            # Medium complaints should have medium area
-            self.assertEqual(sorted_polygons[1].area, medium_polygon.area)
-            # High complaints should have largest area
-            self.assertEqual(sorted_polygons[2].area, large_polygon.area)
+        result = create_avoid_polygons(test_hotspots)
 
-            # Verify transform was called with the expected parameters
-            # We're expecting 6 calls (2 for each hotspot)
-            self.assertEqual(mock_transform.call_count, 6)
+        # Verify results
+        self.assertIsInstance(result, MultiPolygon)
+        self.assertEqual(len(result.geoms), 3)
+
+        # Polygons keep the hotspot order and grow with the complaints
+        areas = [polygon.area for polygon in result.geoms]
+        self.assertLess(areas[0], areas[1])
+        self.assertLess(areas[1], areas[2])
+
+        # 80m for a quiet block up to 200m at 100 complaints, measured in UTM
+        for polygon, radius in zip(result.geoms, [92, 140, 200]):
+            utm_polygon = shapely.transform(
+                polygon,
+                lambda xy: np.column_stack(WGS84_TO_UTM.transform(xy[:, 0], xy[:, 1])),
+            )
+            circle_area = np.pi * radius**2
+            self.assertAlmostEqual(utm_polygon.area / circle_area, 1, delta=0.1)
 
     def test_get_safer_ors_route_error_handling(self):
         """Test improved error handling in get_safer_ors_route without fallback"""
@@ -1696,7 +2008,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         )
 
         # Mock ORS response with error
-        with patch("requests.post") as mock_post:
+        with patch("requests.Session.post") as mock_post:
             mock_response = MagicMock()
             mock_response.ok = False
             mock_response.status_code = 404
@@ -1726,7 +2038,7 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
         ) as mock_get_additional_hotspots, patch(
             "polyline.decode"
         ) as mock_polyline_decode, patch(
-            "requests.post"
+            "requests.Session.post"
         ) as mock_post:
             # Setup polyline decode mock
             mock_polyline_decode.return_value = [
@@ -1813,6 +2125,608 @@ class RouteSafetyFunctionsTestCase(BaseTestCase):
             )  # Should be 1 hotspot
 
 
+class RouteSpeculationTestCase(TestCase):
+    """Test cases for the concurrent Phase 2 of process_route_with_crime_data"""
+
+    def setUp(self):
+        self.departure = (-74.0060, 40.7128)
+        self.destination = (-73.9855, 40.7580)
+        self.initial_route = {
+            "routes": [
+                {
+                    "geometry": polyline.encode(
+                        [self.departure, self.destination], geojson=True
+                    )
+                }
+            ]
+        }
+        # Hotspots along the initial route, best first
+        self.hotspots = [
+            {
+                "id": i,
+                "latitude": 40.7150 + i * 0.0025,
+                "longitude": -74.0050 + i * 0.001,
+                "complaints": 50 - i,
+                "distance": 0.001,
+            }
+            for i in range(14)
+        ]
+        self.intermediate_route = self.route(
+            [self.departure, (-73.9700, 40.7300), self.destination]
+        )
+        self.final_route = self.route(
+            [self.departure, (-73.9600, 40.7300), self.destination]
+        )
+        self.variant_route = self.route(
+            [self.departure, (-74.0300, 40.7400), self.destination]
+        )
+        self.final_delay = 0
+        self.ors_calls = []
+        self.ors_threads = {}
+
+        patchers = [
+            patch("map.views.get_crime_hotspots", side_effect=self.get_hotspots),
+            patch("map.views.get_safer_ors_route", side_effect=self.get_safer_route),
+            patch("map.views.get_additional_hotspots"),
+        ]
+        mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.mock_additional = mocks[2]
+        # Not on the variant route, right on the intermediate one
+        self.mock_additional.return_value = [
+            {"id": 100, "latitude": 40.7300, "longitude": -73.9700, "complaints": 30}
+        ]
+
+    def route(self, coords):
+        return {"routes": [{"geometry": polyline.encode(coords, geojson=True)}]}
+
+    def get_hotspots(self, linestring, limit=10):
+        return [dict(hotspot) for hotspot in self.hotspots[:limit]]
+
+    def get_safer_route(self, departure, destination, avoid_polygons):
+        """Answer like ORS, telling the requests apart by polygon count"""
+        count = len(avoid_polygons.geoms)
+        self.ors_calls.append(count)
+        self.ors_threads[count] = threading.current_thread().name
+        if count == 7:
+            return json.loads(json.dumps(self.intermediate_route))
+        if count == 8:
+            time.sleep(self.final_delay)
+            return json.loads(json.dumps(self.final_route))
+        return json.loads(json.dumps(self.variant_route))
+
+    def test_speculative_variants_sent_with_phase1(self):
+        """Test that hotspot-count variants are requested alongside Phase 1"""
+        process_route_with_crime_data(self.initial_route)
+
+        self.assertEqual(sorted(self.ors_calls), [7, 8, 10, 14])
+        # The requests that may be abandoned do not use the routing pool
+        for count in (8, 10, 14):
+            self.assertTrue(self.ors_threads[count].startswith("speculative"))
+
+    def test_acceptable_variant_wins_over_slow_final_route(self):
+        """Test that a variant clear of the Phase 2 hotspots is used right away"""
+        self.final_delay = 1
+
+        start = time.monotonic()
+        result = process_route_with_crime_data(self.initial_route)
+
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(
+            result["routes"][0]["geometry"], self.variant_route["routes"][0]["geometry"]
+        )
+        self.assertEqual(result["metadata"]["phase"], "Phase 2")
+        self.assertIn(result["metadata"]["avoided_hotspots"], [11, 15])
+
+    def test_variant_crossing_phase2_hotspots_is_rejected(self):
+        """Test that the final route is awaited when variants are not clear"""
+        self.mock_additional.return_value = [
+            {"id": 101, "latitude": 40.7400, "longitude": -74.0300, "complaints": 30}
+        ]
+        self.final_delay = 0.2
+
+        result = process_route_with_crime_data(self.initial_route)
+
+        self.assertEqual(
+            result["routes"][0]["geometry"], self.final_route["routes"][0]["geometry"]
+        )
+        self.assertEqual(result["metadata"]["phase"], "Phase 2")
+        self.assertEqual(result["metadata"]["avoided_hotspots"], 8)
+
+    @override_settings(ROUTE_LATENCY_BUDGET=0.2)
+    def test_latency_budget_falls_back_to_phase1(self):
+        """Test that a slow Phase 2 is abandoned for the Phase 1 route"""
+        self.mock_additional.return_value = [
+            {"id": 101, "latitude": 40.7400, "longitude": -74.0300, "complaints": 30}
+        ]
+        self.final_delay = 1
+
+        start = time.monotonic()
+        result = process_route_with_crime_data(self.initial_route)
+
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(
+            result["routes"][0]["geometry"],
+            self.intermediate_route["routes"][0]["geometry"],
+        )
+        self.assertEqual(result["metadata"]["phase"], "Phase 1")
+
+
+class HotspotIndexTestCase(TestCase):
+    """Test cases for the in-memory HotspotIndex"""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        count = 500
+        self.rows = [
+            (i, lat, lon, complaints)
+            for i, (lat, lon, complaints) in enumerate(
+                zip(
+                    rng.uniform(40.55, 40.90, count),
+                    rng.uniform(-74.20, -73.75, count),
+                    rng.integers(5, 200, count),
+                )
+            )
+        ]
+        self.index = HotspotIndex()
+        self.index.load_rows(self.rows)
+        self.route = LineString([(-74.0060, 40.7128), (-73.9855, 40.7580)])
+
+    def brute_force(self, limit, exclude=(), min_distance=0.005):
+        """Score every row like the original ORDER BY query did"""
+        scored = []
+        for ogc_fid, lat, lon, complaints in self.rows:
+            point = Point(lon, lat)
+            if any(
+                point.distance(Point(h["longitude"], h["latitude"])) <= min_distance
+                for h in exclude
+            ):
+                continue
+            distance = point.distance(self.route)
+            scored.append((complaints * 0.7 / (distance + 0.001) ** 1.5, ogc_fid))
+        scored.sort(key=lambda item: -item[0])
+        return [ogc_fid for _, ogc_fid in scored[:limit]]
+
+    def test_query_matches_full_scan(self):
+        """Test that the pruned search returns the same top hotspots"""
+        result = self.index.query(self.route, limit=7)
+
+        self.assertEqual([h["id"] for h in result], self.brute_force(7))
+
+    def test_query_with_exclusions_matches_full_scan(self):
+        """Test that hotspots near already chosen ones are skipped"""
+        existing = self.index.query(self.route, limit=7)
+
+        result = self.index.query(self.route, limit=7, exclude=existing)
+
+        self.assertEqual(
+            [h["id"] for h in result], self.brute_force(7, exclude=existing)
+        )
+        self.assertFalse({h["id"] for h in result} & {h["id"] for h in existing})
+
+    def test_query_far_from_every_hotspot(self):
+        """Test that the search radius grows until it finds hotspots"""
+        far_route = LineString([(-72.0, 42.0), (-71.9, 42.1)])
+
+        result = self.index.query(far_route, limit=3)
+
+        self.assertEqual(len(result), 3)
+
+    def test_query_empty_index(self):
+        """Test that an empty index returns no hotspots"""
+        self.assertEqual(HotspotIndex().query(self.route, limit=5), [])
+
+    @patch("django.db.connection.cursor")
+    def test_reload_on_dataset_version_change(self, mock_cursor):
+        """Test that the index is only reloaded when the dataset changes"""
+        mock_cursor_instance = MagicMock()
+        mock_cursor_instance.fetchall.return_value = self.rows[:10]
+        mock_cursor.return_value.__enter__.return_value = mock_cursor_instance
+
+        self.index.invalidate()
+        self.index.ensure_fresh()
+        self.index.ensure_fresh()
+        self.assertEqual(mock_cursor_instance.fetchall.call_count, 1)
+        self.assertEqual(len(self.index), 10)
+
+        bump_dataset_version()
+        self.index.ensure_fresh()
+        self.assertEqual(mock_cursor_instance.fetchall.call_count, 2)
+
+
+class AvoidPolygonStoreTestCase(TestCase):
+    """Test cases for the precomputed avoidance polygons"""
+
+    def setUp(self):
+        self.store = AvoidPolygonStore()
+        self.hotspots = [
+            {"id": 1, "latitude": 40.7200, "longitude": -74.0100, "complaints": 15},
+            {"id": 2, "latitude": 40.7300, "longitude": -74.0200, "complaints": 80},
+        ]
+
+    def test_matches_per_point_buffer(self):
+        """Test that the batch build matches buffering each point on its own"""
+        polygon = self.store.get_many(self.hotspots[:1])[0]
+
+        to_utm = pyproj.Transformer.from_crs(
+            "EPSG:4326", "EPSG:26918", always_xy=True
+        ).transform
+        to_wgs84 = pyproj.Transformer.from_crs(
+            "EPSG:26918", "EPSG:4326", always_xy=True
+        ).transform
+        expected = transform(
+            to_wgs84,
+            transform(to_utm, Point(-74.0100, 40.7200)).buffer(98),
+        ).simplify(0.0002)
+
+        self.assertTrue(polygon.equals_exact(expected, 1e-9))
+
+    def test_polygons_are_reused(self):
+        """Test that known hotspots are looked up instead of rebuilt"""
+        first = self.store.get_many(self.hotspots)
+
+        with patch("map.avoid_polygons.build_avoid_polygons") as mock_build:
+            second = self.store.get_many(list(reversed(self.hotspots)))
+
+        mock_build.assert_not_called()
+        self.assertIs(second[0], first[1])
+        self.assertIs(second[1], first[0])
+
+    def test_polygon_rebuilt_when_complaints_change(self):
+        """Test that a report changing the complaint count resizes the polygon"""
+        before = self.store.get_many(self.hotspots)[0]
+
+        after = self.store.get_many([dict(self.hotspots[0], complaints=100)])[0]
+
+        self.assertGreater(after.area, before.area)
+
+    def test_hotspots_without_id_are_not_stored(self):
+        """Test that ad-hoc hotspots are built but not kept"""
+        polygons = self.store.get_many([{**self.hotspots[0], "id": None}])
+
+        self.assertEqual(len(polygons), 1)
+        self.assertEqual(len(self.store), 0)
+
+    def test_fill(self):
+        """Test bulk precomputation from index arrays"""
+        self.store.fill(
+            np.array([1, 2]),
+            np.array([-74.0100, -74.0200]),
+            np.array([40.7200, 40.7300]),
+            np.array([15.0, 80.0]),
+        )
+
+        with patch("map.avoid_polygons.build_avoid_polygons") as mock_build:
+            polygons = self.store.get_many(self.hotspots)
+
+        mock_build.assert_not_called()
+        self.assertEqual(len(self.store), 2)
+        self.assertTrue(all(polygon.is_valid for polygon in polygons))
+
+
+class RoadGraphTestCase(BaseTestCase):
+    """Test cases for the local road graph router"""
+
+    def setUp(self):
+        super().setUp()
+        # 5x5 street grid, ~170m x ~220m blocks
+        self.lons = [-74.0000 + i * 0.002 for i in range(5)]
+        self.lats = [40.7300 + j * 0.002 for j in range(5)]
+        self.segments = []
+        for i, lon in enumerate(self.lons):
+            for j, lat in enumerate(self.lats):
+                if i < 4:
+                    self.segments.append(
+                        LineString([(lon, lat), (self.lons[i + 1], lat)])
+                    )
+                if j < 4:
+                    self.segments.append(
+                        LineString([(lon, lat), (lon, self.lats[j + 1])])
+                    )
+        # Crime right in the middle of the grid
+        self.crime_point = (self.lons[2], self.lats[2])
+        self.crime_points = np.array([[self.crime_point[0], self.crime_point[1], 200]])
+        self.graph = RoadGraph.from_arrays(
+            build_road_graph(self.segments, self.crime_points),
+            get_dataset_version(),
+        )
+        self.departure = [self.lons[0], self.lats[2]]
+        self.destination = [self.lons[4], self.lats[2]]
+
+    def dijkstra(self, source, target, weights):
+        """Plain Dijkstra over the same arrays to check A*"""
+        arrays = self.graph._arrays
+        costs = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > costs[node]:
+                continue
+            for edge in range(arrays["indptr"][node], arrays["indptr"][node + 1]):
+                neighbor = int(arrays["neighbors"][edge])
+                new_cost = cost + float(weights[arrays["edge_segment"][edge]])
+                if new_cost < costs.get(neighbor, float("inf")):
+                    costs[neighbor] = new_cost
+                    heapq.heappush(heap, (new_cost, neighbor))
+        return costs[target]
+
+    def path_cost(self, path, weights):
+        segments = self.graph._arrays["edge_segment"][path]
+        return float(np.sum(weights[segments].astype(np.float64)))
+
+    def test_graph_structure(self):
+        """Test that grid intersections become shared nodes"""
+        arrays = self.graph._arrays
+
+        self.assertEqual(len(self.graph), 25)
+        self.assertEqual(len(arrays["neighbors"]), 2 * len(self.segments))
+        self.assertEqual(arrays["indptr"][-1], len(arrays["neighbors"]))
+
+    def test_a_star_matches_dijkstra(self):
+        """Test that A* finds optimal paths for both weightings"""
+        arrays = self.graph._arrays
+        for weights in [arrays["segment_length"], arrays["segment_weight"]]:
+            for source, target in [(0, 24), (3, 17), (20, 4), (12, 0)]:
+                path = self.graph.shortest_path(source, target, weights)
+                self.assertAlmostEqual(
+                    self.path_cost(path, weights),
+                    self.dijkstra(source, target, weights),
+                    places=2,
+                )
+
+    def test_safer_route_avoids_crime(self):
+        """Test that the risk weights route around the crime point"""
+        routes = self.graph.route(self.departure, self.destination)
+
+        initial = routes["initial_route"]["routes"][0]
+        safer = routes["safer_route"]["routes"][0]
+        crime = Point(self.crime_point)
+        initial_line = LineString(polyline.decode(initial["geometry"], geojson=True))
+        safer_line = LineString(polyline.decode(safer["geometry"], geojson=True))
+
+        self.assertAlmostEqual(initial_line.distance(crime), 0, places=6)
+        self.assertGreater(safer_line.distance(crime), 0.0015)
+        self.assertGreater(safer["summary"]["distance"], initial["summary"]["distance"])
+        self.assertAlmostEqual(initial["summary"]["distance"], 675, delta=10)
+        self.assertTrue(
+            Point(safer_line.coords[0]).equals_exact(Point(self.departure), 1e-5)
+        )
+        self.assertTrue(
+            Point(safer_line.coords[-1]).equals_exact(Point(self.destination), 1e-5)
+        )
+
+    def test_trip_outside_graph(self):
+        """Test that trips the graph does not cover are left to ORS"""
+        self.assertIsNone(self.graph.route([-73.90, 40.65], self.destination))
+        self.assertIsNone(
+            RoadGraph("/nonexistent").route(self.departure, self.destination)
+        )
+
+    def test_memory_mapped_graph(self):
+        """Test that a saved graph is memory-mapped and routes the same"""
+        with tempfile.TemporaryDirectory() as directory:
+            save_road_graph(
+                build_road_graph(self.segments, self.crime_points),
+                directory,
+                get_dataset_version(),
+            )
+            graph = RoadGraph(directory)
+
+            self.assertTrue(graph.is_available())
+            self.assertIsInstance(graph._arrays["indptr"], np.memmap)
+            routes = graph.route(self.departure, self.destination)
+            self.assertEqual(routes, self.graph.route(self.departure, self.destination))
+            del graph, routes
+
+    def test_stale_weights_left_to_ors(self):
+        """Test that risk weights older than the dataset are recomputed"""
+        version = bump_dataset_version()
+        # Weights for a newer version than asked for are not downgraded
+        self.assertIsNone(self.graph.route(self.departure, self.destination, 1))
+        self.assertIsNone(self.graph._refresh_thread)
+
+        with patch("map.road_graph.fetch_crime_points", return_value=np.empty((0, 3))):
+            self.assertIsNone(self.graph.route(self.departure, self.destination))
+            self.graph._refresh_thread.join()
+        routes = self.graph.route(self.departure, self.destination, version)
+
+        # The crime point was removed, the safest route is the shortest one
+        self.assertEqual(
+            routes["safer_route"]["routes"], routes["initial_route"]["routes"]
+        )
+
+    @patch("requests.Session.post")
+    def test_route_view_uses_road_graph(self, mock_post):
+        """Test that /get-route/ answers from the road graph without ORS"""
+        cache.clear()
+        self.graph.refresh_weights(get_dataset_version(), self.crime_points)
+        self.api_client.force_authenticate(user=self.user1)
+        data = {
+            "departure": [self.departure[1], self.departure[0]],
+            "destination": [self.destination[1], self.destination[0]],
+            "saved_route": False,
+        }
+
+        with patch("map.views.road_graph", self.graph):
+            response = self.api_client.post(reverse("get-route"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["safer_route"]["metadata"]["engine"], "road_graph"
+        )
+        mock_post.assert_not_called()
+
+
+class SegmentationTestCase(TestCase):
+    """Test cases for splitting roads into blocks"""
+
+    def setUp(self):
+        # Long avenues and streets crossing each other, plus a dead end
+        self.roads = [
+            LineString([(-74.00 + i * 0.003, 40.70), (-74.00 + i * 0.003, 40.75)])
+            for i in range(6)
+        ] + [
+            LineString([(-74.001, 40.70 + j * 0.004), (-73.984, 40.70 + j * 0.004)])
+            for j in range(10)
+        ]
+        self.roads.append(LineString([(-73.9955, 40.7040), (-73.9955, 40.7060)]))
+
+    def normalized(self, segments):
+        return sorted(shapely.to_wkt(shapely.normalize(segments), rounding_precision=7))
+
+    def test_roads_split_at_every_intersection(self):
+        """Test that every crossing splits both roads, not just the last one"""
+        segments = segment_roads(self.roads, workers=1)
+
+        # Avenues: 9 crossings and a corner -> 10 pieces, streets: 6 crossings
+        # -> 7 pieces, and the dead end (T junction) splits a street once more
+        self.assertEqual(len(segments), 6 * 10 + 10 * 7 + 1 + 1)
+        self.assertAlmostEqual(
+            shapely.length(segments).sum(),
+            sum(road.length for road in self.roads),
+            places=9,
+        )
+
+    def test_tiles_match_noding_everything_at_once(self):
+        """Test that segments crossing tile borders are found exactly once"""
+        expected = shapely.get_parts(shapely.node(shapely.multilinestrings(self.roads)))
+
+        for tile_size in [0.001, 0.0042, 0.02]:
+            segments = segment_roads(self.roads, tile_size=tile_size, workers=1)
+            self.assertEqual(self.normalized(segments), self.normalized(expected))
+
+    def test_duplicate_roads(self):
+        """Test that roads present in two borough files are only kept once"""
+        segments = segment_roads(self.roads + self.roads[:3], workers=1)
+
+        self.assertEqual(len(segments), 6 * 10 + 10 * 7 + 1 + 1)
+
+    def test_process_pool(self):
+        """Test that tiles processed in worker processes give the same result"""
+        progress = []
+
+        segments = segment_roads(
+            self.roads,
+            tile_size=0.01,
+            workers=2,
+            progress=lambda *args: progress.append(args),
+        )
+
+        self.assertEqual(
+            self.normalized(segments),
+            self.normalized(segment_roads(self.roads, tile_size=0.01, workers=1)),
+        )
+        self.assertEqual(progress[-1][0], progress[-1][1])
+        self.assertEqual(progress[-1][2], len(segments))
+
+
+class ORSClientTestCase(TestCase):
+    """Test cases for the pooled ORS client against the local stub server"""
+
+    def setUp(self):
+        self.server = StubORSServer().start()
+        self.addCleanup(self.server.stop)
+        self.ors = ORSClient(base_url=self.server.url, api_key="test-key")
+        self.body = {
+            "coordinates": [[-74.0060, 40.7128], [-73.9855, 40.7580]],
+            "format": "geojson",
+        }
+
+    def test_directions(self):
+        """Test that a route is fetched from the directions endpoint"""
+        response = self.ors.directions(self.body)
+
+        self.assertTrue(response.ok)
+        route = response.json()["routes"][0]
+        self.assertEqual(
+            polyline.decode(route["geometry"], geojson=True)[0][1], 40.7128
+        )
+        self.assertGreater(route["summary"]["distance"], 0)
+        self.assertEqual(
+            self.server.requests, [("/v2/directions/foot-walking", self.body)]
+        )
+
+    def test_identical_requests_are_coalesced(self):
+        """Test that concurrent identical requests share one upstream call"""
+        self.server.delay = 0.3
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            responses = list(
+                executor.map(lambda _: self.ors.directions(self.body), range(5))
+            )
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(all(r is responses[0] for r in responses))
+        self.assertEqual(self.ors._in_flight, {})
+
+    def test_different_requests_are_not_coalesced(self):
+        """Test that only identical request bodies are coalesced"""
+        other_body = dict(self.body, coordinates=self.body["coordinates"][::-1])
+        self.server.delay = 0.2
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(self.ors.directions, [self.body, other_body]))
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_pool_covers_the_routing_threads(self):
+        """Test that every routing thread can keep its ORS connection"""
+        adapter = self.ors.session.get_adapter(self.server.url)
+
+        self.assertEqual(
+            adapter._pool_maxsize,
+            settings.ROUTE_WORKERS + settings.ROUTE_SPECULATIVE_WORKERS,
+        )
+        # Extra callers wait for a connection rather than discarding theirs
+        self.assertTrue(adapter._pool_block)
+
+    def test_error_response(self):
+        """Test that ORS errors are returned to the caller unchanged"""
+        self.server.fail_next(404)
+
+        response = self.ors.directions(self.body)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("Route could not be found", response.text)
+
+    def test_timeout(self):
+        """Test that a slow upstream raises instead of hanging"""
+        self.server.delay = 0.5
+        client = ORSClient(base_url=self.server.url, timeout=0.1)
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.directions(self.body)
+        self.assertEqual(client._in_flight, {})
+
+    def test_async_directions(self):
+        """Test the asyncio variant"""
+        response = asyncio.run(self.ors.adirections(self.body))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_safer_route_through_stub(self):
+        """Test get_safer_ors_route end to end against the stub"""
+        avoid_polygons = MultiPolygon(
+            [
+                Polygon(
+                    [(-74.0, 40.73), (-73.99, 40.73), (-73.99, 40.74), (-74.0, 40.73)]
+                )
+            ]
+        )
+
+        with patch("map.views.ors_client", self.ors):
+            result = get_safer_ors_route(
+                self.body["coordinates"][0], self.body["coordinates"][1], avoid_polygons
+            )
+            self.server.fail_next(400, "Avoid polygons too large")
+            error = get_safer_ors_route(
+                self.body["coordinates"][0], self.body["coordinates"][1], avoid_polygons
+            )
+
+        self.assertIn("routes", result)
+        self.assertIn("avoid_polygons", self.server.requests[0][1]["options"])
+        self.assertIn("400", error["error"])
+
+
 class NYCBoundaryValidationTestCase(TestCase):
     """Test cases specifically for NYC boundary validation logic"""
 
@@ -0,0 +1,134 @@
+import math
+import numpy as np
+from django.core.cache import cache
+from django.db import connection
+from .dataset import get_dataset_version
+
+# Points with at least this many complaints belong to the primary layer
+PRIMARY_THRESHOLD = 5
+
+# Tiles are aggregated on a grid of TILE_SIZE x TILE_SIZE cells (one per pixel)
+TILE_SIZE = 256
+MAX_ZOOM = 20
+
+# Tiles are keyed by dataset version, so they never need to expire on their own
+TILE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Each point is packed as 3 little-endian float32: longitude, latitude, intensity
+POINT_DTYPE = np.dtype("<f4")
+POINT_FIELDS = 3
+POINT_SIZE = POINT_DTYPE.itemsize * POINT_FIELDS
+
+
+def parse_intensity(complaints):
+    """Convert a raw CMPLNT_NUM value to a float, 0.0 if it is missing/invalid"""
+    try:
+        return float(complaints) if complaints is not None else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def parse_layer(data_type):
+    """
+    Map the heatmap type query parameter to a layer name
+
+    Returns:
+        str: "primary" or "secondary", None if the type is invalid
+    """
+    if data_type in ["1", "primary"]:
+        return "primary"
+    if data_type in ["2", "secondary"]:
+        return "secondary"
+    return None
+
+
+def is_valid_tile(z, x, y):
+    """Check that z/x/y address an existing slippy-map tile"""
+    if z < 0 or z > MAX_ZOOM:
+        return False
+    n = 2**z
+    return 0 <= x < n and 0 <= y < n
+
+
+def tile_bounds(z, x, y):
+    """
+    Get the WGS84 bounding box of a slippy-map (web mercator) tile
+
+    Returns:
+        tuple: (west, south, east, north) in degrees
+    """
+    n = 2**z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def fetch_tile_points(z, x, y, layer):
+    """
+    Query the crime points inside a tile, pre-aggregated to one point per cell
+
+    The bbox test (&&) is answered by the GiST index on wkb_geometry, so only
+    the rows inside the tile are read. Points falling in the same grid cell
+    are merged into their centroid with the summed complaint count.
+
+    Returns:
+        list: (latitude, longitude, complaints) rows
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    cell_size = (east - west) / TILE_SIZE
+    operator_sql = ">=" if layer == "primary" else "<"
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT ST_Y(ST_Centroid(ST_Collect(wkb_geometry))) AS latitude,
+            ST_X(ST_Centroid(ST_Collect(wkb_geometry))) AS longitude,
+            SUM(CMPLNT_NUM) AS complaints
+            FROM filtered_grouped_data_centroid
+            WHERE wkb_geometry && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
+            AND CMPLNT_NUM {operator_sql} %s
+            GROUP BY ST_SnapToGrid(wkb_geometry, %s);""",
+            [west, south, east, north, PRIMARY_THRESHOLD, cell_size],
+        )
+        return cursor.fetchall()
+
+
+def pack_points(rows):
+    """
+    Pack (latitude, longitude, complaints) rows into a float32 byte string
+
+    The layout is [lon, lat, intensity, lon, lat, intensity, ...], which the
+    client reads back with a single Float32Array over the response body.
+    """
+    points = np.zeros((len(rows), POINT_FIELDS), dtype=POINT_DTYPE)
+    for i, (latitude, longitude, complaints) in enumerate(rows):
+        points[i] = (longitude, latitude, parse_intensity(complaints))
+    return points.tobytes()
+
+
+def unpack_points(payload):
+    """Inverse of pack_points, returns an (n, 3) array of lon, lat, intensity"""
+    return np.frombuffer(payload, dtype=POINT_DTYPE).reshape(-1, POINT_FIELDS)
+
+
+def tile_cache_key(version, layer, z, x, y):
+    return f"map:heatmap-tile:{version}:{layer}:{z}:{x}:{y}"
+
+
+def get_tile(z, x, y, layer):
+    """
+    Get the packed points of a tile, from the cache when possible
+
+    Returns:
+        tuple: (payload bytes, dataset version the payload was built from)
+    """
+    version = get_dataset_version()
+    key = tile_cache_key(version, layer, z, x, y)
+
+    payload = cache.get(key)
+    if payload is None:
+        payload = pack_points(fetch_tile_points(z, x, y, layer))
+        cache.set(key, payload, TILE_CACHE_TIMEOUT)
+
+    return payload, version
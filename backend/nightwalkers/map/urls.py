@@ -8,6 +8,7 @@ from .views import (
     HeatmapDataView,
     PrimaryHeatmapDataView,
     SecondaryHeatmapDataView,
+    HeatmapTileView,
     IssueOnLocationReportListView,
     CreateIssueOnLocationReportView,
     DeleteIssueOnLocationReportView,
@@ -27,6 +28,11 @@ urlpatterns = [
         SecondaryHeatmapDataView.as_view(),
         name="secondary-heatmap",
     ),
+    path(
+        "map/heatmap-tiles/<int:z>/<int:x>/<int:y>/",
+        HeatmapTileView.as_view(),
+        name="heatmap-tile",
+    ),
     path("get-route/", RouteViewAPI.as_view(), name="get-route"),
     path("save-route/", SaveRouteAPIView.as_view(), name="save-route"),
     path(
@@ -1,4 +1,3 @@
-import os
 from rest_framework import generics, status, filters
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
@@ -15,150 +14,147 @@ from .serializers import (
 import requests
 from django.db import connection
 import polyline
+import shapely
 from shapely import geometry
-from shapely.geometry import Point, MultiPolygon
-from shapely.ops import transform
-import pyproj
+from shapely.geometry import LineString, MultiPolygon
 import json
+import time
 import uuid
 import traceback
-from django.http import JsonResponse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.http import parse_etags
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
+from .dataset import get_dataset_version
+from .avoid_polygons import avoid_polygon_store
+from .heatmap_snapshot import HEATMAP_FORMATS, heatmap_etag, heatmap_snapshot
+from .hotspots import hotspot_index
+from .ors import ors_client
+from .road_graph import road_graph
+from .routes_cache import ROUTE_CACHE_TIMEOUT, route_cache_key
+from .tiles import (
+    POINT_SIZE,
+    get_tile,
+    is_valid_tile,
+    parse_layer,
+)
+
+# Shared pool for the ORS requests that the routing pipeline runs concurrently
+routing_executor = ThreadPoolExecutor(
+    max_workers=settings.ROUTE_WORKERS, thread_name_prefix="routing"
+)
+# The Phase 2 requests that race the latency budget. A running request cannot
+# be cancelled, the abandoned ones keep their thread until ORS answers: they
+# get their own bounded pool so they never hold up the initial routes
+speculative_executor = ThreadPoolExecutor(
+    max_workers=settings.ROUTE_SPECULATIVE_WORKERS, thread_name_prefix="speculative"
+)
 
 
 class HeatmapDataView(generics.GenericAPIView):
+    """
+    Full heatmap layer as a JSON list (or packed float32 triples with
+    ?encoding=float32). Kept for older clients, new clients should request only
+    the visible tiles from HeatmapTileView.
+
+    Layers are served from the materialized snapshot (map.heatmap_snapshot)
+    with an ETag, clients sending it back in If-None-Match get a 304 until a
+    report changes the crime table.
+    """
+
     permission_classes = [IsAuthenticated]
 
+    def get_layer(self, request):
+        # Get the data type from query parameters (1 = primary, 2 = secondary)
+        return parse_layer(request.query_params.get("type", "1"))
+
     def get(self, request, *args, **kwargs):
         try:
-            # Get the data type from query parameters (1 = primary, 2 = secondary)
-            data_type = request.query_params.get("type", "1")
-
             # Validate data_type parameter
-            if data_type not in ["1", "2", "primary", "secondary"]:
+            layer = self.get_layer(request)
+            if layer is None:
                 return Response(
                     {"error": "Invalid type parameter"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            is_primary = data_type in ["1", "primary"]
-            operator_sql = ">=" if is_primary else "<"
-            threshold = 5
-
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    f"""SELECT ST_Y(wkb_geometry) AS latitude,
-                    ST_X(wkb_geometry) AS longitude,
-                    CMPLNT_NUM
-                    FROM filtered_grouped_data_centroid
-                    WHERE CMPLNT_NUM {operator_sql} %s;""",
-                    [threshold],
+            payload_format = request.query_params.get("encoding", "json")
+            if payload_format not in HEATMAP_FORMATS:
+                return Response(
+                    {"error": "Invalid encoding parameter"},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
 
-                heatmap_points = []
-                for row in cursor.fetchall():
-                    latitude, longitude, complaints = row
-                    try:
-                        complaints = (
-                            float(complaints) if complaints is not None else 0.0
-                        )
-                    except (ValueError, TypeError):
-                        complaints = 0.0
-
-                    heatmap_points.append(
-                        {
-                            "latitude": latitude,
-                            "longitude": longitude,
-                            "intensity": complaints,
-                        }
-                    )
-
-            return Response(heatmap_points)
+            # Answer revalidations from the version alone, no payload needed
+            etag = heatmap_etag(get_dataset_version(), layer, payload_format)
+            etags = parse_etags(request.headers.get("If-None-Match", ""))
+            if "*" in etags or etag in [tag.removeprefix("W/") for tag in etags]:
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+                response["ETag"] = etag
+                return response
+
+            payload, version = heatmap_snapshot.get_payload(layer, payload_format)
+            response = HttpResponse(
+                payload, content_type=HEATMAP_FORMATS[payload_format]
+            )
+            response["ETag"] = heatmap_etag(version, layer, payload_format)
+            response["X-Dataset-Version"] = str(version)
+            return response
 
         except Exception as error:
             print("Error while fetching data from PostgreSQL: %s", error)
             return Response([], status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PrimaryHeatmapDataView(generics.GenericAPIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request, *args, **kwargs):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    """SELECT ST_Y(wkb_geometry) AS latitude,
-                    ST_X(wkb_geometry) AS longitude,
-                    CMPLNT_NUM
-                    FROM filtered_grouped_data_centroid
-                    WHERE CMPLNT_NUM >= %s;""",
-                    [5],
-                )
+class PrimaryHeatmapDataView(HeatmapDataView):
+    def get_layer(self, request):
+        return "primary"
 
-                heatmap_points = []
-                for row in cursor.fetchall():
-                    latitude, longitude, complaints = row
-                    try:
-                        complaints = (
-                            float(complaints) if complaints is not None else 0.0
-                        )
-                    except (ValueError, TypeError):
-                        complaints = 0.0
-
-                    heatmap_points.append(
-                        {
-                            "latitude": latitude,
-                            "longitude": longitude,
-                            "intensity": complaints,
-                        }
-                    )
 
-            return Response(heatmap_points)
+class SecondaryHeatmapDataView(HeatmapDataView):
+    def get_layer(self, request):
+        return "secondary"
 
-        except Exception as error:
-            print("Error while fetching data from PostgreSQL: %s", error)
-            return Response([], status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class HeatmapTileView(generics.GenericAPIView):
+    """
+    One slippy-map tile of the heatmap as packed float32 triples
+    (longitude, latitude, intensity), see map.tiles.pack_points.
+    Tiles are cached per dataset version, so repeat views never hit the db.
+    """
 
-class SecondaryHeatmapDataView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, *args, **kwargs):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    """SELECT ST_Y(wkb_geometry) AS latitude,
-                    ST_X(wkb_geometry) AS longitude,
-                    CMPLNT_NUM
-                    FROM filtered_grouped_data_centroid
-                    WHERE CMPLNT_NUM < %s;""",
-                    [5],
-                )
-
-                heatmap_points = []
-                for row in cursor.fetchall():
-                    latitude, longitude, complaints = row
-                    try:
-                        complaints = (
-                            float(complaints) if complaints is not None else 0.0
-                        )
-                    except (ValueError, TypeError):
-                        complaints = 0.0
-
-                    heatmap_points.append(
-                        {
-                            "latitude": latitude,
-                            "longitude": longitude,
-                            "intensity": complaints,
-                        }
-                    )
+    def get(self, request, z, x, y, *args, **kwargs):
+        layer = parse_layer(request.query_params.get("type", "1"))
+        if layer is None:
+            return Response(
+                {"error": "Invalid type parameter"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            return Response(heatmap_points)
+        if not is_valid_tile(z, x, y):
+            return Response(
+                {"error": "Invalid tile coordinates"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        try:
+            payload, version = get_tile(z, x, y, layer)
         except Exception as error:
-            print("Error while fetching data from PostgreSQL: %s", error)
-            return Response([], status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            print(f"Error while building heatmap tile {z}/{x}/{y}: {error}")
+            return Response(
+                {"error": "Could not load heatmap tile"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        response = HttpResponse(payload, content_type="application/octet-stream")
+        response["X-Dataset-Version"] = str(version)
+        response["X-Point-Count"] = str(len(payload) // POINT_SIZE)
+        return response
 
 
 class SaveRouteAPIView(generics.GenericAPIView):
@@ -234,12 +230,40 @@ class RouteViewAPI(generics.GenericAPIView):
         departure = [departure_lon, departure_lat]
         destination = [destination_lon, destination_lat]
 
-        initial_route = self.get_initial_route(departure, destination)
+        # Same commute, same crime data: skip ORS and the hotspot pipeline
+        version = get_dataset_version()
+        cache_key = route_cache_key(version, departure, destination)
+        cached_routes = cache.get(cache_key)
+        if cached_routes is not None:
+            return Response(cached_routes, status=status.HTTP_200_OK)
+
+        # Route in-process when the local road graph covers the trip
+        local_routes = road_graph.route(departure, destination, version)
+        if local_routes is not None:
+            cache.set(cache_key, local_routes, ROUTE_CACHE_TIMEOUT)
+            return Response(local_routes, status=status.HTTP_200_OK)
+
+        # Refresh the hotspot index while ORS computes the initial route
+        initial_future = routing_executor.submit(
+            self.get_initial_route, departure, destination
+        )
+        try:
+            hotspot_index.ensure_fresh()
+        except Exception as e:
+            print(f"Could not refresh the crime hotspot index: {str(e)}")
+        initial_route = initial_future.result()
         if "error" in initial_route:
             return Response(initial_route, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         try:
             safer_route = process_route_with_crime_data(initial_route)
 
+            if "error" not in safer_route:
+                cache.set(
+                    cache_key,
+                    {"initial_route": initial_route, "safer_route": safer_route},
+                    ROUTE_CACHE_TIMEOUT,
+                )
+
             return Response(
                 {
                     "initial_route": initial_route,
@@ -262,18 +286,12 @@ class RouteViewAPI(generics.GenericAPIView):
         """
         Get the route from OpenRouteService
         """
-        map_api_key = os.getenv("ORS_API_KEY")
-        map_url = "https://api.openrouteservice.org/v2/directions/foot-walking"
-        headers = {
-            "Authorization": f"{map_api_key}",
-            "Content-Type": "application/json; charset=utf-8",
-        }
         body = {
             "coordinates": [departure, destination],
             "format": "geojson",
         }
         try:
-            response = requests.post(map_url, json=body, headers=headers)
+            response = ors_client.directions(body)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -291,11 +309,18 @@ def process_route_with_crime_data(initial_route):
     4. Try to create a final safer route avoiding all identified hotspots
     5. If Phase 2 fails, return the Phase 1 route
 
+    While the Phase 1 route is computed, speculative variants avoiding more
+    of the initial route's hotspots are requested in parallel. Phase 2 returns
+    the first acceptable route (the final route, or a variant that already
+    stays clear of the Phase 2 hotspots) within ROUTE_LATENCY_BUDGET seconds.
+
     Args:
         initial_route (dict): The initial route from ORS
     Returns:
         dict: The safer route that avoids crime hotspots
     """
+    deadline = time.monotonic() + settings.ROUTE_LATENCY_BUDGET
+
     print("=== Phase 1: Processing initial route ===")
     # Extract departure and destination coordinates
     encoded_polyline = initial_route["routes"][0]["geometry"]
@@ -305,10 +330,7 @@ def process_route_with_crime_data(initial_route):
     destination = decoded_coords[-1]
 
     # Create LineString for initial route
-    linestring_coords = ", ".join(
-        [f"{coord[0]} {coord[1]}" for coord in decoded_coords]
-    )
-    initial_linestring = f"LINESTRING({linestring_coords})"
+    initial_linestring = LineString(decoded_coords)
 
     # Phase 1: Get the first set of crime hotspots along the initial route
     phase1_hotspots = get_crime_hotspots(initial_linestring, limit=7)
@@ -317,12 +339,28 @@ def process_route_with_crime_data(initial_route):
     # Create avoidance polygons for phase 1 hotspots
     phase1_polygons = create_avoid_polygons(phase1_hotspots)
 
+    # Speculative Phase 2: avoid more hotspots of the initial route right away
+    variants = {}
+    for limit in settings.ROUTE_SPECULATIVE_HOTSPOT_LIMITS:
+        variant_hotspots = get_crime_hotspots(initial_linestring, limit=limit)
+        if len(variant_hotspots) <= len(phase1_hotspots):
+            continue
+        future = speculative_executor.submit(
+            get_safer_ors_route,
+            departure,
+            destination,
+            create_avoid_polygons(variant_hotspots),
+        )
+        variants[future] = variant_hotspots
+
     # Get intermediate safer route avoiding phase 1 hotspots
     intermediate_route = get_safer_ors_route(departure, destination, phase1_polygons)
 
     # Check if we got a valid intermediate route
     if "error" in intermediate_route:
         print(f"Error in intermediate route: {intermediate_route['error']}")
+        for future in variants:
+            future.cancel()
         return intermediate_route
 
     # Successfully got an intermediate route, store it as a potential fallback
@@ -340,10 +378,7 @@ def process_route_with_crime_data(initial_route):
     intermediate_coords = polyline.decode(intermediate_polyline, geojson=True)
 
     # Create LineString for intermediate route
-    intermediate_linestring_coords = ", ".join(
-        [f"{coord[0]} {coord[1]}" for coord in intermediate_coords]
-    )
-    intermediate_linestring = f"LINESTRING({intermediate_linestring_coords})"
+    intermediate_linestring = LineString(intermediate_coords)
 
     # Phase 2: Get additional crime hotspots along the intermediate route
     phase2_hotspots = get_additional_hotspots(
@@ -357,12 +392,59 @@ def process_route_with_crime_data(initial_route):
 
     # Create final avoidance polygons
     final_polygons = create_avoid_polygons(all_hotspots)
+    phase2_polygons = create_avoid_polygons(phase2_hotspots)
 
-    # Attempt to get final safer route avoiding all hotspots
-    final_route = get_safer_ors_route(departure, destination, final_polygons)
+    # Attempt to get final safer route avoiding all hotspots, racing the
+    # speculative variants that are still running
+    final_future = speculative_executor.submit(
+        get_safer_ors_route, departure, destination, final_polygons
+    )
+    pending = set(variants) | {final_future}
+    final_route = None
+
+    while pending:
+        done, pending = wait(
+            pending,
+            timeout=max(0, deadline - time.monotonic()),
+            return_when=FIRST_COMPLETED,
+        )
+        if not done:
+            print("Phase 2 route exceeded the latency budget")
+            break
+
+        for future in done:
+            try:
+                route = future.result()
+            except Exception as e:
+                print(f"Phase 2 request failed: {str(e)}")
+                continue
+            if "error" in route or not route:
+                continue
+
+            if future is final_future:
+                final_route = route
+                avoided_hotspots = len(all_hotspots)
+            elif is_route_clear_of(route, phase2_polygons):
+                print("Speculative route already avoids the Phase 2 hotspots")
+                final_route = route
+                avoided_hotspots = len(
+                    {
+                        (hotspot["latitude"], hotspot["longitude"])
+                        for hotspot in variants[future] + phase2_hotspots
+                    }
+                )
+            else:
+                continue
+            break
+
+        if final_route is not None:
+            break
+
+    for future in pending:
+        future.cancel()
 
     # If Phase 2 route generation failed, return the Phase 1 route instead
-    if "error" in final_route or not final_route:
+    if final_route is None:
         print("Phase 2 route failed, falling back to Phase 1 route")
         return phase1_route
 
@@ -370,66 +452,63 @@ def process_route_with_crime_data(initial_route):
     if "metadata" not in final_route:
         final_route["metadata"] = {}
     final_route["metadata"]["phase"] = "Phase 2"
-    final_route["metadata"]["avoided_hotspots"] = len(all_hotspots)
+    final_route["metadata"]["avoided_hotspots"] = avoided_hotspots
 
     return final_route
 
 
+def is_route_clear_of(route, avoid_polygons):
+    """
+    Check that an ORS route does not cross any of the avoidance polygons
+
+    Args:
+        route (dict): OpenRouteService Directions API response
+        avoid_polygons (MultiPolygon): Areas to avoid, None if there are none
+    """
+    if avoid_polygons is None:
+        return True
+    try:
+        coords = polyline.decode(route["routes"][0]["geometry"], geojson=True)
+        return not LineString(coords).intersects(avoid_polygons)
+    except Exception as e:
+        print(f"Could not check speculative route: {str(e)}")
+        return False
+
+
 def get_crime_hotspots(linestring, limit=10):
     """
-    Query the database to find crime hotspots near a route,
+    Find crime hotspots near a route using the in-memory hotspot index,
     prioritizing both crime severity and proximity
 
     Args:
-        linestring (str): WKT format linestring of the route
+        linestring (LineString or str): Route geometry, or its WKT
         limit (int): Maximum number of hotspots to return
 
     Returns:
         list: List of hotspot dictionaries
     """
-    query = """
-            SELECT
-                ST_Y(wkb_geometry) AS latitude,
-                ST_X(wkb_geometry) AS longitude,
-                CMPLNT_NUM,
-                ST_Distance(wkb_geometry, ST_GeomFromText(%s, 4326)) AS distance
-            FROM filtered_grouped_data_centroid
-            WHERE CMPLNT_NUM >= 5
-            ORDER BY
-                -- Balance between proximity and crime intensity
-                (
-                    CMPLNT_NUM * 0.7
-                ) / (
-                    POWER(
-                        ST_Distance(wkb_geometry, ST_GeomFromText(%s, 4326)) + 0.001,
-                        1.5
-                    )
-                ) DESC
-            LIMIT %s;
-        """
-
     hotspots = []
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(query, [linestring, linestring, limit])
-            for row in cursor.fetchall():
-                latitude, longitude, complaints, distance = row
-                complaints = float(complaints) if complaints is not None else 0.0
-                hotspots.append(
-                    {
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "complaints": complaints,
-                        "distance": distance,
-                    }
-                )
-                print(f"Hotspot with {complaints} complaints at distance {distance}")
+        hotspot_index.ensure_fresh()
+        hotspots = hotspot_index.query(_as_geometry(linestring), limit=limit)
+        for hotspot in hotspots:
+            print(
+                f"Hotspot with {hotspot['complaints']} complaints "
+                f"at distance {hotspot['distance']}"
+            )
     except Exception as e:
-        print(f"Error querying the database: {str(e)}")
+        print(f"Error querying the hotspot index: {str(e)}")
 
     return hotspots
 
 
+def _as_geometry(linestring):
+    """Accept both shapely geometries and WKT strings for route lines"""
+    if isinstance(linestring, str):
+        return shapely.from_wkt(linestring)
+    return linestring
+
+
 def create_avoid_polygons(hotspots, base_radius=0.10):
     """
     Create Shapely Polygons around crime hotspots using proper buffering
@@ -442,40 +521,8 @@ def create_avoid_polygons(hotspots, base_radius=0.10):
     Returns:
         MultiPolygon: Shapely MultiPolygon of areas to avoid
     """
-    polygon_list = []
-
-    # Define projections for NYC area
-    wgs84 = pyproj.CRS("EPSG:4326")  # WGS84 coordinate system
-    utm = pyproj.CRS("EPSG:26918")  # UTM zone 18N (appropriate for NYC)
-
-    # Define transformations
-    project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-    project_back = pyproj.Transformer.from_crs(utm, wgs84, always_xy=True).transform
-
-    # NYC-specific radius settings
-    min_radius = 0.08  # 80 meters (approximately one short NYC block)
-    max_radius = 0.20  # 200 meters (less than one long NYC block)
-
-    # NYC avg block dimensions: short side ~80m, long side ~270m
-
-    for i, hotspot in enumerate(hotspots):
-        # Scale radius based on complaints with NYC-calibrated formula
-        # More gradual scaling that caps at a reasonable maximum
-        complaint_factor = min(1.0, hotspot["complaints"] / 100)
-        scaled_radius = min_radius + (max_radius - min_radius) * complaint_factor
-
-        # Create point in WGS84
-        point = Point(hotspot["longitude"], hotspot["latitude"])
-
-        # Transform point to UTM, buffer, then transform back to WGS84
-        point_utm = transform(project, point)
-        buffer_utm = point_utm.buffer(scaled_radius * 1000)  # buffer in meters
-        buffer_wgs84 = transform(project_back, buffer_utm)
-
-        # Simplify to reduce complexity (helps with API request size)
-        # Increased simplification tolerance slightly for NYC's dense geometry
-        simplified = buffer_wgs84.simplify(0.0002)
-        polygon_list.append(simplified)
+    # Polygons are built once per hotspot and reused across requests
+    polygon_list = avoid_polygon_store.get_many(hotspots)
 
     # Create MultiPolygon from all polygons
     if polygon_list:
@@ -490,11 +537,11 @@ def get_additional_hotspots(
     linestring, existing_hotspots, limit=10, min_distance=0.005
 ):
     """
-    Query the database to find additional crime hotspots near a route,
+    Find additional crime hotspots near a route,
     excluding hotspots that are too close to existing ones
 
     Args:
-        linestring (str): WKT format linestring of the route
+        linestring (LineString or str): Route geometry, or its WKT
         existing_hotspots (list): List of hotspots already identified
         limit (int): Maximum number of additional hotspots to return
         min_distance (float): Minimum distance from existing hotspots in degrees
@@ -502,62 +549,15 @@ def get_additional_hotspots(
     Returns:
         list: List of additional hotspot dictionaries
     """
-    # Create exclusion conditions for existing hotspots
-    exclusion_conditions = []
-    for hotspot in existing_hotspots:
-        # Convert to postgis ST_DWithin
-        lat, lon = hotspot["latitude"], hotspot["longitude"]
-        condition = (
-            "ST_DWithin("
-            f"wkb_geometry, "
-            f"ST_SetSRID(ST_MakePoint({lon}, {lat}), 4326), "
-            f"{min_distance}"
-            ")"
-        )
-        exclusion_conditions.append(condition)
-
-    # Build the WHERE clause
-    where_clause = "CMPLNT_NUM >= 5"
-    if exclusion_conditions:
-        where_clause += " AND NOT (" + " OR ".join(exclusion_conditions) + ")"
-
-    query = f"""
-        SELECT
-            ST_Y(wkb_geometry) AS latitude,
-            ST_X(wkb_geometry) AS longitude,
-            CMPLNT_NUM,
-            ST_Distance(wkb_geometry, ST_GeomFromText(%s, 4326)) AS distance
-        FROM filtered_grouped_data_centroid
-        WHERE {where_clause}
-        ORDER BY
-            -- Balance between proximity and crime intensity
-            (
-                CMPLNT_NUM * 0.7
-            ) / (
-                POWER(
-                    ST_Distance(wkb_geometry, ST_GeomFromText(%s, 4326)) + 0.001,
-                    1.5
-                )
-            ) DESC
-        LIMIT %s;
-    """
-
     hotspots = []
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(query, [linestring, linestring, limit])
-            for row in cursor.fetchall():
-                latitude, longitude, complaints, distance = row
-                complaints = float(complaints) if complaints is not None else 0.0
-                hotspots.append(
-                    {
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "complaints": complaints,
-                        "distance": distance,
-                    }
-                )
-
+        hotspot_index.ensure_fresh()
+        hotspots = hotspot_index.query(
+            _as_geometry(linestring),
+            limit=limit,
+            exclude=existing_hotspots,
+            min_distance=min_distance,
+        )
     except Exception as e:
         print(f"Error querying additional hotspots: {str(e)}")
 
@@ -577,14 +577,6 @@ def get_safer_ors_route(departure, destination, avoid_polygons):
     Returns:
         dict: The OpenRouteService Directions API response or error
     """
-    map_api_key = os.getenv("ORS_API_KEY")
-    map_url = "https://api.openrouteservice.org/v2/directions/foot-walking"
-
-    headers = {
-        "Authorization": f"{map_api_key}",
-        "Content-Type": "application/json; charset=utf-8",
-    }
-
     # Base request parameters
     body = {
         "coordinates": [departure, destination],
@@ -632,7 +624,7 @@ def get_safer_ors_route(departure, destination, avoid_polygons):
 
     try:
         # Send the request
-        response = requests.post(map_url, json=body, headers=headers)
+        response = ors_client.directions(body)
 
         # Log response basics
         print(f"ORS API Response: Status {response.status_code}")
@@ -757,6 +749,12 @@ def process_approved_report(request):
             print(f"Found nearby point with ID {nearby_point['id']}")
             # Update existing point (increment complaint count)
             result = _update_complaint_count(nearby_point["id"])
+            heatmap_snapshot.record_point(
+                nearby_point["id"],
+                nearby_point["latitude"],
+                nearby_point["longitude"],
+                result["new_count"],
+            )
             print(
                 f"Updated point {nearby_point['id']} ",
                 f"to complaint count: {result['new_count']}",
@@ -778,6 +776,9 @@ def process_approved_report(request):
             print("No nearby point found, creating new point")
             # Create new point in the filtered_grouped_data_centroid table
             new_point = _create_new_point(report)
+            heatmap_snapshot.record_point(
+                new_point["id"], report.latitude, report.longitude, 1
+            )
             print(f"Created new point with ID: {new_point['id']}")
 
             # Store the heatmap point ID in the report
@@ -846,13 +847,22 @@ def revoke_report_approval(request):
                     WHERE ogc_fid =
                     %s
                     RETURNING
-                    cmplnt_num;
+                    cmplnt_num,
+                    ST_Y(wkb_geometry),
+                    ST_X(wkb_geometry);
                     """,
                     [heatmap_point_id],
                 )
                 result = cursor.fetchone()
                 new_count = result[0] if result else None
 
+            # Heatmap tiles built on the old counts are stale now, a point
+            # reaching 0 is deleted below and leaves the heatmap right away
+            if result:
+                heatmap_snapshot.record_point(
+                    heatmap_point_id, result[1], result[2], new_count
+                )
+
             # If the complaint count is now 0, delete the point
             if new_count == 0:
                 with connection.cursor() as cursor:
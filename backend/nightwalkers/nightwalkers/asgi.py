@@ -13,6 +13,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nightwalkers.settings")
 django_asgi_app = get_asgi_application()
 # django.setup()  # This is crucial!
 
+# Load the crime hotspot index before the first route request comes in
+from map.hotspots import hotspot_index  # noqa: E402
+
+hotspot_index.warm_up()
+
 # Ensure settings are configured before proceeding
 
 
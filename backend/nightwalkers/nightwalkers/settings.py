@@ -49,6 +49,8 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 CORS_ORIGIN_ALLOW_ALL = True
+# Let the map client read the heatmap metadata
+CORS_EXPOSE_HEADERS = ["ETag", "X-Dataset-Version", "X-Point-Count"]
 # Proxy
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 CSRF_TRUSTED_ORIGINS = [
@@ -140,16 +142,40 @@ TEMPLATES = [
 # initially we used wsgi, switch to asgi for websockets
 # WSGI_APPLICATION = "nightwalkers.wsgi.application"
 ASGI_APPLICATION = "nightwalkers.asgi.application"
-# CHANNEL_LAYERS = {
-#     "default": {
-#         "BACKEND": "channels_redis.core.RedisChannelLayer",
-#         "CONFIG": {
-#             "hosts": [("127.0.0.1", 6379)],
-#         },
-#     }
-# }
+# Chat messages and statuses cross Daphne workers through redis when
+# REDIS_URL is set, the in memory layer only reaches sockets of this process
+if os.getenv("REDIS_URL"):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [os.getenv("REDIS_URL")]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+# Cache (heatmap tiles, dataset version counter)
+# Use redis when REDIS_URL is set so every worker sees the same dataset version
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Forum home timelines (forum/timeline.py), kept in process memory otherwise
+FORUM_TIMELINE_REDIS_URL = os.getenv("REDIS_URL")
+# Chat presence (chat/presence.py), kept in process memory otherwise
+CHAT_PRESENCE_REDIS_URL = os.getenv("REDIS_URL")
 
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
@@ -245,6 +271,27 @@ SIMPLE_JWT = {
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
+# OpenRouteService (point ORS_BASE_URL at map/ors_stub.py to work offline)
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
+ORS_TIMEOUT = float(os.getenv("ORS_TIMEOUT", "10"))
+
+# Safer route pipeline: threads for concurrent ORS calls, time allowed for
+# Phase 2 and hotspot counts of the speculative Phase 2 variants
+ROUTE_WORKERS = int(os.getenv("ROUTE_WORKERS", "16"))
+# Phase 2 requests that may outlive their route request (see map/views.py)
+ROUTE_SPECULATIVE_WORKERS = int(os.getenv("ROUTE_SPECULATIVE_WORKERS", "8"))
+ROUTE_LATENCY_BUDGET = float(os.getenv("ROUTE_LATENCY_BUDGET", "3"))
+ROUTE_SPECULATIVE_HOTSPOT_LIMITS = [10, 14]
+# One kept-alive ORS connection per routing thread, callers beyond the pool
+# wait for a free connection instead of opening throwaway ones
+ORS_POOL_SIZE = int(
+    os.getenv("ORS_POOL_SIZE", ROUTE_WORKERS + ROUTE_SPECULATIVE_WORKERS)
+)
+
+# Local road graph built by `manage.py build_road_graph`, ORS is only used
+# when it is missing or does not cover a trip
+ROAD_GRAPH_DIR = os.getenv("ROAD_GRAPH_DIR", os.path.join(BASE_DIR, "road_graph"))
+
 
 # Add this at the bottom
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
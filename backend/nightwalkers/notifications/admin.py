@@ -1,3 +1,13 @@
-# from django.contrib import admin
+from django.contrib import admin
+from .models import OutboxNotification
 
-# # Register your models here.
+
+class OutboxNotificationAdmin(admin.ModelAdmin):
+    list_display = ("title", "user", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("title", "user__email")
+    raw_id_fields = ("user",)
+    readonly_fields = ("attempts", "last_error", "created_at", "sent_at")
+
+
+admin.site.register(OutboxNotification, OutboxNotificationAdmin)
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from notifications.outbox import drain, run_worker
+from notifications.transports import FCM_BATCH_LIMIT, FakeTransport, FCMTransport
+
+
+class Command(BaseCommand):
+    help = "Send the queued push notifications to FCM in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is due now and exit instead of polling",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of threads sending batches in parallel",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=FCM_BATCH_LIMIT,
+            help=f"Notifications per FCM call (at most {FCM_BATCH_LIMIT})",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--fake",
+            action="store_true",
+            help="Record the messages instead of sending them (local runs)",
+        )
+
+    def handle(self, *args, **options):
+        transport = FakeTransport() if options["fake"] else FCMTransport()
+        limit = options["batch_size"]
+
+        if options["once"]:
+            totals = drain(transport, limit)
+            sent = ", ".join(f"{count} {status}" for status, count in totals.items())
+            self.stdout.write(f"Notifications: {sent or 'none due'}")
+            return
+
+        stop = threading.Event()
+        self.stdout.write(
+            f"Dispatching notifications with {options['workers']} worker(s)"
+        )
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            workers = [
+                pool.submit(
+                    run_worker, transport, limit, options["poll_interval"], stop
+                )
+                for _ in range(options["workers"])
+            ]
+            try:
+                for worker in workers:
+                    worker.result()
+            except KeyboardInterrupt:
+                stop.set()
@@ -1,3 +1,52 @@
-# from django.db import models
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
 
-# # Create your models here.
+
+class OutboxNotification(models.Model):
+    """
+    A push notification waiting to be sent, or the record of its delivery
+
+    Views only insert these rows, the dispatch_notifications worker sends
+    them to FCM in batches (see notifications/outbox.py).
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+        (SKIPPED, "Skipped (no device token)"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="outbox_notifications",
+    )
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            # The worker's queue: pending rows by due time
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="pending"),
+                name="notifications_due_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.title} to {self.user} ({self.status})"
@@ -0,0 +1,155 @@
+"""
+Notification outbox
+
+Requests never talk to Firebase: enqueue_notification() inserts an
+OutboxNotification row, in the same transaction as the write that caused
+it. The dispatch_notifications worker claims due rows in batches
+(SELECT ... FOR UPDATE SKIP LOCKED, so several workers never share a row),
+sends each batch with one transport call and records the outcome of every
+row. Failed deliveries are retried with exponential backoff until
+MAX_ATTEMPTS, dead tokens are cleared from their user.
+"""
+
+import random
+import threading
+from collections import Counter
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxNotification
+from .transports import RETRY, SENT, UNREGISTERED
+
+User = get_user_model()
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30  # seconds, doubled after every failed attempt
+RETRY_MAX_DELAY = 3600
+# A claimed row is due again after this long, should its worker die mid-send
+CLAIM_TIMEOUT = 300
+
+
+def enqueue_notification(user_id, title, body, data=None):
+    """Queue a push notification to a user, the worker sends it"""
+    return OutboxNotification.objects.create(
+        user_id=user_id, title=title, body=body, data=data or {}
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt number attempts + 1, with jitter"""
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    # Spread the retries of a failed batch so they do not come back together
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_batch(limit):
+    """
+    Take up to limit due notifications, with their user's current token
+
+    Claiming counts the attempt and pushes next_attempt_at past
+    CLAIM_TIMEOUT, the other workers skip the rows meanwhile.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboxNotification.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(status=OutboxNotification.PENDING, next_attempt_at__lte=now)
+            .annotate(token=F("user__fcm_token"))
+            .order_by("next_attempt_at", "id")[:limit]
+        )
+        if rows:
+            OutboxNotification.objects.filter(pk__in=[row.pk for row in rows]).update(
+                attempts=F("attempts") + 1,
+                next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT),
+            )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def dispatch_batch(transport, limit=None):
+    """
+    Send one batch of due notifications
+
+    Returns:
+        Counter: Number of notifications by status they ended up in,
+        empty if nothing was due
+    """
+    rows = claim_batch(min(limit or transport.batch_limit, transport.batch_limit))
+    if not rows:
+        return Counter()
+
+    deliverable = [row for row in rows if row.token]
+    results = []
+    if deliverable:
+        try:
+            results = transport.send(
+                [
+                    {
+                        "token": row.token,
+                        "title": row.title,
+                        "body": row.body,
+                        "data": row.data,
+                    }
+                    for row in deliverable
+                ]
+            )
+        except Exception as e:
+            results = [(RETRY, str(e))] * len(deliverable)
+
+    now = timezone.now()
+    dead_tokens = []
+    for row in rows:
+        row.status = OutboxNotification.SKIPPED
+        row.last_error = "User has no device token"
+    for row, (outcome, error) in zip(deliverable, results):
+        row.last_error = error
+        if outcome == SENT:
+            row.status = OutboxNotification.SENT
+            row.sent_at = now
+        elif outcome == RETRY and row.attempts < MAX_ATTEMPTS:
+            row.status = OutboxNotification.PENDING
+            row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+        else:
+            row.status = OutboxNotification.FAILED
+            if outcome == UNREGISTERED:
+                dead_tokens.append(row.token)
+
+    with transaction.atomic():
+        OutboxNotification.objects.bulk_update(
+            rows, ["status", "last_error", "sent_at", "next_attempt_at"]
+        )
+        if dead_tokens:
+            # Only while the user has not registered a new token since
+            User.objects.filter(fcm_token__in=dead_tokens).update(fcm_token=None)
+    return Counter(row.status for row in rows)
+
+
+def drain(transport, limit=None, stop=None):
+    """
+    Dispatch batches until nothing is due
+
+    Returns:
+        Counter: Number of notifications by final status
+    """
+    totals = Counter()
+    while stop is None or not stop.is_set():
+        counts = dispatch_batch(transport, limit)
+        if not counts:
+            break
+        totals += counts
+    return totals
+
+
+def run_worker(transport, limit=None, poll_interval=2.0, stop=None):
+    """Dispatch notifications as they become due until stop is set"""
+    stop = stop or threading.Event()
+    try:
+        while not stop.is_set():
+            drain(transport, limit, stop)
+            stop.wait(poll_interval)
+    finally:
+        # Worker threads own their connections
+        connections.close_all()
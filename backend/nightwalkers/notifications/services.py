@@ -33,6 +33,14 @@ with open(CREDS_PATH, "w") as f:
 FIREBASE_CREDENTIALS_PATH = CREDS_PATH
 
 
+def initialize_firebase():
+    if not firebase_admin._apps:
+        cred = firebase_admin.credentials.Certificate(
+            settings.FIREBASE_CREDENTIALS_PATH
+        )
+        firebase_admin.initialize_app(cred)
+
+
 class NotificationService:
     _initialized = False
 
@@ -41,11 +49,7 @@ class NotificationService:
             self._initialize()
 
     def _initialize(self):
-        if not firebase_admin._apps:
-            cred = firebase_admin.credentials.Certificate(
-                settings.FIREBASE_CREDENTIALS_PATH
-            )
-            firebase_admin.initialize_app(cred)
+        initialize_firebase()
         self.User = None  # Will be loaded lazily
         self._initialized = True
 
@@ -1,3 +1,197 @@
-# from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from forum.models import Post
+from .models import OutboxNotification
+from .outbox import MAX_ATTEMPTS, dispatch_batch, drain, enqueue_notification
+from .transports import REJECTED, RETRY, UNREGISTERED, FakeTransport
+import json
 
-# # Create your tests here.
+User = get_user_model()
+
+
+class OutboxDispatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+            fcm_token="token-1",
+        )
+        self.transport = FakeTransport()
+
+    def make_due(self):
+        OutboxNotification.objects.update(next_attempt_at=timezone.now())
+
+    def test_sent(self):
+        notification = enqueue_notification(
+            self.user.id, "Hello", "World", {"type": "follow"}
+        )
+        counts = dispatch_batch(self.transport)
+        self.assertEqual(counts["sent"], 1)
+        self.assertEqual(
+            self.transport.sent,
+            [
+                {
+                    "token": "token-1",
+                    "title": "Hello",
+                    "body": "World",
+                    "data": {"type": "follow"},
+                }
+            ],
+        )
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.SENT)
+        self.assertEqual(notification.attempts, 1)
+        self.assertIsNotNone(notification.sent_at)
+        # Nothing left
+        self.assertEqual(dispatch_batch(self.transport), {})
+
+    def test_batches(self):
+        for i in range(7):
+            enqueue_notification(self.user.id, f"Hello {i}", "World")
+        self.transport.batch_limit = 3
+        totals = drain(self.transport)
+        self.assertEqual(totals["sent"], 7)
+        self.assertEqual([len(batch) for batch in self.transport.batches], [3, 3, 1])
+
+    def test_no_token_skipped(self):
+        self.user.fcm_token = None
+        self.user.save(update_fields=["fcm_token"])
+        notification = enqueue_notification(self.user.id, "Hello", "World")
+        dispatch_batch(self.transport)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.SKIPPED)
+        self.assertEqual(self.transport.batches, [])
+
+    def test_retry_with_backoff(self):
+        notification = enqueue_notification(self.user.id, "Hello", "World")
+        self.transport.error = ConnectionError("FCM down")
+        dispatch_batch(self.transport)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.PENDING)
+        self.assertEqual(notification.last_error, "FCM down")
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(dispatch_batch(self.transport), {})
+
+        self.transport.error = None
+        self.make_due()
+        dispatch_batch(self.transport)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.SENT)
+        self.assertEqual(notification.attempts, 2)
+
+    def test_backoff_grows(self):
+        enqueue_notification(self.user.id, "Hello", "World")
+        self.transport.outcomes = {"token-1": (RETRY, "Unavailable")}
+        delays = []
+        for _ in range(3):
+            before = timezone.now()
+            dispatch_batch(self.transport)
+            delays.append(OutboxNotification.objects.get().next_attempt_at - before)
+            self.make_due()
+        self.assertLess(delays[0], delays[2])
+
+    def test_gives_up(self):
+        notification = enqueue_notification(self.user.id, "Hello", "World")
+        self.transport.outcomes = {"token-1": (RETRY, "Unavailable")}
+        for _ in range(MAX_ATTEMPTS):
+            dispatch_batch(self.transport)
+            self.make_due()
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.FAILED)
+        self.assertEqual(len(self.transport.batches), MAX_ATTEMPTS)
+
+    def test_rejected_not_retried(self):
+        notification = enqueue_notification(self.user.id, "Hello", "World")
+        self.transport.outcomes = {"token-1": (REJECTED, "Invalid data")}
+        dispatch_batch(self.transport)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, OutboxNotification.FAILED)
+        self.assertEqual(notification.attempts, 1)
+
+    def test_unregistered_token_cleared(self):
+        other = User.objects.create_user(
+            email="other@example.com",
+            first_name="Other",
+            last_name="User",
+            password="testpass123",
+            fcm_token="token-2",
+        )
+        enqueue_notification(self.user.id, "Hello", "World")
+        enqueue_notification(other.id, "Hello", "World")
+        self.transport.outcomes = {"token-1": (UNREGISTERED, "Not registered")}
+        counts = dispatch_batch(self.transport)
+        self.assertEqual(counts, {"failed": 1, "sent": 1})
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertIsNone(self.user.fcm_token)
+        self.assertEqual(other.fcm_token, "token-2")
+
+    def test_claimed_rows_not_due(self):
+        enqueue_notification(self.user.id, "Hello", "World")
+        notification = OutboxNotification.objects.get()
+        # As if a worker had claimed it and died
+        notification.next_attempt_at = timezone.now() + timedelta(minutes=1)
+        notification.save()
+        self.assertEqual(dispatch_batch(self.transport), {})
+
+    def test_command_once(self):
+        enqueue_notification(self.user.id, "Hello", "World")
+        out = StringIO()
+        call_command("dispatch_notifications", "--once", "--fake", stdout=out)
+        self.assertIn("1 sent", out.getvalue())
+        self.assertEqual(
+            OutboxNotification.objects.get().status, OutboxNotification.SENT
+        )
+
+
+class EnqueueFromViewsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com",
+            first_name="Other",
+            last_name="User",
+            password="testpass123",
+        )
+
+    def follow(self):
+        return self.client.post(
+            reverse("follow_unfollow_user", args=[self.other.id]),
+            json.dumps({"user_id": self.user.id, "follow": True}),
+            content_type="application/json",
+        )
+
+    def test_follow_enqueues_once(self):
+        self.assertEqual(self.follow().status_code, 201)
+        self.assertEqual(self.follow().status_code, 400)
+        notification = OutboxNotification.objects.get()
+        self.assertEqual(notification.user, self.other)
+        self.assertEqual(notification.title, "New Follower")
+        self.assertEqual(notification.data["type"], "follow")
+
+    def test_report_enqueues(self):
+        post = Post.objects.create(user=self.other, title="Title", content="Text")
+        response = self.client.post(
+            reverse("report_post", args=[post.id]),
+            json.dumps(
+                {"reporting_user_id": self.user.id, "post_owner_id": self.other.id}
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        notification = OutboxNotification.objects.get()
+        self.assertEqual(notification.user, self.other)
+        self.assertEqual(notification.title, "Post Reported")
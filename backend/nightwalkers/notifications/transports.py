@@ -0,0 +1,88 @@
+"""
+Ways of delivering a batch of push messages
+
+A transport takes a list of {"token", "title", "body", "data"} dicts and
+returns one (outcome, error) pair per message, in order. An exception
+raised by send() means the whole batch failed and is retried.
+"""
+
+from firebase_admin import exceptions, messaging
+from .services import initialize_firebase
+
+# Outcomes of one message
+SENT = "sent"
+RETRY = "retry"  # FCM unavailable, quota... try again later
+UNREGISTERED = "unregistered"  # The token is dead, forget it
+REJECTED = "rejected"  # FCM refused the message, retrying will not help
+
+# Most messages a single send_each call accepts
+FCM_BATCH_LIMIT = 500
+
+
+def fcm_outcome(error):
+    if isinstance(
+        error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+    ):
+        return UNREGISTERED
+    if isinstance(error, exceptions.InvalidArgumentError):
+        return REJECTED
+    return RETRY
+
+
+class FCMTransport:
+    """Firebase Cloud Messaging, one send_each call per batch"""
+
+    batch_limit = FCM_BATCH_LIMIT
+
+    def __init__(self):
+        initialize_firebase()
+
+    def send(self, messages):
+        response = messaging.send_each(
+            [
+                messaging.Message(
+                    notification=messaging.Notification(
+                        title=message["title"], body=message["body"]
+                    ),
+                    # FCM data values must be strings
+                    data={key: str(value) for key, value in message["data"].items()},
+                    token=message["token"],
+                )
+                for message in messages
+            ]
+        )
+        return [
+            (
+                (SENT, "")
+                if result.success
+                else (fcm_outcome(result.exception), str(result.exception))
+            )
+            for result in response.responses
+        ]
+
+
+class FakeTransport:
+    """
+    Records the batches instead of sending them, for tests and local runs
+
+    Args:
+        outcomes (dict): (outcome, error) to answer by token, SENT otherwise
+        error (Exception): Raised by every send() while set
+    """
+
+    batch_limit = FCM_BATCH_LIMIT
+
+    def __init__(self, outcomes=None, error=None):
+        self.outcomes = outcomes or {}
+        self.error = error
+        self.batches = []
+
+    @property
+    def sent(self):
+        return [message for batch in self.batches for message in batch]
+
+    def send(self, messages):
+        self.batches.append(list(messages))
+        if self.error is not None:
+            raise self.error
+        return [self.outcomes.get(message["token"], (SENT, "")) for message in messages]
@@ -12,6 +12,7 @@ export default function useForum(settingsType) {
   const [userSideCardData, setUserSideCardData] = useState(null);
   const [userPosts, setUserPosts] = useState([]);
   const [offset, setOffset] = useState(0); // Track the current offset
+  const [nextCursor, setNextCursor] = useState(null); // Position after the last post
   const [hasMore, setHasMore] = useState(true); // Track if there are more posts to fetch
   const loaderRef = useRef(null);
   const limit = 10; // Number of posts to fetch per request
@@ -45,6 +46,7 @@ export default function useForum(settingsType) {
         if (response) {
           setUserPosts(response?.posts || []); // Set initial posts
           setHasMore(response?.has_more); // Update hasMore based on the response
+          setNextCursor(response?.next_cursor || null);
         }
       } catch (error) {
         showSuccess("Trending posts.");
@@ -63,13 +65,18 @@ export default function useForum(settingsType) {
     try {
       setIsLoadingMore(true);
       const newOffset = offset + limit;
+      // The cursor keeps deep pages as fast as the first one
+      const position = nextCursor
+        ? `cursor=${encodeURIComponent(nextCursor)}`
+        : `offset=${newOffset}`;
       const response = await apiGet(
-        `/forum/posts?user_id=${user?.id}&offset=${newOffset}&limit=${limit}&settings_type=${settingsType}` // Pass settingsType to the API
+        `/forum/posts?user_id=${user?.id}&${position}&limit=${limit}&settings_type=${settingsType}` // Pass settingsType to the API
       );
       if (response) {
         setUserPosts((prevPosts) => [...prevPosts, ...response?.posts]); // Append new posts
         setHasMore(response.has_more); // Update hasMore based on the response
         setOffset(newOffset); // Update the offset
+        setNextCursor(response.next_cursor || null);
       }
     } catch (error) {
       // showError("Error fetching more posts");
@@ -78,7 +85,7 @@ export default function useForum(settingsType) {
       setIsLoadingMore(false);
     }
     //eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [hasMore, isLoadingMore]);
+  }, [hasMore, isLoadingMore, nextCursor]);
 
   useEffect(() => {
     const currentLoaderRef = loaderRef.current;